@@ -0,0 +1,155 @@
+"""
+Index of abbreviation triggers, used to find the items whose abbreviation ends at the current cursor position.
+
+The abbreviations are stored reversed in a trie, so walking the typed input backwards from the cursor yields all
+candidate items in O(abbreviation length), regardless of the number of configured items.
+The trie only pre-selects candidates. The final decision (trigger characters, word boundaries, triggerInside,
+window filters) is still made by the item itself, using check_input().
+"""
+
+import collections
+import typing
+
+if typing.TYPE_CHECKING:
+    from autokey.model import Item
+
+
+class _Node:
+
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}  # type: typing.Dict[str, _Node]
+        # (insertion index, item) pairs for all abbreviations ending at this node
+        self.entries = []  # type: typing.List[typing.Tuple[int, Item]]
+
+
+class AbbreviationTrie:
+    """
+    Reversed-abbreviation trie over a list of items (phrases, scripts or folders).
+    Items using the ignoreCase option are stored case folded in a separate trie and matched against the case folded
+    input.
+    Lookups return the candidate items in the order they were added, so the result order is identical to the order
+    of the list the trie was built from.
+    """
+
+    def __init__(self, items: typing.Iterable["Item"]=()):
+        self._case_sensitive_root = _Node()
+        self._case_insensitive_root = _Node()
+        self._next_index = 0
+        # id(item) -> (insertion index, nodes holding an entry of the item), used to remove items again
+        self._items = {}  # type: typing.Dict[int, typing.Tuple[int, typing.List[_Node]]]
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item: "Item"):
+        return id(item) in self._items
+
+    def add(self, item: "Item", index: int=None):
+        """
+        Add the item. index defaults to a position after all present items, it determines the order of the results
+        returned by candidates().
+        """
+        if index is None:
+            index = self._next_index
+            self._next_index += 1
+        nodes = []
+
+        for abbreviation in set(item.abbreviations):
+            if not abbreviation:
+                continue
+            node = self._case_insensitive_root if item.ignoreCase else self._case_sensitive_root
+            for char in reversed(abbreviation):
+                if item.ignoreCase:
+                    # Fold per character, so that the key sequence matches the one computed in _collect()
+                    char = char.casefold()
+                node = node.children.setdefault(char, _Node())
+            node.entries.append((index, item))
+            nodes.append(node)
+        self._items[id(item)] = (index, nodes)
+
+    def remove(self, item: "Item") -> typing.Optional[int]:
+        """Remove the item, if present, and return the index it was added with."""
+        index, nodes = self._items.pop(id(item), (None, ()))
+        for node in nodes:
+            node.entries = [entry for entry in node.entries if entry[1] is not item]
+        return index
+
+    def update(self, item: "Item"):
+        """Re-add an item after its abbreviations changed, keeping its position in the results."""
+        self.add(item, self.remove(item))
+
+    def candidates(self, buffer: typing.Sequence[str]) -> typing.List["Item"]:
+        """
+        Return all items having an abbreviation that ends either at the end of the buffer (immediate expansion) or
+        one character before the end (expansion on a trigger character).
+        The buffer is either a string or a sequence of single characters, like the InputBuffer content.
+        """
+        found = {}  # type: typing.Dict[int, Item]
+        if buffer:
+            self._collect(self._case_sensitive_root, buffer, found, False)
+            if self._case_insensitive_root.children:
+                self._collect(self._case_insensitive_root, buffer, found, True)
+        return [found[index] for index in sorted(found)]
+
+    @staticmethod
+    def _collect(root: _Node, buffer: typing.Sequence[str], found: typing.Dict[int, "Item"], fold_case: bool):
+        for end in (len(buffer), len(buffer) - 1):
+            node = root
+            for position in range(end - 1, -1, -1):
+                char = buffer[position]
+                node = node.children.get(char.casefold() if fold_case else char)
+                if node is None:
+                    break
+                for index, item in node.entries:
+                    found[index] = item
+
+
+class InputBuffer:
+    """
+    The text typed by the user since the last reset, as seen by the abbreviation matcher.
+
+    The buffer is updated one key at a time: append() for a typed character, backspace() to drop the last one and
+    clear() to forget everything. Matching walks the characters directly, so the complete input string is only
+    assembled (and then cached until the next change) when an item actually needs it.
+    """
+
+    def __init__(self, max_length: int):
+        self._chars = collections.deque(maxlen=max_length)  # type: typing.Deque[str]
+        self._text = ""  # type: typing.Optional[str]
+
+    def __len__(self):
+        return len(self._chars)
+
+    def __getitem__(self, index: int) -> str:
+        return self._chars[index]
+
+    def __repr__(self):
+        return "InputBuffer({!r})".format(self.text)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._chars)
+        return self._text
+
+    def append(self, char: str):
+        self._chars.append(char)
+        self._text = None
+
+    def backspace(self):
+        """Drop the last typed character. Does nothing, if the buffer is empty."""
+        if self._chars:
+            self._chars.pop()
+            self._text = None
+
+    def clear(self):
+        self._chars.clear()
+        self._text = ""
+
+    def candidates(self, trie: AbbreviationTrie) -> typing.List["Item"]:
+        """Return the items in the given trie whose abbreviation ends at the current cursor position."""
+        return trie.candidates(self._chars)
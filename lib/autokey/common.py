@@ -77,6 +77,10 @@ class AppService(dbus.service.Object):
     def run_script(self, name):
         self.app.service.run_script(name)
 
+    @dbus.service.method(dbus_interface='org.autokey.Service', in_signature='s', out_signature='i')
+    def cancel_script(self, name):
+        return self.app.service.cancel_script(name)
+
     @dbus.service.method(dbus_interface='org.autokey.Service', in_signature='s', out_signature='')
     def run_phrase(self, name):
         self.app.service.run_phrase(name)
@@ -16,6 +16,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import typing
+import collections
+import itertools
 import os
 import os.path
 import shutil
@@ -26,6 +28,10 @@ import re
 from pathlib import Path
 
 from autokey import common
+from autokey.abbreviation_trie import AbbreviationTrie
+from autokey.item_index import ItemIndex
+from autokey.path_index import PathIndex
+from autokey.persistence import OWN_WRITES
 from autokey.iomediator.constants import X_RECORD_INTERFACE
 
 import json
@@ -39,6 +45,11 @@ CONFIG_FILE_BACKUP = CONFIG_FILE + '~'
 DEFAULT_ABBR_FOLDER = "Imported Abbreviations"
 RECENT_ENTRIES_FOLDER = "Recently Typed"
 
+# Kinds of changes applied to the in-memory structures, see ConfigManager.apply_path_events()
+ITEM_ADDED = "added"
+ITEM_REMOVED = "removed"
+ITEM_MODIFIED = "modified"
+
 IS_FIRST_RUN = "isFirstRun"
 SERVICE_RUNNING = "serviceRunning"
 MENU_TAKES_FOCUS = "menuTakesFocus"
@@ -58,6 +69,23 @@ COLUMN_WIDTHS = "columnWidths"
 SHOW_TOOLBAR = "showToolbar"
 NOTIFICATION_ICON = "notificationIcon"
 WORKAROUND_APP_REGEX = "workAroundApps"
+# Additional output pacing profiles, see autokey.pacing.profile_from_dict()
+PACING_PROFILES = "pacingProfiles"
+# Persist compiled user scripts, see model.ScriptCodeCache
+CACHE_SCRIPT_BYTECODE = "cacheScriptBytecode"
+# Number of threads executing phrases and scripts, and the number of executions allowed to wait for a thread
+EXECUTION_POOL_SIZE = "executionPoolSize"
+EXECUTION_QUEUE_DEPTH = "executionQueueDepth"
+# Number of worker processes running the user scripts, 0 runs scripts in the daemon. The workers are no sandbox and
+# not all scripts work in them, see autokey.script_process for the limits.
+SCRIPT_WORKER_PROCESSES = "scriptWorkerProcesses"
+# Read phrase texts and script sources on first use and keep at most itemBodyBudget bytes of them, see model.LazyBody
+LAZY_ITEM_BODIES = "lazyItemBodies"
+ITEM_BODY_BUDGET = "itemBodyBudget"
+# Persist the metadata of all folders and items between runs, see autokey.item_index
+USE_ITEM_INDEX = "useItemIndex"
+# Sync written configuration files to disk, see autokey.persistence
+FSYNC_WRITES = "fsyncWrites"
 # Added by Trey Blancher (ectospasm) 2015-09-16
 TRIGGER_BY_INITIAL = "triggerItemByInitial"
 
@@ -97,7 +125,8 @@ def get_config_manager(autoKeyApp, hadError=False):
 
 def save_config(config_manager):
     _logger.info("Persisting configuration")
-    config_manager.app.monitor.suspend()
+    # The backup copies the file on disk, so it must contain the last written settings.
+    OWN_WRITES.flush()
     # Back up configuration if it exists
     # TODO: maybe use with-statement instead of try-except?
     if os.path.exists(CONFIG_FILE):
@@ -111,8 +140,6 @@ def save_config(config_manager):
             shutil.copy2(CONFIG_FILE_BACKUP, CONFIG_FILE)
         _logger.exception("Error while saving configuration. Backup has been restored (if found).")
         raise Exception("Error while saving configuration. Backup has been restored (if found).")
-    finally:
-        config_manager.app.monitor.unsuspend()
 
 
 def _persist_settings(config_manager):
@@ -138,8 +165,7 @@ def _try_persist_settings(serializable_data: dict):
     :raises TypeError: If the user tries to store non-serializable types
     :raises ValueError: If the user tries to store circular referenced (recursive) structures.
     """
-    with open(CONFIG_FILE, "w") as json_file:
-            json.dump(serializable_data, json_file, indent=4)
+    OWN_WRITES.write_text(CONFIG_FILE, json.dumps(serializable_data, indent=4))
 
 
 def _remove_non_serializable_store_entries(store: dict):
@@ -275,12 +301,56 @@ def _modify_exec_line(line: str, show_configure: bool) -> str:
             return line
 
 
+def build_hotkey_table(items) -> typing.Dict[typing.Tuple[typing.Tuple[str, ...], str], list]:
+    """
+    Group the given hotkey items by their (modifiers, key) combination, keeping the original item order within
+    each group. Items without a hotkey are skipped, as they can never be triggered.
+    """
+    table = {}
+    for item in items:
+        if item.hotKey is not None:
+            table.setdefault((tuple(item.modifiers), item.hotKey), []).append(item)
+    return table
+
+
+def ordered_position(entries: list, entry, order: typing.Dict[int, int]) -> int:
+    """
+    Return the position of the entry in the list, or the position it has to be inserted at. The list must be sorted
+    by the sequence numbers in order, which maps the id() of each folder or item to its number.
+    """
+    number = order[id(entry)]
+    low, high = 0, len(entries)
+    while low < high:
+        middle = (low + high) // 2
+        if order[id(entries[middle])] < number:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def placed(entries: list, entry, order: typing.Dict[int, int], included: bool) -> list:
+    """
+    Return the list with the entry included or left out, keeping it sorted by order. If nothing changes, the list
+    itself is returned, otherwise a new list.
+    """
+    position = ordered_position(entries, entry, order)
+    present = position < len(entries) and entries[position] is entry
+    if included == present:
+        return entries
+    elif included:
+        return entries[:position] + [entry] + entries[position:]
+    else:
+        return entries[:position] + entries[position + 1:]
+
+
 def apply_settings(settings):
     """
     Allows new settings to be added without users having to lose all their configuration
     """
     for key, value in settings.items():
         ConfigManager.SETTINGS[key] = value
+    OWN_WRITES.fsync = ConfigManager.SETTINGS[FSYNC_WRITES]
 
 
 def convert_v07_to_v08(configData):
@@ -294,6 +364,9 @@ def convert_v07_to_v08(configData):
     configData["version"] = common.VERSION
     configData["settings"][NOTIFICATION_ICON] = common.ICON_FILE_NOTIFICATION
 
+    # The converted folders are loaded from disk afterwards.
+    OWN_WRITES.flush()
+
     # Remove old backup file so we never retry the conversion
     if os.path.exists(CONFIG_FILE_BACKUP):
         os.remove(CONFIG_FILE_BACKUP)
@@ -374,6 +447,15 @@ class ConfigManager:
                 SHOW_TOOLBAR: True,
                 NOTIFICATION_ICON: common.ICON_FILE_NOTIFICATION,
                 WORKAROUND_APP_REGEX: ".*VirtualBox.*|krdc.Krdc",
+                PACING_PROFILES: [],
+                CACHE_SCRIPT_BYTECODE: False,
+                EXECUTION_POOL_SIZE: 4,
+                EXECUTION_QUEUE_DEPTH: 32,
+                SCRIPT_WORKER_PROCESSES: 0,
+                LAZY_ITEM_BODIES: False,
+                ITEM_BODY_BUDGET: 16 * 1024 * 1024,
+                USE_ITEM_INDEX: False,
+                FSYNC_WRITES: True,
                 TRIGGER_BY_INITIAL: False,
                 # TODO - Future functionality
                 #TRACK_RECENT_ENTRY: True,
@@ -392,6 +474,10 @@ class ConfigManager:
         
         self.app = app
         self.folders = []
+        # Path lookups for routing file system events, maintained together with allFolders and allItems
+        self.folderPaths = PathIndex(lambda folder: folder.path)
+        self.itemPaths = PathIndex(lambda item: item.path)
+        self.itemJsonPaths = PathIndex(lambda item: item.get_json_path() if item.path is not None else None)
         self.userCodeDir = None  # type: str
         
         self.configHotkey = GlobalHotkey()
@@ -530,7 +616,7 @@ dialog.info_dialog("Window information",
         if os.path.exists(CONFIG_FILE):
             _logger.info("Loading config from existing file: " + CONFIG_FILE)
             
-            with open(CONFIG_FILE, 'r') as pFile:
+            with open(CONFIG_FILE, 'r', encoding="UTF-8") as pFile:
                 data = json.load(pFile)
                 version = data["version"]
                 
@@ -552,7 +638,10 @@ dialog.info_dialog("Window information",
             apply_settings(data["settings"])
             
             self.workAroundApps = re.compile(self.SETTINGS[WORKAROUND_APP_REGEX])
-            
+
+            if self.SETTINGS[USE_ITEM_INDEX]:
+                model.Folder.INDEX.load()
+
             for entryPath in glob.glob(CONFIG_DEFAULT_FOLDER + "/*"):
                 if os.path.isdir(entryPath):
                     _logger.debug("Loading folder at '%s'", entryPath)
@@ -576,22 +665,43 @@ dialog.info_dialog("Window information",
             
     def __checkExisting(self, path):
         # Check if we already know about the path, and return object if found
-        for item in self.allItems:
-            if item.path == path:
-                return item
-        
-        return None
+        return self.itemPaths.get(path)
     
     def __checkExistingFolder(self, path):
-        for folder in self.allFolders:
-            if folder.path == path:
-                return folder
-        
-        return None
+        return self.folderPaths.get(path)
             
+    def apply_path_events(self, events: typing.Iterable[typing.Tuple[str, bool]]) -> bool:
+        """
+        Apply a batch of file system events, given as (path, removed) pairs in the order they should be processed.
+        The in-memory structures are updated once for the whole batch. Returns True, if the configuration changed.
+        The item index records of the affected directories are refreshed, so they stay valid for the next start.
+        """
+        events = list(events)
+        # Taken before the changes are loaded, so that changes made meanwhile make the records invalid
+        mtimes = {directory: ItemIndex.directory_mtime(directory) for directory in {
+            os.path.dirname(path) for path, removed in events}}
+        changes = []
+        for path, removed in events:
+            if removed:
+                self.__pathRemoved(path, changes)
+            else:
+                self.__pathCreatedOrModified(path, changes)
+        self.__applyChanges(changes)
+        for directory, mtime in mtimes.items():
+            if self.folderPaths.get(directory) is not None:
+                model.Folder.INDEX.loaded(directory, mtime)
+        return bool(changes)
+
     def path_created_or_modified(self, path):
+        return self.apply_path_events([(path, False)])
+
+    def path_removed(self, path):
+        return self.apply_path_events([(path, True)])
+
+    def __pathCreatedOrModified(self, path, changes):
         directory, baseName = os.path.split(path)
         loaded = False
+        model.Folder.INDEX.invalidate(directory)
         
         if path == CONFIG_FILE:
             self.reload_global_config()
@@ -606,12 +716,14 @@ dialog.info_dialog("Window information",
                 if directory == CONFIG_DEFAULT_FOLDER:
                     self.folders.append(f)
                     f.load()
+                    self.__recordChange(ITEM_ADDED, f, changes)
                     loaded = True
                 else:
                     folder = self.__checkExistingFolder(directory)
                     if folder is not None:
                         f.load(folder)
                         folder.add_folder(f)
+                        self.__recordChange(ITEM_ADDED, f, changes)
                         loaded = True
             
             # -- handle txt or py files added or modified
@@ -632,6 +744,7 @@ dialog.info_dialog("Window information",
                     if folder is not None:
                         i.load(folder)
                         if isNew: folder.add_item(i)
+                        self.__recordChange(ITEM_ADDED if isNew else ITEM_MODIFIED, i, changes)
                         loaded = True
                         
                 # --- handle changes to folder settings
@@ -640,28 +753,28 @@ dialog.info_dialog("Window information",
                     folder = self.__checkExistingFolder(directory)
                     if folder is not None:
                         folder.load_from_serialized()
+                        self.__recordChange(ITEM_MODIFIED, folder, changes)
                         loaded = True
                         
                 # --- handle changes to item settings
                 
                 if baseName.endswith(".json"):
-                    for item in self.allItems:
-                        if item.get_json_path() == path:
-                            item.load_from_serialized()
-                            loaded = True
+                    item = self.itemJsonPaths.get(path)
+                    if item is not None:
+                        item.load_from_serialized()
+                        self.__recordChange(ITEM_MODIFIED, item, changes)
+                        loaded = True
                             
             if not loaded:
                 _logger.warning("No action taken for create/update event at %s", path)
-            else:
-                self.config_altered(False)
-            return loaded
         
-    def path_removed(self, path):
+    def __pathRemoved(self, path, changes):
         directory, baseName = os.path.split(path)
         deleted = False
         
         if directory == common.CONFIG_DIR: # ignore all deletions in top dir
             return 
+        model.Folder.INDEX.invalidate(directory)
         
         folder = self.__checkExistingFolder(path)
         item = self.__checkExisting(path)
@@ -671,22 +784,21 @@ dialog.info_dialog("Window information",
                 self.folders.remove(folder)
             else:
                 folder.parent.remove_folder(folder)
+            self.__recordChange(ITEM_REMOVED, folder, changes)
             deleted = True
                 
         elif item is not None:
             item.parent.remove_item(item)
             #item.remove_data()
+            self.__recordChange(ITEM_REMOVED, item, changes)
             deleted = True
             
         if not deleted:
             _logger.warning("No action taken for delete event at %s", path)
-        else:
-            self.config_altered(False)
-        return deleted
             
     def reload_global_config(self):
         _logger.info("Reloading global configuration")
-        with open(CONFIG_FILE, 'r') as pFile:
+        with open(CONFIG_FILE, 'r', encoding="UTF-8") as pFile:
             data = json.load(pFile)
     
         self.userCodeDir = data["userCodeDir"]
@@ -734,7 +846,8 @@ dialog.info_dialog("Window information",
     def config_altered(self, persistGlobal):
         """
         Called when some element of configuration has been altered, to update
-        the lists of phrases/folders. 
+        the lists of phrases/folders. Rebuilds everything from the folder tree, changes of
+        single items are handled in place by item_added(), item_removed() and item_modified().
         
         @param persistGlobal: save the global configuration at the end of the process
         """
@@ -768,6 +881,37 @@ dialog.info_dialog("Window information",
         self.globalHotkeys = []
         self.globalHotkeys.append(self.configHotkey)
         self.globalHotkeys.append(self.toggleServiceHotkey)
+
+        self.folderPaths.rebuild(self.allFolders)
+        self.itemPaths.rebuild(self.allItems)
+        self.itemJsonPaths.rebuild(self.allItems)
+
+        # Filters might have changed, so resolve them again and forget all decisions made using the old filters
+        for item in self.allFolders + self.allItems + self.globalHotkeys:
+            item.precompute_filter()
+        model.AbstractWindowFilter.FILTER_CACHE.clear()
+
+        # Hotkey dispatch tables, used by the service to find the items sharing the pressed key combination
+        self.globalHotkeyTable = build_hotkey_table(self.globalHotkeys)
+        self.hotKeyTable = build_hotkey_table(self.hotKeys)
+        self.hotKeyFolderTable = build_hotkey_table(self.hotKeyFolders)
+
+        # Reversed abbreviation indexes, used by the service to find abbreviation candidates for the current input
+        self.abbreviationTrie = AbbreviationTrie(self.abbreviations)
+        self.folderAbbreviationTrie = AbbreviationTrie(
+            folder for folder in self.allFolders if model.TriggerMode.ABBREVIATION in folder.modes
+        )
+
+        # Sequence numbers in tree order, by id() of the folder or item. All lists and hotkey groups are sorted by
+        # them, so that modified entries are put back at their position without rebuilding the lists.
+        self.__order = {id(entry): number for number, entry in enumerate(self.allFolders + self.allItems)}
+        self.__numbers = itertools.count(len(self.__order))
+        # id() of the folder or item -> its group in hotKeyFolderTable or hotKeyTable
+        self.__combinations = {
+            id(entry): combination
+            for table in (self.hotKeyFolderTable, self.hotKeyTable) for combination, group in table.items()
+            for entry in group
+        }
         #_logger.debug("Global hotkeys: %s", self.globalHotkeys)
         
         #_logger.debug("Hotkey folders: %s", self.hotKeyFolders)
@@ -802,6 +946,215 @@ dialog.info_dialog("Window information",
                 self.abbreviations.append(item)
             self.allItems.append(item)
             
+    def item_added(self, item, persistGlobal=False):
+        """
+        Called when a folder, phrase or script was added to the configuration. Updates the in-memory structures in
+        place, instead of rebuilding them like config_altered(). A folder is added including its content.
+        """
+        _logger.debug("Configuration changed - adding %s", item)
+        self.__applyChanges(self.__recordChange(ITEM_ADDED, item, []), persistGlobal)
+
+    def item_removed(self, item, persistGlobal=False):
+        """Called when a folder, phrase or script was removed from the configuration."""
+        _logger.debug("Configuration changed - removing %s", item)
+        self.__applyChanges(self.__recordChange(ITEM_REMOVED, item, []), persistGlobal)
+
+    def item_modified(self, item, persistGlobal=False):
+        """
+        Called when the settings of a folder, phrase or script changed. The content of a folder is updated as well,
+        because it inherits the window filter of the folder.
+        """
+        _logger.debug("Configuration changed - updating %s", item)
+        self.__applyChanges(self.__recordChange(ITEM_MODIFIED, item, []), persistGlobal)
+
+    def items_changed(self, added=(), removed=(), modified=(), persistGlobal=False):
+        """
+        Called when several folders, phrases or scripts were changed at once, like by pasting or deleting a selection
+        in the GUI. Moved folders and items are reported as modified. The changes are applied in a single update.
+        """
+        _logger.debug("Configuration changed - adding %s, removing %s, updating %s", added, removed, modified)
+        changes = []
+        for kind, entries in ((ITEM_REMOVED, removed), (ITEM_ADDED, added), (ITEM_MODIFIED, modified)):
+            for entry in entries:
+                self.__recordChange(kind, entry, changes)
+        self.__applyChanges(changes, persistGlobal)
+
+    def __recordChange(self, kind, entry, changes):
+        """
+        Add a change to the list of changes to apply. The path lookups are updated immediately, so that later file
+        system events of the same batch find the changed objects.
+        """
+        folders, items = self.__collectSubtree([entry])
+        if kind != ITEM_ADDED:
+            for folder in folders:
+                self.folderPaths.remove(folder)
+            for item in items:
+                self.itemPaths.remove(item)
+                self.itemJsonPaths.remove(item)
+        if kind != ITEM_REMOVED:
+            for folder in folders:
+                self.folderPaths.add(folder)
+            for item in items:
+                self.itemPaths.add(item)
+                self.itemJsonPaths.add(item)
+        changes.append((kind, entry))
+        return changes
+
+    def __applyChanges(self, changes, persistGlobal=False):
+        if not changes:
+            return
+        removedFolders, removedItems = self.__collectSubtree(entry for kind, entry in changes if kind == ITEM_REMOVED)
+        # Objects removed later in the same batch must not be indexed again.
+        skipped = {id(entry) for entry in removedFolders + removedItems}
+        addedFolders, addedItems = self.__collectSubtree(
+            entry for kind, entry in changes if kind == ITEM_ADDED and id(entry) not in skipped
+        )
+        # Content of added folders is indexed completely, even if it was modified in the same batch.
+        skipped.update(id(entry) for entry in addedFolders + addedItems)
+        modifiedFolders, modifiedItems = self.__collectSubtree(
+            entry for kind, entry in changes if kind == ITEM_MODIFIED and id(entry) not in skipped
+        )
+        modifiedFolders = [folder for folder in modifiedFolders if id(folder) not in skipped]
+        modifiedItems = [item for item in modifiedItems if id(item) not in skipped]
+
+        with self.lock:
+            # Modified objects that were never indexed, like new items saved from the GUI, are added.
+            addedFolders += [folder for folder in modifiedFolders if id(folder) not in self.__order]
+            addedItems += [item for item in modifiedItems if id(item) not in self.__order]
+            modifiedFolders = [folder for folder in modifiedFolders if id(folder) in self.__order]
+            modifiedItems = [item for item in modifiedItems if id(item) in self.__order]
+
+            self.__unindex(removedFolders, removedItems)
+            self.__reindex(modifiedFolders, modifiedItems)
+            self.__index(addedFolders, addedItems)
+            model.AbstractWindowFilter.FILTER_CACHE.clear()
+
+            if persistGlobal:
+                save_config(self)
+
+    @staticmethod
+    def __collectSubtree(entries):
+        """Return the folders and items given or contained in the given folders, each only once."""
+        folders = collections.OrderedDict()
+        items = collections.OrderedDict()
+        pending = list(entries)
+        for entry in pending:
+            if isinstance(entry, model.Folder):
+                if id(entry) not in folders:
+                    folders[id(entry)] = entry
+                    pending.extend(entry.folders)
+                    pending.extend(entry.items)
+            else:
+                items[id(entry)] = entry
+        return list(folders.values()), list(items.values())
+
+    def __unindex(self, folders, items):
+        if not folders and not items:
+            return
+        removed = {id(entry) for entry in folders + items}
+
+        def without(entries):
+            return [entry for entry in entries if id(entry) not in removed]
+
+        # Replace the lists instead of changing them, as they are iterated without holding the lock.
+        self.allFolders = without(self.allFolders)
+        self.allItems = without(self.allItems)
+        for folder in folders:
+            self.folderAbbreviationTrie.remove(folder)
+        for item in items:
+            self.abbreviationTrie.remove(item)
+        self.hotKeyFolders = without(self.hotKeyFolders)
+        self.hotKeys = without(self.hotKeys)
+        self.abbreviations = without(self.abbreviations)
+        for folder in folders:
+            self.__regroup(self.hotKeyFolderTable, folder, False)
+        for item in items:
+            self.__regroup(self.hotKeyTable, item, False)
+        for entry in folders + items:
+            self.__order.pop(id(entry), None)
+
+    def __index(self, folders, items):
+        if not folders and not items:
+            return
+        # Added entries come last in the tree order.
+        for entry in folders + items:
+            self.__order[id(entry)] = next(self.__numbers)
+        # Replace the lists instead of changing them, as they are iterated without holding the lock.
+        self.allFolders = self.allFolders + folders
+        self.allItems = self.allItems + items
+        self.hotKeyFolders = self.hotKeyFolders + [
+            folder for folder in folders if model.TriggerMode.HOTKEY in folder.modes
+        ]
+        self.hotKeys = self.hotKeys + [item for item in items if model.TriggerMode.HOTKEY in item.modes]
+        self.abbreviations = self.abbreviations + [
+            item for item in items if model.TriggerMode.ABBREVIATION in item.modes
+        ]
+
+        for folder in folders:
+            if not self.app.monitor.has_watch(folder.path):
+                self.app.monitor.add_watch(folder.path)
+            self.__regroup(self.hotKeyFolderTable, folder, True)
+            self.__updateTrie(self.folderAbbreviationTrie, folder)
+            folder.precompute_filter()
+
+        for item in items:
+            self.__regroup(self.hotKeyTable, item, True)
+            self.__updateTrie(self.abbreviationTrie, item)
+            item.precompute_filter()
+
+    def __reindex(self, folders, items):
+        """
+        Update modified folders and items. They keep their positions in the lists and in the groups of the hotkey
+        tables, so that saving an item doesn't change which of several items with the same hotkey is found first.
+        Lists are only replaced, if an entry joins or leaves them.
+        """
+        for folder in folders:
+            if not self.app.monitor.has_watch(folder.path):
+                self.app.monitor.add_watch(folder.path)
+            self.hotKeyFolders = placed(
+                self.hotKeyFolders, folder, self.__order, model.TriggerMode.HOTKEY in folder.modes
+            )
+            self.__regroup(self.hotKeyFolderTable, folder, True)
+            self.__updateTrie(self.folderAbbreviationTrie, folder)
+            folder.precompute_filter()
+
+        for item in items:
+            self.hotKeys = placed(self.hotKeys, item, self.__order, model.TriggerMode.HOTKEY in item.modes)
+            self.abbreviations = placed(
+                self.abbreviations, item, self.__order, model.TriggerMode.ABBREVIATION in item.modes
+            )
+            self.__regroup(self.hotKeyTable, item, True)
+            self.__updateTrie(self.abbreviationTrie, item)
+            item.precompute_filter()
+
+    def __regroup(self, table, entry, indexed):
+        """
+        Move the entry into the group of its current hotkey, or take it out of the table, if it is no longer indexed
+        or has no hotkey. Changed groups are replaced, as they are iterated without holding the lock.
+        """
+        old = self.__combinations.pop(id(entry), None)
+        new = None
+        if indexed and model.TriggerMode.HOTKEY in entry.modes and entry.hotKey is not None:
+            new = (tuple(entry.modifiers), entry.hotKey)
+        if old is not None and old != new:
+            group = placed(table[old], entry, self.__order, False)
+            if group:
+                table[old] = group
+            else:
+                del table[old]
+        if new is not None:
+            table[new] = placed(table.get(new, []), entry, self.__order, True)
+            self.__combinations[id(entry)] = new
+
+    @staticmethod
+    def __updateTrie(trie: AbbreviationTrie, item):
+        if model.TriggerMode.ABBREVIATION not in item.modes:
+            trie.remove(item)
+        elif item in trie:
+            trie.update(item)
+        else:
+            trie.add(item)
+
     # TODO Future functionality
     def add_recent_entry(self, entry):
         if RECENT_ENTRIES_FOLDER not in self.folders:
@@ -0,0 +1,206 @@
+"""
+Bounded thread pool used to run phrase expansions and user scripts.
+
+Each submitted task carries a key. Tasks sharing a key run one after another in submission order, while tasks with
+different keys run in parallel, up to the configured number of worker threads. Tasks submitted with serialize=False
+run in parallel to any other task, their key only identifies them for cancel().
+"""
+
+import collections
+import ctypes
+import functools
+import logging
+import threading
+import time
+import typing
+
+from .latency import LatencyStatistics
+
+logger = logging.getLogger("service").getChild("pool")
+
+
+class ExecutionCancelled(Exception):
+    """Raised inside a running task, when it is cancelled."""
+
+
+class Task:
+
+    def __init__(self, key, function: typing.Callable, args: tuple, serialize: bool=True):
+        self.key = key
+        self.serialize = serialize
+        self.function = function
+        self.args = args
+        self.submitted = time.monotonic()
+        self.cancelled = False
+        self.thread = None  # type: typing.Optional[threading.Thread]
+
+    def __repr__(self):
+        return "Task({!r}, key={!r})".format(getattr(self.function, "__name__", self.function), self.key)
+
+
+class ExecutionPool:
+    """
+    Runs tasks in at most max_workers threads. Worker threads are started on demand and kept for later tasks.
+    At most max_queue_depth tasks may wait for execution, further tasks are rejected.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue_depth: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue_depth = max_queue_depth
+        self._condition = threading.Condition()
+        self._pending = collections.deque()  # type: typing.Deque[Task]
+        self._running = []  # type: typing.List[Task]
+        self._workers = []  # type: typing.List[threading.Thread]
+        self._idle_workers = 0
+        self._shutdown = False
+        self.rejected = 0
+        self.queue_wait = LatencyStatistics(name + " queue wait")
+        self.execution_time = LatencyStatistics(name + " execution time")
+
+    def submit(self, key, function: typing.Callable, *args, serialize: bool=True) -> typing.Optional[Task]:
+        """
+        Enqueue a call of function(*args). Returns the task, or None, if it was rejected because the queue is full
+        or the pool is shut down. A key of None or serialize=False does not serialize the task with any other task.
+        """
+        with self._condition:
+            if self._shutdown:
+                return None
+            if len(self._pending) >= self.max_queue_depth:
+                self.rejected += 1
+                logger.warning("%s: Queue full, rejecting %r", self.name, function)
+                return None
+            task = Task(key, function, args, serialize)
+            self._pending.append(task)
+            # Idle workers only leave the idle count once they woke up, so several tasks submitted in a row might
+            # all count on the same idle worker.
+            if len(self._pending) > self._idle_workers and len(self._workers) < self.max_workers:
+                self._start_worker()
+            self._condition.notify()
+            return task
+
+    def cancel(self, key) -> int:
+        """
+        Cancel all waiting and running tasks with the given key. Running tasks get an ExecutionCancelled exception
+        raised in their thread. It is delivered with the next executed Python instruction, so a task blocked inside
+        a long-running system call only notices the cancellation after the call returns.
+        Returns the number of cancelled tasks.
+        """
+        with self._condition:
+            tasks = [task for task in list(self._pending) + self._running if task.key == key and not task.cancelled]
+            for task in tasks:
+                task.cancelled = True
+                if task.thread is not None:
+                    self._raise_in_thread(task.thread, ExecutionCancelled)
+            self._pending = collections.deque(task for task in self._pending if not task.cancelled)
+            self._condition.notify_all()
+        return len(tasks)
+
+    def shutdown(self):
+        """
+        Stop accepting tasks. Waiting tasks are discarded, running tasks are finished. The worker threads are no
+        daemon threads, so the interpreter waits for them at exit, and a phrase being typed is not cut off.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def __str__(self):
+        return "{}: {} workers, {} waiting, {} rejected; {}; {}".format(
+            self.name, len(self._workers), len(self._pending), self.rejected, self.queue_wait, self.execution_time
+        )
+
+    def _start_worker(self):
+        worker = threading.Thread(
+            target=self._work, name="{}-worker-{}".format(self.name, len(self._workers)), daemon=False
+        )
+        self._workers.append(worker)
+        worker.start()
+
+    def _take_task(self) -> typing.Optional[Task]:
+        """Remove and return the first waiting task, whose key is not used by a running task."""
+        busy_keys = {task.key for task in self._running if task.key is not None and task.serialize}
+        for task in self._pending:
+            if task.key is None or not task.serialize or task.key not in busy_keys:
+                self._pending.remove(task)
+                return task
+        return None
+
+    def _work(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            try:
+                self._run(task)
+            except ExecutionCancelled:
+                # The cancellation raced with the end of the task and arrived in the pool code.
+                pass
+            while True:
+                try:
+                    self._finish(task)
+                    break
+                except ExecutionCancelled:
+                    pass
+
+    def _next_task(self) -> typing.Optional[Task]:
+        """Wait for a task that can run now. Returns None, when the pool is shut down."""
+        with self._condition:
+            while not self._shutdown:
+                task = self._take_task()
+                if task is not None:
+                    task.thread = threading.current_thread()
+                    self._running.append(task)
+                    return task
+                self._idle_workers += 1
+                self._condition.wait()
+                self._idle_workers -= 1
+            return None
+
+    def _run(self, task: Task):
+        started = time.monotonic()
+        self.queue_wait.add(started - task.submitted)
+        try:
+            task.function(*task.args)
+        except ExecutionCancelled:
+            logger.info("%s: Cancelled %r", self.name, task)
+        except Exception:
+            logger.exception("%s: Error while executing %r", self.name, task)
+        finally:
+            self.execution_time.add(time.monotonic() - started)
+
+    def _finish(self, task: Task):
+        with self._condition:
+            if task in self._running:
+                self._running.remove(task)
+                if task.cancelled:
+                    # Drop a cancellation that was not delivered yet, so that it does not hit the next task.
+                    self._raise_in_thread(task.thread, None)
+                task.thread = None
+                # Tasks waiting for this key can run now.
+                self._condition.notify_all()
+
+    @staticmethod
+    def _raise_in_thread(thread: threading.Thread, exception: typing.Optional[type]):
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(thread.ident), ctypes.py_object(exception) if exception is not None else None
+        )
+
+
+def pooled(key: typing.Callable, serialize: bool=True):
+    """
+    Decorator for methods that are executed asynchronously in the ExecutionPool stored in the "pool" attribute of
+    the instance. Calls for which key(self, *args) returns the same value are executed one after another, unless
+    serialize is False.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            return self.pool.submit(key(self, *args), method, self, *args, serialize=serialize)
+        return wrapper
+    return decorator
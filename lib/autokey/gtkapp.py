@@ -26,7 +26,6 @@ import logging
 import logging.handlers
 import subprocess
 import optparse
-import time
 import threading
 
 import gettext
@@ -168,8 +167,16 @@ class Application:
         configManager.toggleServiceHotkey.set_closure(self.toggle_service)
         configManager.configHotkey.set_closure(self.show_configure_async)
 
-    def config_altered(self, persistGlobal):
-        self.configManager.config_altered(persistGlobal)
+    def config_altered(self, persistGlobal, modifiedItem=None):
+        if modifiedItem is None:
+            self.configManager.config_altered(persistGlobal)
+        else:
+            self.configManager.item_modified(modifiedItem, persistGlobal)
+        self.notifier.rebuild_menu()
+
+    def items_changed(self, persistGlobal, added=(), removed=(), modified=()):
+        """Update the configuration after folders, phrases or scripts were added, removed or moved in the GUI."""
+        self.configManager.items_changed(added, removed, modified, persistGlobal)
         self.notifier.rebuild_menu()
 
     def hotkey_created(self, item):
@@ -180,15 +187,8 @@ class Application:
         logging.debug("Removed hotkey: %r %s", item.modifiers, item.hotKey)
         self.service.mediator.interface.ungrab_hotkey(item)
 
-    def path_created_or_modified(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_created_or_modified(path)
-        if changed and self.configWindow is not None:
-            self.configWindow.config_modified()
-
-    def path_removed(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_removed(path)
+    def path_events(self, events):
+        changed = self.configManager.apply_path_events(events)
         if changed and self.configWindow is not None:
             self.configWindow.config_modified()
 
@@ -232,8 +232,8 @@ class Application:
 
     def __completeShutdown(self):
         logging.info("Shutting down")
-        self.service.shutdown()
         self.monitor.stop()
+        self.service.shutdown()
         Gdk.threads_enter()
         Gtk.main_quit()
         Gdk.threads_leave()
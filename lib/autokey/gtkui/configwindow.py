@@ -39,6 +39,7 @@ from .settingsdialog import SettingsDialog
 from .. import configmanager as cm
 from ..iomediator import Recorder
 from .. import model, common
+from ..persistence import OWN_WRITES
 
 CONFIG_WINDOW_TITLE = "AutoKey"
 
@@ -853,9 +854,9 @@ class ConfigWindow:
             self.record_stopped()
             self.__getCurrentPage().cancel_record()
 
-    def save_completed(self, persistGlobal):
+    def save_completed(self, persistGlobal, item=None):
         self.uiManager.get_action("/MenuBar/File/save").set_sensitive(False)
-        self.app.config_altered(persistGlobal)
+        self.app.config_altered(persistGlobal, item)
 
     def set_dirty(self, dirty):
         self.dirty = dirty
@@ -929,13 +930,12 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
 
     def on_save(self, widget, data=None):
         if self.__getCurrentPage().validate():
-            self.app.monitor.suspend()
             persistGlobal = self.__getCurrentPage().save()
-            self.save_completed(persistGlobal)
+            selection = self.__getTreeSelection()
+            self.save_completed(persistGlobal, selection[0] if len(selection) == 1 else None)
             self.set_dirty(False)
 
             self.refresh_tree()
-            self.app.monitor.unsuspend()
             return False
 
         return True
@@ -980,15 +980,15 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         response = dlg.run()
         if response == Gtk.ResponseType.OK:
             path = dlg.get_filename()
-            self.__createFolder(os.path.basename(path), None, path)
+            newFolder = self.__createFolder(os.path.basename(path), None, path)
             self.app.monitor.add_watch(path)
             dlg.destroy()
-            self.app.config_altered(True)
+            self.app.items_changed(True, added=[newFolder])
         elif response == Gtk.ResponseType.NONE:
             dlg.destroy()
             name = self.__getNewItemName("Folder")
-            self.__createFolder(name, None)
-            self.app.config_altered(True)
+            newFolder = self.__createFolder(name, None)
+            self.app.items_changed(True, added=[newFolder])
         else:
             dlg.destroy()
 
@@ -1005,22 +1005,21 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         if name is not None:
             theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
             parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
-            self.__createFolder(name, parentIter)
-            self.app.config_altered(False)
+            newFolder = self.__createFolder(name, parentIter)
+            self.app.items_changed(False, added=[newFolder])
 
     def __createFolder(self, title, parentIter, path=None):
-        self.app.monitor.suspend()
         theModel = self.treeView.get_model()
         newFolder = model.Folder(title, path=path)
 
         newIter = theModel.append_item(newFolder, parentIter)
         newFolder.persist()
-        self.app.monitor.unsuspend()
 
         self.treeView.expand_to_path(theModel.get_path(newIter))
         self.treeView.get_selection().unselect_all()
         self.treeView.get_selection().select_iter(newIter)
         self.on_tree_selection_changed(self.treeView)
+        return newFolder
 
     def __getNewItemName(self, itemType):
         dlg = RenameDialog(self.ui, "New %s" % itemType, True, _("Create New %s") % itemType)
@@ -1042,13 +1041,11 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
     def on_new_phrase(self, widget, data=None):
         name = self.__getNewItemName("Phrase")
         if name is not None:
-            self.app.monitor.suspend()
             theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
             parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
             newPhrase = model.Phrase(name, "Enter phrase contents")
             newIter = theModel.append_item(newPhrase, parentIter)
             newPhrase.persist()
-            self.app.monitor.unsuspend()
             self.treeView.expand_to_path(theModel.get_path(newIter))
             self.treeView.get_selection().unselect_all()
             self.treeView.get_selection().select_iter(newIter)
@@ -1058,13 +1055,11 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
     def on_new_script(self, widget, data=None):
         name = self.__getNewItemName("Script")
         if name is not None:
-            self.app.monitor.suspend()
             theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
             parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
             newScript = model.Script(name, "# Enter script code")
             newIter = theModel.append_item(newScript, parentIter)
             newScript.persist()
-            self.app.monitor.unsuspend()
             self.treeView.expand_to_path(theModel.get_path(newIter))
             self.treeView.get_selection().unselect_all()
             self.treeView.get_selection().select_iter(newIter)
@@ -1090,7 +1085,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             self.treeView.get_selection().select_iter(model.get_iter_first())
             self.on_tree_selection_changed(self.treeView)
 
-        self.app.config_altered(True)
+        self.app.items_changed(True, removed=self.cutCopiedItems)
 
     def on_copy_item(self, widget, data=None):
         sourceObjects = self.__getTreeSelection()
@@ -1106,18 +1101,17 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
     def on_paste_item(self, widget, data=None):
         theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
         parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
-        self.app.monitor.suspend()
 
         newIters = []
-        for item in self.cutCopiedItems:
-            newIter = theModel.append_item(item, parentIter)
-            if isinstance(item, model.Folder):
-                theModel.populate_store(newIter, item)
-            newIters.append(newIter)
-            item.path = None
-            item.persist()
-
-        self.app.monitor.unsuspend()
+        pastedItems = self.cutCopiedItems
+        with OWN_WRITES.transaction():
+            for item in pastedItems:
+                newIter = theModel.append_item(item, parentIter)
+                if isinstance(item, model.Folder):
+                    theModel.populate_store(newIter, item)
+                newIters.append(newIter)
+                item.path = None
+                item.persist()
 
         self.treeView.expand_to_path(theModel.get_path(newIters[-1]))
         self.treeView.get_selection().unselect_all()
@@ -1126,14 +1120,13 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         self.on_tree_selection_changed(self.treeView)
         for iterator in newIters:
             self.treeView.get_selection().select_iter(iterator)
-        self.app.config_altered(True)
+        self.app.items_changed(True, added=pastedItems)
 
     def on_clone_item(self, widget, data=None):
         source = self.__getTreeSelection()[0]
         theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
         sourceIter = theModel[selectedPaths[0]].iter
         parentIter = theModel.iter_parent(sourceIter)
-        self.app.monitor.suspend()
 
         if isinstance(source, model.Phrase):
             newObj = model.Phrase('', '')
@@ -1142,9 +1135,8 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         newObj.copy(source)
         newObj.persist()
 
-        self.app.monitor.unsuspend()
         newIter = theModel.append_item(newObj, parentIter)
-        self.app.config_altered(False)
+        self.app.items_changed(False, added=[newObj])
 
     def on_delete_item(self, widget, data=None):
         selection = self.treeView.get_selection()
@@ -1153,7 +1145,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         for path in selectedPaths:
             refs.append(Gtk.TreeRowReference.new(theModel, path))
 
-        modified = False
+        removedItems = []
 
         if len(refs) == 1:
             item = theModel[refs[0].get_path()].iter
@@ -1168,24 +1160,23 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         dlg = Gtk.MessageDialog(self.ui, Gtk.DialogFlags.MODAL, Gtk.MessageType.QUESTION, Gtk.ButtonsType.YES_NO, msg)
         dlg.set_title(_("Delete"))
         if dlg.run() == Gtk.ResponseType.YES:
-            self.app.monitor.suspend()
-            for ref in refs:
-                if ref.valid():
-                    item = theModel[ref.get_path()].iter
-                    modelItem = theModel.get_value(item, AkTreeModel.OBJECT_COLUMN)
-                    self.__removeItem(theModel, item)
-                    modified = True
-            self.app.monitor.unsuspend()
+            with OWN_WRITES.transaction():
+                for ref in refs:
+                    if ref.valid():
+                        item = theModel[ref.get_path()].iter
+                        modelItem = theModel.get_value(item, AkTreeModel.OBJECT_COLUMN)
+                        self.__removeItem(theModel, item)
+                        removedItems.append(modelItem)
 
         dlg.destroy()
 
-        if modified:
+        if removedItems:
             if len(selectedPaths) > 1:
                 self.treeView.get_selection().unselect_all()
                 self.treeView.get_selection().select_iter(theModel.get_iter_first())
                 self.on_tree_selection_changed(self.treeView)
 
-            self.app.config_altered(True)
+            self.app.items_changed(True, removed=removedItems)
 
     def __removeItem(self, model, item):
         #selection = self.treeView.get_selection()
@@ -1310,17 +1301,15 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             newText = dlg.get_name()
             if dialogs.validate(not dialogs.EMPTY_FIELD_REGEX.match(newText), _("The name can't be empty"),
                              None, self.ui):
-                self.__getCurrentPage().set_item_title(newText)
-
-                self.app.monitor.suspend()
+                with OWN_WRITES.transaction():
+                    self.__getCurrentPage().set_item_title(newText)
 
-                if dlg.get_update_fs():
-                    self.__getCurrentPage().rebuild_item_path()
+                    if dlg.get_update_fs():
+                        self.__getCurrentPage().rebuild_item_path()
 
-                persistGlobal = self.__getCurrentPage().save()
+                    persistGlobal = self.__getCurrentPage().save()
                 self.refresh_tree()
-                self.app.monitor.unsuspend()
-                self.app.config_altered(persistGlobal)
+                self.app.config_altered(persistGlobal, selectedObject)
 
         dlg.destroy()
 
@@ -1401,29 +1390,28 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             targetIter = None
 
         #targetModelItem = theModel.get_value(targetIter, AkTreeModel.OBJECT_COLUMN)
-        self.app.monitor.suspend()
 
-        for path in self.__sourceRows:
-            self.__removeItem(theModel, theModel[path].iter)
+        with OWN_WRITES.transaction():
+            for path in self.__sourceRows:
+                self.__removeItem(theModel, theModel[path].iter)
 
-        newIters = []
-        for item in self.__sourceObjects:
-            newIter = theModel.append_item(item, targetIter)
-            if isinstance(item, model.Folder):
-                theModel.populate_store(newIter, item)
-                self.__dropRecurseUpdate(item)
-            else:
-                item.path = None
-                item.persist()
-            newIters.append(newIter)
+            newIters = []
+            for item in self.__sourceObjects:
+                newIter = theModel.append_item(item, targetIter)
+                if isinstance(item, model.Folder):
+                    theModel.populate_store(newIter, item)
+                    self.__dropRecurseUpdate(item)
+                else:
+                    item.path = None
+                    item.persist()
+                newIters.append(newIter)
 
-        self.app.monitor.unsuspend()
         self.treeView.expand_to_path(theModel.get_path(newIters[-1]))
         selection.unselect_all()
         for iterator in newIters:
             selection.select_iter(iterator)
         self.on_tree_selection_changed(self.treeView)
-        self.app.config_altered(True)
+        self.app.items_changed(True, modified=self.__sourceObjects)
 
     def __dropRecurseUpdate(self, folder):
         folder.path = None
@@ -0,0 +1,91 @@
+"""
+Compiled form of the strings sent by phrases and scripts.
+
+A string like "Hello<enter><ctrl>+s" is parsed once into a tuple of instructions: TEXT runs of characters, single
+KEY presses, CHORDs of a key and held modifiers and PRESS/RELEASE of a single key. The interface executes such a
+tuple as one batch. Parsing results are cached by the string, so a phrase expanded again is not parsed again.
+"""
+
+import functools
+import re
+import typing
+
+# Instruction kinds
+TEXT = "text"
+KEY = "key"
+CHORD = "chord"
+PRESS = "press"
+RELEASE = "release"
+
+# (kind, text or key name, modifiers held for a CHORD)
+Instruction = typing.Tuple[str, str, typing.Tuple[str, ...]]
+Instructions = typing.Tuple[Instruction, ...]
+
+# Key names, optionally followed by "+" to apply them as modifier, and the control characters sent as keys.
+# Newlines and tabs are matched as tokens of their own, so that the string is scanned once.
+TOKEN_RE = re.compile(r"(<[^<>\n\t]+>\+?|\n|\t)")
+CONTROL_KEYS = {"\n": "<enter>", "\t": "<tab>"}
+
+
+class InstructionCompiler:
+
+    CACHE_SIZE = 256
+
+    def __init__(self, is_key: typing.Callable[[str], bool], modifiers: typing.Iterable[str],
+                 cache_size: int=CACHE_SIZE):
+        self._is_key = is_key
+        self._modifiers = frozenset(modifiers)
+        # token -> is_key(token). Key names repeat a lot, so they are looked up once.
+        self._keys = {}  # type: typing.Dict[str, bool]
+        self.compile = functools.lru_cache(maxsize=cache_size)(self._compile)
+
+    def cache_info(self):
+        return self.compile.cache_info()
+
+    def is_key(self, token: str) -> bool:
+        try:
+            return self._keys[token]
+        except KeyError:
+            result = self._keys[token] = self._is_key(token)
+            return result
+
+    def _compile(self, string: str) -> Instructions:
+        """
+        Parse the string. Modifiers given as "<ctrl>+" apply to the following key or the first character of the
+        following text. Modifiers at the end of the string are dropped.
+        """
+        instructions = []  # type: typing.List[Instruction]
+        modifiers = []  # type: typing.List[str]
+        # re.split() alternates between plain text (even indices) and tokens (odd indices).
+        for index, section in enumerate(TOKEN_RE.split(string)):
+            if not section:
+                continue
+            if index % 2:
+                section = CONTROL_KEYS.get(section, section)
+                if section[-1] == "+" and section[:-1] in self._modifiers:
+                    modifiers.append(section[:-1])
+                    continue
+                is_key = self.is_key(section)
+            else:
+                is_key = False
+
+            if modifiers:
+                if is_key:
+                    instructions.append((CHORD, section, tuple(modifiers)))
+                else:
+                    instructions.append((CHORD, section[0], tuple(modifiers)))
+                    if len(section) > 1:
+                        self._append_text(instructions, section[1:])
+                modifiers = []
+            elif is_key:
+                instructions.append((KEY, section, ()))
+            else:
+                self._append_text(instructions, section)
+        return tuple(instructions)
+
+    @staticmethod
+    def _append_text(instructions: typing.List[Instruction], text: str):
+        if instructions and instructions[-1][0] == TEXT:
+            instructions[-1] = (TEXT, instructions[-1][1] + text, ())
+        else:
+            instructions.append((TEXT, text, ()))
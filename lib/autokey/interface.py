@@ -22,9 +22,11 @@ import typing
 import threading
 import select
 import logging
-import queue
+import os
 import subprocess
 import time
+import itertools
+import operator
 
 if typing.TYPE_CHECKING:
     from autokey.iomediator import IoMediator
@@ -42,6 +44,11 @@ from Xlib.error import ConnectionClosedError
 
 
 from . import common
+from .keymap_table import KeymapTable
+from .latency import LatencyStatistics
+from .pacing import PacingEngine, PacingProfile, PacingQueue, DEFAULT_PROFILE, INPUT_LANE, OUTPUT_LANE
+from .instructions import Instructions, TEXT, KEY, CHORD, PRESS
+from .selection_owner import SelectionOwner, PasteTransaction, CLIPBOARD, PRIMARY
 
 if common.USING_QT:
     from PyQt5.QtGui import QClipboard
@@ -62,7 +69,7 @@ else:
     except SyntaxError:  # pyatspi 2.26 fails when used with Python 3.7
         HAS_ATSPI = False
 
-from Xlib import X, XK, display, error
+from Xlib import X, XK, Xatom, display, error
 try:
     from Xlib.ext import record, xtest
     HAS_RECORD = True
@@ -106,6 +113,166 @@ def str_or_bytes_to_bytes(x: typing.Union[str, bytes, memoryview]) -> bytes:
 WindowInfo = typing.NamedTuple("WindowInfo", [("wm_title", str), ("wm_class", str)])
 
 
+class WindowInfoCache:
+    """
+    Holds the WindowInfo of the currently focused window, so that it does not have to be queried from the X server
+    on every keystroke.
+
+    The cached entry is dropped when the X server reports that the focus left the window, that the active window
+    changed, or that a title or class property of the window (or one of the ancestors it got its information from)
+    changed. Each invalidation bumps a generation counter, so that a lookup that raced with an invalidation does not
+    store outdated information.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._window_info = None  # type: typing.Optional[WindowInfo]
+        self._watched_window_ids = frozenset()  # type: typing.FrozenSet[int]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self) -> typing.Tuple[typing.Optional[WindowInfo], int]:
+        """
+        Return the cached WindowInfo (or None, if unknown) and the generation it belongs to. The generation has to
+        be passed to store() after fetching the information from the X server.
+        """
+        with self._lock:
+            if self._window_info is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return self._window_info, self._generation
+
+    def store(self, window_info: WindowInfo, watched_windows: typing.Iterable, generation: int):
+        with self._lock:
+            if generation == self._generation:
+                self._window_info = window_info
+                self._watched_window_ids = frozenset(watched.id for watched in watched_windows)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._window_info = None
+            self._watched_window_ids = frozenset()
+
+    def is_watched(self, window) -> bool:
+        return getattr(window, "id", None) in self._watched_window_ids
+
+    def __str__(self):
+        return "WindowInfoCache(hits={}, misses={})".format(self.hits, self.misses)
+
+
+# Events AutoKey selects on windows other than the root window. Each selection replaces the previous one, so the mask
+# of a window depends on all its users: Windows holding hotkey grabs select StructureNotify, so that their DestroyNotify
+# removes them from the grab registry. Only the focused window and the ancestors its information was read from also
+# select focus and property changes, which keep the window info cache up to date. Selecting property changes on all
+# grabbed windows would wake the listener thread for every title or _NET_WM_USER_TIME update in any of them.
+GRABBED_WINDOW_EVENT_MASK = X.StructureNotifyMask
+WATCHED_WINDOW_EVENT_MASK = X.StructureNotifyMask | X.PropertyChangeMask | X.FocusChangeMask
+
+HotkeyCombination = typing.Tuple[str, typing.Tuple[str, ...]]
+
+
+class SendTransaction:
+    """
+    Output sent by one thread between begin_send() and finish_send(). The focus window and pacing profile are
+    resolved by the event thread, when the transaction starts.
+    """
+
+    def __init__(self):
+        # Nesting level, only changed by the thread owning the transaction
+        self.depth = 0
+        self.focus = None
+        self.profile = None  # type: typing.Optional[PacingProfile]
+
+
+class _Grab:
+
+    __slots__ = ("keycode_masks", "owners")
+
+    def __init__(self, keycode_masks: typing.List[typing.Tuple[int, int]]):
+        # The (keycode, modifier mask) pairs passed to XGrabKey
+        self.keycode_masks = keycode_masks
+        # The items that requested the grab. Items are kept instead of their id(), which could be reused by a new
+        # item after the old one is garbage collected.
+        self.owners = set()  # type: typing.Set[model.AbstractHotkey]
+
+
+class HotkeyGrabRegistry:
+    """
+    Bookkeeping of the passive key grabs held by AutoKey, keyed by window ID.
+
+    With it, grabs can be released or renewed without walking the whole window tree, and without re-evaluating
+    window filters. Several items can share a grab. It is only released, when the last owning item releases it.
+    The registry is only used from the X event thread.
+    """
+
+    def __init__(self):
+        self._grabs = {}  # type: typing.Dict[int, typing.Dict[HotkeyCombination, _Grab]]
+
+    def __len__(self):
+        return sum(len(grabs) for grabs in self._grabs.values())
+
+    def is_grabbed(self, window_id: int, combination: HotkeyCombination) -> bool:
+        return combination in self._grabs.get(window_id, {})
+
+    def add(self, window_id: int, combination: HotkeyCombination, owner: model.AbstractHotkey,
+            keycode_masks: typing.List[typing.Tuple[int, int]]=None):
+        """
+        Record an owner of a grab. keycode_masks must be given, when the grab is new.
+        """
+        grabs = self._grabs.setdefault(window_id, {})
+        if combination not in grabs:
+            grabs[combination] = _Grab(keycode_masks)
+        grabs[combination].owners.add(owner)
+
+    def release(self, window_id: int, combination: HotkeyCombination, owner: typing.Optional[model.AbstractHotkey]) \
+            -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        """
+        Remove an owner from a grab. If no owner is left (or owner is None), forget the grab and return its
+        (keycode, mask) pairs, which the caller has to ungrab. Otherwise return None.
+        """
+        grabs = self._grabs.get(window_id, {})
+        grab = grabs.get(combination)
+        if grab is None:
+            return None
+        grab.owners.discard(owner)
+        if grab.owners and owner is not None:
+            return None
+        del grabs[combination]
+        if not grabs:
+            del self._grabs[window_id]
+        return grab.keycode_masks
+
+    def grabs_of(self, owner: model.AbstractHotkey) -> typing.List[typing.Tuple[int, HotkeyCombination]]:
+        """Return the (window ID, combination) pairs of all grabs held for the given owner."""
+        return [
+            (window_id, combination)
+            for window_id, grabs in self._grabs.items()
+            for combination, grab in grabs.items()
+            if owner in grab.owners
+        ]
+
+    def holds_grabs(self, window_id: int) -> bool:
+        return window_id in self._grabs
+
+    def forget_window(self, window_id: int):
+        """Forget all grabs in a destroyed window. The X server released them along with the window."""
+        self._grabs.pop(window_id, None)
+
+    def drain(self) -> typing.List[typing.Tuple[int, HotkeyCombination, typing.Set[model.AbstractHotkey],
+                                               typing.List[typing.Tuple[int, int]]]]:
+        """Forget all grabs and return them as (window ID, combination, owners, (keycode, mask) pairs) tuples."""
+        grabs = [
+            (window_id, combination, grab.owners, grab.keycode_masks)
+            for window_id, window_grabs in self._grabs.items()
+            for combination, grab in window_grabs.items()
+        ]
+        self._grabs = {}
+        return grabs
+
+
 class AbstractClipboard:
     """
     Abstract interface for clipboard interactions.
@@ -192,6 +359,9 @@ class XInterfaceBase(threading.Thread):
     Encapsulates the common functionality for the two X interface classes.
     """
 
+    # Seconds between checks, if the target application requested the pasted text
+    PASTE_POLL_INTERVAL = 0.005
+
     def __init__(self, mediator, app):
         threading.Thread.__init__(self)
         self.setDaemon(True)
@@ -199,16 +369,37 @@ class XInterfaceBase(threading.Thread):
         self.mediator = mediator  # type: IoMediator
         self.app = app
         self.lastChars = [] # QT4 Workaround
-        self.__enableQT4Workaround = False # QT4 Workaround
+        self.pacing = PacingEngine()
+        self.__pacingProfile = DEFAULT_PROFILE
+        # The send transaction opened by the calling thread, see begin_send(), and the one of the task executed by
+        # the event thread
+        self.__callerTransaction = threading.local()
+        self.__activeTransaction = None  # type: typing.Optional[SendTransaction]
         self.shutdown = False
         
         # Event loop
         self.eventThread = threading.Thread(target=self.__eventLoop)
-        self.queue = queue.Queue()
+        self.queue = PacingQueue()
         
-        # Event listener
+        # Event listener. Writing to the wake-up pipe interrupts its wait for X events.
         self.listenerThread = threading.Thread(target=self.__flushEvents)
+        self.__wakeUpRead, self.__wakeUpWrite = os.pipe()
+        self.windowGrabLatency = LatencyStatistics("Window creation to hotkey grab")
+        self.grabRegistry = HotkeyGrabRegistry()
+        # Grabs released for a keymap change, which are renewed after the new mapping is loaded
+        self.__grabsToRenew = None
         self.clipboard = Clipboard()
+        self.pasteLatency = LatencyStatistics("Paste command to clipboard request")
+        try:
+            self.selectionOwner = SelectionOwner()
+        except Exception:
+            logger.exception("Unable to own the clipboard, restoring it after fixed delays")
+            self.selectionOwner = None
+        self.windowInfoCache = WindowInfoCache()
+        # Windows currently selecting WATCHED_WINDOW_EVENT_MASK. The lock serialises all event selections on windows
+        # other than the root window together with the grab registry changes they depend on.
+        self.__watchedWindows = []
+        self.__eventMaskLock = threading.Lock()
 
         self.__initMappings()
 
@@ -220,6 +411,9 @@ class XInterfaceBase(threading.Thread):
         # Window name atoms
         self.__NameAtom = self.localDisplay.intern_atom("_NET_WM_NAME", True)
         self.__VisibleNameAtom = self.localDisplay.intern_atom("_NET_WM_VISIBLE_NAME", True)
+        self.__ActiveWindowAtom = self.localDisplay.intern_atom("_NET_ACTIVE_WINDOW", True)
+        # Changes to any of these invalidate the cached window information
+        self.__windowInfoAtoms = (self.__NameAtom, self.__VisibleNameAtom, Xatom.WM_NAME, Xatom.WM_CLASS)
         
         if not common.USING_QT:
             self.keyMap = Gdk.Keymap.get_default()
@@ -243,17 +437,46 @@ class XInterfaceBase(threading.Thread):
             except Exception as e:
                 logger.exception("Error in X event loop thread")
 
-            self.queue.task_done()
-
     def __enqueue(self, method: typing.Callable, *args):
-        self.queue.put_nowait((method, args))
+        self.queue.put(method, args)
+
+    def __enqueueOutput(self, method: typing.Callable, *args, delay: float=0.0):
+        """
+        Enqueue output to the X server. Delays only hold back further output, but not the processing of user input.
+        Output enqueued by a thread with an open send transaction is executed within that transaction.
+        """
+        if threading.current_thread() is self.eventThread:
+            transaction = self.__activeTransaction
+        else:
+            transaction = getattr(self.__callerTransaction, "transaction", None)
+        if transaction is not None:
+            method, args = self.__runInTransaction, (transaction, method) + args
+        self.queue.put(method, args, OUTPUT_LANE, delay)
+
+    def __runInTransaction(self, transaction: SendTransaction, method: typing.Callable, *args):
+        previous, self.__activeTransaction = self.__activeTransaction, transaction
+        if transaction.profile is not None:
+            self.__pacingProfile = transaction.profile
+        try:
+            method(*args)
+        finally:
+            self.__activeTransaction = previous
+
+    def __deferOutput(self, delay: float, method: typing.Callable, *args):
+        """
+        Flush everything sent so far and continue with the given method after the delay, before any other output.
+        """
+        self.localDisplay.flush()
+        if self.__activeTransaction is not None:
+            method, args = self.__runInTransaction, (self.__activeTransaction, method) + args
+        self.queue.put_front(method, args, OUTPUT_LANE, delay)
 
     def on_keys_changed(self, data=None):
         if not self.__ignoreRemap:
             logger.debug("Recorded keymap change event")
             self.__ignoreRemap = True
             time.sleep(0.2)
-            self.__enqueue(self.__ungrabAllHotkeys)
+            self.__enqueue(self.__ungrabAllHotkeys, True)
             self.__enqueue(self.__delayedInitMappings)
         else:
             logger.debug("Ignored keymap change event")
@@ -265,9 +488,20 @@ class XInterfaceBase(threading.Thread):
     def __initMappings(self):
         self.localDisplay = display.Display()
         self.rootWindow = self.localDisplay.screen().root
-        self.rootWindow.change_attributes(event_mask=X.SubstructureNotifyMask|X.StructureNotifyMask)
+        self.rootWindow.change_attributes(
+            event_mask=X.SubstructureNotifyMask|X.StructureNotifyMask|X.PropertyChangeMask
+        )
+        # Event selections made on the previous display connection are gone, so nothing notifies about changes
+        # to the cached window any more.
+        with self.__eventMaskLock:
+            self.__watchedWindows = []
+        self.windowInfoCache.invalidate()
+        # Let the listener thread wait on the new connection
+        self.__wakeUpListener()
         
-        altList = self.localDisplay.keysym_to_keycodes(XK.XK_ISO_Level3_Shift)
+        self.keymapTable = KeymapTable.from_display(self.localDisplay)
+
+        altList = self.keymapTable.keycodes(XK.XK_ISO_Level3_Shift)
         self.__usableOffsets = (0, 1)
         for code, offset in altList:
             if code == 108 and offset == 0:
@@ -281,7 +515,7 @@ class XInterfaceBase(threading.Thread):
 
         for keySym, ak in XK_TO_AK_MAP.items():
             if ak in MODIFIERS:
-                keyCodeList = self.localDisplay.keysym_to_keycodes(keySym)
+                keyCodeList = self.keymapTable.keycodes(keySym)
                 found = False
 
                 for keyCode, lvl in keyCodeList:
@@ -295,33 +529,26 @@ class XInterfaceBase(threading.Thread):
 
         logger.debug("Modifier masks: %r", self.modMasks)
 
-        self.__grabHotkeys()
+        if self.__grabsToRenew is None:
+            self.__grabHotkeys()
+        else:
+            self.__renewGrabs(self.__grabsToRenew)
+            self.__grabsToRenew = None
         self.localDisplay.flush()
 
         # --- get list of keycodes that are unused in the current keyboard mapping
 
-        keyCode = 8
-        avail = []
-        for keyCodeMapping in self.localDisplay.get_keyboard_mapping(keyCode, 200):
-            codeAvail = True
-            for offset in keyCodeMapping:
-                if offset != 0:
-                    codeAvail = False
-                    break
-
-            if codeAvail:
-                avail.append(keyCode)
-
-            keyCode += 1
-
-        self.__availableKeycodes = avail
+        self.__availableKeycodes = self.keymapTable.unused_keycodes(8, 200)
         self.remappedChars = {}
 
         if logging.getLogger().getEffectiveLevel() == logging.DEBUG:
             self.keymap_test()
 
+    def __reloadKeymapTable(self):
+        self.keymapTable = KeymapTable.from_display(self.localDisplay)
+
     def keymap_test(self):
-        code = self.localDisplay.keycode_to_keysym(108, 0)
+        code = self.keymapTable.keysym(108, 0)
         for attr in XK.__dict__.items():
             if attr[0].startswith("XK"):
                 if attr[1] == code:
@@ -329,7 +556,7 @@ class XInterfaceBase(threading.Thread):
 
         logger.debug("X Server Keymap, listing unmapped keys.")
         for char in "\\|`1234567890-=~!@#$%^&*()qwertyuiop[]asdfghjkl;'zxcvbnm,./QWERTYUIOP{}ASDFGHJKL:\"ZXCVBNM<>?":
-            keyCodeList = list(self.localDisplay.keysym_to_keycodes(ord(char)))
+            keyCodeList = self.keymapTable.keycodes(ord(char))
             if not keyCodeList:
                 logger.debug("No mapping for [%s]", char)
                 
@@ -360,14 +587,14 @@ class XInterfaceBase(threading.Thread):
         # Grab global hotkeys in root window
         for item in c.globalHotkeys:
             if item.enabled:
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow)
+                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow, item)
                 if self.__needsMutterWorkaround(item):
                     self.__enqueue(self.__grabRecurse, item, self.rootWindow, False)
 
         # Grab hotkeys without a filter in root window
         for item in hotkeys:
             if item.get_applicable_regex() is None:
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow)
+                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow, item)
                 if self.__needsMutterWorkaround(item):
                     self.__enqueue(self.__grabRecurse, item, self.rootWindow, False)
 
@@ -387,93 +614,103 @@ class XInterfaceBase(threading.Thread):
                 if window_info.wm_title or window_info.wm_class:
                     for item in hotkeys:
                         if item.get_applicable_regex() is not None and item._should_trigger_window_title(window_info):
-                            self.__grabHotkey(item.hotKey, item.modifiers, window)
+                            self.__grabHotkey(item.hotKey, item.modifiers, window, item)
                             self.__grabRecurse(item, window, False)
                         
                 self.__enqueue(self.__recurseTree, window, hotkeys)
             except:
                 logger.exception("grab on window failed")
                 
-    def __ungrabAllHotkeys(self):
+    def __ungrabAllHotkeys(self, renew: bool=False):
         """
-        Ungrab all hotkeys in preparation for keymap change
-        """
-        c = self.app.configManager
-        hotkeys = c.hotKeys + c.hotKeyFolders
-
-        # Ungrab global hotkeys in root window, recursively
-        for item in c.globalHotkeys:
-            if item.enabled:
-                self.__ungrabHotkey(item.hotKey, item.modifiers, self.rootWindow)
-                if self.__needsMutterWorkaround(item):
-                    self.__ungrabRecurse(item, self.rootWindow, False)
-        
-        # Ungrab hotkeys without a filter in root window, recursively
-        for item in hotkeys:
-            if item.get_applicable_regex() is None:
-                self.__ungrabHotkey(item.hotKey, item.modifiers, self.rootWindow)
-                if self.__needsMutterWorkaround(item):
-                    self.__ungrabRecurse(item, self.rootWindow, False)
-                
-        self.__recurseTreeUngrab(self.rootWindow, hotkeys)
-                
-    def __recurseTreeUngrab(self, parent, hotkeys):
-        # Ungrab matching hotkeys in all open child windows
-        try:
-            children = parent.query_tree().children
-        except:
-            return # window has been destroyed
-            
-        for window in children:
-            try:
-                window_info = self.get_window_info(window, False)
-                
-                if window_info.wm_title or window_info.wm_class:
-                    for item in hotkeys:
-                        if item.get_applicable_regex() is not None and item._should_trigger_window_title(window_info):
-                            self.__ungrabHotkey(item.hotKey, item.modifiers, window)
-                            self.__ungrabRecurse(item, window, False)
-                        
-                self.__enqueue(self.__recurseTreeUngrab, window, hotkeys)
-            except:
-                logger.exception("ungrab on window failed")
+        Ungrab all hotkeys in preparation for keymap change. If renew is True, the grabs are renewed with the new
+        keymap by the next __initMappings() call.
 
-    def __grabHotkeysForWindow(self, window):
+        Only the grabs recorded in the grab registry are released, using the keycodes they were grabbed with.
+        """
+        grabs = self.grabRegistry.drain()
+        logger.debug("Ungrabbing %d recorded hotkey grabs", len(grabs))
+        catcher = error.CatchError(error.BadWindow)
+        for window_id, combination, owners, keycodeMasks in grabs:
+            window = self.localDisplay.create_resource_object("window", window_id)
+            for keycode, mask in keycodeMasks:
+                window.ungrab_key(keycode, mask, onerror=catcher)
+        if renew:
+            self.__grabsToRenew = grabs
+
+    def __renewGrabs(self, grabs):
+        """Grab the hotkeys released by __ungrabAllHotkeys() again, using the current keymap."""
+        logger.debug("Renewing %d hotkey grabs", len(grabs))
+        for window_id, (key, modifiers), owners, keycodeMasks in grabs:
+            window = self.localDisplay.create_resource_object("window", window_id)
+            for owner in owners:
+                self.__grabHotkey(key, modifiers, window, owner)
+
+    def __forgetWindow(self, window):
+        """Called for destroyed windows."""
+        self.grabRegistry.forget_window(window.id)
+
+    def __grabHotkeysForWindow(self, window, created: float=None):
         """
         Grab all hotkeys relevant to the window
 
-        Used when a new window is created
+        Used when a new window is created. If given, created is the time.monotonic() value at which the creation
+        was noticed and is used to measure the grab latency.
         """
         c = self.app.configManager
         hotkeys = c.hotKeys + c.hotKeyFolders
         window_info = self.get_window_info(window)
         for item in hotkeys:
             if item.get_applicable_regex() is not None and item._should_trigger_window_title(window_info):
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, window)
+                self.__grabHotkey(item.hotKey, item.modifiers, window, item)
             elif self.__needsMutterWorkaround(item):
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, window)
+                self.__grabHotkey(item.hotKey, item.modifiers, window, item)
+        if created is not None:
+            self.localDisplay.flush()
+            latency = time.monotonic() - created
+            self.windowGrabLatency.add(latency)
+            logger.debug("Grabbed hotkeys in new window %r after %.1f ms", window, latency * 1000)
 
-    def __grabHotkey(self, key, modifiers, window):
+    def __keycodeMasks(self, key, modifiers) -> typing.List[typing.Tuple[int, int]]:
+        """
+        Return the (keycode, modifier mask) pairs that have to be grabbed for a hotkey, so that it also works with
+        NumLock and/or CapsLock enabled.
+        """
+        keycode = self.__lookupKeyCode(key)
+        mask = 0
+        for mod in modifiers:
+            mask |= self.modMasks[mod]
+
+        masks = [mask]
+        if Key.NUMLOCK in self.modMasks:
+            masks.append(mask|self.modMasks[Key.NUMLOCK])
+        if Key.CAPSLOCK in self.modMasks:
+            masks.append(mask|self.modMasks[Key.CAPSLOCK])
+        if Key.CAPSLOCK in self.modMasks and Key.NUMLOCK in self.modMasks:
+            masks.append(mask|self.modMasks[Key.CAPSLOCK]|self.modMasks[Key.NUMLOCK])
+        return [(keycode, mask) for mask in masks]
+
+    def __grabHotkey(self, key, modifiers, window, owner: model.AbstractHotkey=None):
         """
-        Grab a specific hotkey in the given window
+        Grab a specific hotkey in the given window, on behalf of the given owner item
         """
+        combination = (key, tuple(modifiers))
+        if self.grabRegistry.is_grabbed(window.id, combination):
+            self.grabRegistry.add(window.id, combination, owner)
+            return
+
         logger.debug("Grabbing hotkey: %r %r", modifiers, key)
         try:
-            keycode = self.__lookupKeyCode(key)
-            mask = 0
-            for mod in modifiers:
-                mask |= self.modMasks[mod]
-
-            window.grab_key(keycode, mask, True, X.GrabModeAsync, X.GrabModeAsync)
-
-            if Key.NUMLOCK in self.modMasks:
-                window.grab_key(keycode, mask|self.modMasks[Key.NUMLOCK], True, X.GrabModeAsync, X.GrabModeAsync)
-
-            if Key.CAPSLOCK in self.modMasks:
-                window.grab_key(keycode, mask|self.modMasks[Key.CAPSLOCK], True, X.GrabModeAsync, X.GrabModeAsync)
-
-            if Key.CAPSLOCK in self.modMasks and Key.NUMLOCK in self.modMasks:
-                window.grab_key(keycode, mask|self.modMasks[Key.CAPSLOCK]|self.modMasks[Key.NUMLOCK], True, X.GrabModeAsync, X.GrabModeAsync)
+            keycodeMasks = self.__keycodeMasks(key, modifiers)
+            # Windows might be gone already, for example when renewing grabs after a keymap change
+            catcher = error.CatchError(error.BadWindow)
+            for keycode, mask in keycodeMasks:
+                window.grab_key(keycode, mask, True, X.GrabModeAsync, X.GrabModeAsync, onerror=catcher)
+            with self.__eventMaskLock:
+                if window != self.rootWindow and not self.__isWatched(window):
+                    # Get notified, when the window is destroyed, to clean up the registry.
+                    window.change_attributes(event_mask=GRABBED_WINDOW_EVENT_MASK, onerror=catcher)
+                self.grabRegistry.add(window.id, combination, owner, keycodeMasks)
 
         except Exception as e:
             logger.warning("Failed to grab hotkey %r %r: %s", modifiers, key, str(e))
@@ -486,7 +723,7 @@ class XInterfaceBase(threading.Thread):
         If it has a filter regex, iterate over all children of the root and grab from matching windows
         """
         if item.get_applicable_regex() is None:
-            self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow)
+            self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow, item)
             if self.__needsMutterWorkaround(item):
                 self.__enqueue(self.__grabRecurse, item, self.rootWindow, False)
         else:
@@ -506,7 +743,7 @@ class XInterfaceBase(threading.Thread):
                 shouldTrigger = item._should_trigger_window_title(window_info)
 
             if shouldTrigger or not checkWinInfo:
-                self.__grabHotkey(item.hotKey, item.modifiers, window)
+                self.__grabHotkey(item.hotKey, item.modifiers, window, item)
                 self.__grabRecurse(item, window, False)
             else:
                 self.__grabRecurse(item, window)
@@ -515,59 +752,33 @@ class XInterfaceBase(threading.Thread):
         """
         Ungrab a hotkey.
 
-        If the hotkey has no filter regex, it is global and is grabbed recursively from the root window
-        If it has a filter regex, iterate over all children of the root and ungrab from matching windows
+        Releases the item's share of all grabs recorded for it in the grab registry. The registry knows the windows
+        the hotkey was grabbed in, so this neither walks the window tree nor evaluates the item's (possibly already
+        changed) window filter.
         """
-        import copy
-        newItem = copy.copy(item)
-        
-        if item.get_applicable_regex() is None:
-            self.__enqueue(self.__ungrabHotkey, newItem.hotKey, newItem.modifiers, self.rootWindow)
-            if self.__needsMutterWorkaround(item):
-                self.__enqueue(self.__ungrabRecurse, newItem, self.rootWindow, False)
-        else:
-            self.__enqueue(self.__ungrabRecurse, newItem, self.rootWindow)
-
-    def __ungrabRecurse(self, item, parent, checkWinInfo=True):
-        try:
-            children = parent.query_tree().children
-        except:
-            return # window has been destroyed
-                     
-        for window in children:
-            shouldTrigger = False
-            
-            if checkWinInfo:
-                window_info = self.get_window_info(window, False)
-                shouldTrigger = item._should_trigger_window_title(window_info)
+        self.__enqueue(self.__ungrabItem, item)
 
-            if shouldTrigger or not checkWinInfo:
-                self.__ungrabHotkey(item.hotKey, item.modifiers, window)
-                self.__ungrabRecurse(item, window, False)
-            else:
-                self.__ungrabRecurse(item, window)
+    def __ungrabItem(self, owner: model.AbstractHotkey):
+        for windowId, (key, modifiers) in self.grabRegistry.grabs_of(owner):
+            window = self.localDisplay.create_resource_object("window", windowId)
+            self.__ungrabHotkey(key, modifiers, window, owner)
 
-    def __ungrabHotkey(self, key, modifiers, window):
+    def __ungrabHotkey(self, key, modifiers, window, owner: model.AbstractHotkey=None):
         """
-        Ungrab a specific hotkey in the given window
+        Ungrab a specific hotkey in the given window. If an owner is given, the grab is only released if no other
+        item still uses it.
         """
+        with self.__eventMaskLock:
+            keycodeMasks = self.grabRegistry.release(window.id, (key, tuple(modifiers)), owner)
+            if keycodeMasks is None:
+                return
+            if window != self.rootWindow and not self.grabRegistry.holds_grabs(window.id) \
+                    and not self.__isWatched(window):
+                window.change_attributes(event_mask=X.NoEventMask, onerror=error.CatchError(error.BadWindow))
         logger.debug("Ungrabbing hotkey: %r %r", modifiers, key)
         try:
-            keycode = self.__lookupKeyCode(key)
-            mask = 0
-            for mod in modifiers:
-                mask |= self.modMasks[mod]
-
-            window.ungrab_key(keycode, mask)
-
-            if Key.NUMLOCK in self.modMasks:
-                window.ungrab_key(keycode, mask|self.modMasks[Key.NUMLOCK])
-
-            if Key.CAPSLOCK in self.modMasks:
-                window.ungrab_key(keycode, mask|self.modMasks[Key.CAPSLOCK])
-
-            if Key.CAPSLOCK in self.modMasks and Key.NUMLOCK in self.modMasks:
-                window.ungrab_key(keycode, mask|self.modMasks[Key.CAPSLOCK]|self.modMasks[Key.NUMLOCK])
+            for keycode, mask in keycodeMasks:
+                window.ungrab_key(keycode, mask, onerror=error.CatchError(error.BadWindow))
         except Exception as e:
             logger.warning("Failed to ungrab hotkey %r %r: %s", modifiers, key, str(e))
 
@@ -575,7 +786,7 @@ class XInterfaceBase(threading.Thread):
         if keyCode == 0:
             return "<unknown>"
 
-        keySym = self.localDisplay.keycode_to_keysym(keyCode, 0)
+        keySym = self.keymapTable.keysym(keyCode, 0)
 
         if keySym in XK_TO_AK_NUMLOCKED and numlock and not (numlock and shifted):
             return XK_TO_AK_NUMLOCKED[keySym]
@@ -587,7 +798,7 @@ class XInterfaceBase(threading.Thread):
             if shifted: index += 1
             if altGrid: index += 4
             try:
-                return chr(self.localDisplay.keycode_to_keysym(keyCode, index))
+                return chr(self.keymapTable.keysym(keyCode, index))
             except ValueError:
                 return "<code%d>" % keyCode
 
@@ -600,16 +811,17 @@ class XInterfaceBase(threading.Thread):
          causing a paste operation to happen.
         """
         logger.debug("Sending string via clipboard: " + string)
+        self.__enqueueOutput(self.__selectPacingProfile)
         if common.USING_QT:
             if paste_command is None:
-                self.__enqueue(self.app.exec_in_main, self._send_string_selection, string)
+                self.__enqueueOutput(self.app.exec_in_main, self._send_string_selection, string)
             else:
-                self.__enqueue(self.app.exec_in_main, self._send_string_clipboard, string, paste_command)
+                self.__enqueueOutput(self.app.exec_in_main, self._send_string_clipboard, string, paste_command)
         else:
             if paste_command is None:
-                self.__enqueue(self._send_string_selection, string)
+                self.__enqueueOutput(self._send_string_selection, string)
             else:
-                self.__enqueue(self._send_string_clipboard, string, paste_command)
+                self.__enqueueOutput(self._send_string_clipboard, string, paste_command)
         logger.debug("Sending via clipboard enqueued.")
 
     def _send_string_clipboard(self, string: str, paste_command: model.SendMode):
@@ -619,19 +831,25 @@ class XInterfaceBase(threading.Thread):
         backup = self.clipboard.text  # Keep a backup of current content, to restore the original afterwards.
         if backup is None:
             logger.warning("Tried to backup the X clipboard content, but got None instead of a string.")
-        self.clipboard.text = string
+        transaction = self.__ownSelection(CLIPBOARD, string, self.__pacingProfile.clipboard_restore_delay)
+        if transaction is None:
+            self.clipboard.text = string
         try:
             self.mediator.send_string(paste_command.value)
         finally:
             self.ungrab_keyboard()
         # Because send_string is queued, also enqueue the clipboard restore, to keep the proper action ordering.
-        self.__enqueue(self._restore_clipboard_text, backup)
+        if transaction is not None:
+            self.__enqueueOutput(self.__awaitPaste, transaction, self._restore_clipboard_text, backup)
+        else:
+            # Pasting takes some time, so wait a bit before restoring the content. Otherwise the restore is done
+            # before the pasting happens, causing the backup to be pasted instead of the desired clipboard content.
+            self.__enqueueOutput(
+                self._restore_clipboard_text, backup, delay=self.__pacingProfile.clipboard_restore_delay
+            )
 
     def _restore_clipboard_text(self, backup: str):
         """Restore the clipboard content."""
-        # Pasting takes some time, so wait a bit before restoring the content. Otherwise the restore is done before
-        # the pasting happens, causing the backup to be pasted instead of the desired clipboard content.
-        time.sleep(0.2)
         self.clipboard.text = backup if backup is not None else ""
 
     def _send_string_selection(self, string: str):
@@ -639,20 +857,57 @@ class XInterfaceBase(threading.Thread):
         backup = self.clipboard.selection  # Keep a backup of current content, to restore the original afterwards.
         if backup is None:
             logger.warning("Tried to backup the X PRIMARY selection content, but got None instead of a string.")
-        self.clipboard.selection = string
-        self.__enqueue(self._paste_using_mouse_button_2)
-        self.__enqueue(self._restore_clipboard_selection, backup)
+        transaction = self.__ownSelection(PRIMARY, string, self.__pacingProfile.selection_restore_delay)
+        if transaction is None:
+            self.clipboard.selection = string
+        self.__enqueueOutput(self._paste_using_mouse_button_2)
+        if transaction is not None:
+            self.__enqueueOutput(self.__awaitPaste, transaction, self._restore_clipboard_selection, backup)
+        else:
+            # Pasting takes some time, so wait a bit before restoring the content. Otherwise the restore is done
+            # before the pasting happens, causing the backup to be pasted instead of the desired clipboard content.
+            # Programmatically pressing the middle mouse button seems VERY slow, so the default profiles wait long.
+            self.__enqueueOutput(
+                self._restore_clipboard_selection, backup, delay=self.__pacingProfile.selection_restore_delay
+            )
 
     def _restore_clipboard_selection(self, backup: str):
         """Restore the selection clipboard content."""
-        # Pasting takes some time, so wait a bit before restoring the content. Otherwise the restore is done before
-        # the pasting happens, causing the backup to be pasted instead of the desired clipboard content.
-
-        # Programmatically pressing the middle mouse button seems VERY slow, so wait rather long.
-        # It might be a good idea to make this delay configurable. There might be systems that need even longer.
-        time.sleep(1)
         self.clipboard.selection = backup if backup is not None else ""
 
+    def __ownSelection(self, selection: str, string: str, restoreDelay: float):
+        """
+        Offer the string in the given selection, until the target application requested it. The restore delay of
+        the pacing profile extends the time the target gets for the request. Returns None, if the toolkit clipboard
+        has to be used instead.
+        """
+        if self.selectionOwner is None:
+            return None
+        try:
+            return self.selectionOwner.own(selection, string, max(restoreDelay, PasteTransaction.TIMEOUT))
+        except Exception:
+            logger.exception("Unable to own the %s selection", selection)
+            return None
+
+    def __awaitPaste(self, transaction: PasteTransaction, restore: typing.Callable, backup: str):
+        """
+        Hold back further output until the target application requested the pasted text, then restore the
+        previous content. Nothing is restored, if someone else took over the selection in the meantime.
+        """
+        if not transaction.done and not transaction.timed_out():
+            self.__deferOutput(self.PASTE_POLL_INTERVAL, self.__awaitPaste, transaction, restore, backup)
+            return
+
+        self.selectionOwner.release(transaction)
+        if transaction.lost:
+            logger.debug("%s: Selection taken over by another client, not restoring it", transaction)
+            return
+        if transaction.latency is not None:
+            self.pasteLatency.add(transaction.latency)
+        else:
+            logger.warning("%s: The target application did not request the text in time", transaction)
+        restore(backup)
+
     def _paste_using_mouse_button_2(self):
         """Paste using the mouse: Press the second mouse button, then release it again."""
         focus = self.localDisplay.get_input_focus().focus
@@ -661,146 +916,282 @@ class XInterfaceBase(threading.Thread):
         logger.debug("Mouse Button2 event sent.")
 
     def begin_send(self):
-        self.__enqueue(self.__grab_keyboard)
+        """
+        Open a send transaction for the calling thread. The focus window and pacing profile are resolved once, when
+        the transaction starts, and used by all output the thread enqueues up to the matching finish_send(). Output
+        of other threads is not affected. Output is flushed when the outermost transaction ends, unless a pacing
+        pause requires an earlier flush.
+        """
+        transaction = getattr(self.__callerTransaction, "transaction", None)
+        if transaction is None:
+            transaction = self.__callerTransaction.transaction = SendTransaction()
+        transaction.depth += 1
+        self.__enqueueOutput(self.__beginSend)
 
     def finish_send(self):
-        self.__enqueue(self.__ungrabKeyboard)
+        transaction = getattr(self.__callerTransaction, "transaction", None)
+        if transaction is None:
+            logger.warning("finish_send() called without an open send transaction")
+            return
+        self.__enqueueOutput(self.__ungrabKeyboard)
+        transaction.depth -= 1
+        if not transaction.depth:
+            self.__callerTransaction.transaction = None
+
+    def __beginSend(self):
+        transaction = self.__activeTransaction
+        if transaction.focus is None:
+            self.__selectPacingProfile()
+            transaction.profile = self.__pacingProfile
+            transaction.focus = self.localDisplay.get_input_focus().focus
+        self.__grab_keyboard()
+
+    def __focusWindow(self):
+        """Return the window output is sent to: The one of the current send transaction or the focused one."""
+        if self.__activeTransaction is not None and self.__activeTransaction.focus is not None:
+            return self.__activeTransaction.focus
+        return self.localDisplay.get_input_focus().focus
+
+    def __flushOutput(self):
+        """Flush buffered output, unless it belongs to a send transaction, which flushes when it ends."""
+        if self.__activeTransaction is None:
+            self.localDisplay.flush()
 
     def grab_keyboard(self):
-        self.__enqueue(self.__grab_keyboard)
+        self.__enqueueOutput(self.__grab_keyboard)
 
     def __grab_keyboard(self):
-        focus = self.localDisplay.get_input_focus().focus
+        focus = self.__focusWindow()
         focus.grab_keyboard(True, X.GrabModeAsync, X.GrabModeAsync, X.CurrentTime)
         self.localDisplay.flush()
 
     def ungrab_keyboard(self):
-        self.__enqueue(self.__ungrabKeyboard)
+        self.__enqueueOutput(self.__ungrabKeyboard)
         
     def __ungrabKeyboard(self):
         self.localDisplay.ungrab_keyboard(X.CurrentTime)
         self.localDisplay.flush()
 
-    def __findUsableKeycode(self, codeList):
-        for code, offset in codeList:
-            if offset in self.__usableOffsets:
-                return code, offset
+    def __usableKeyCode(self, char: str):
+        """
+        Return the (keyCode, offset) pair used to type the given character with the current keyboard mapping, or
+        (None, None), if the character is not directly reachable.
+        """
+        return self.keymapTable.usable_keycode(ord(char), self.__usableOffsets)
+
+    def __resolveKeyCodes(self, string: str) -> typing.List[typing.Tuple[str, int, int]]:
+        """
+        Return (char, keyCode, offset) triples for all characters in the string. Characters that are not reachable
+        with the current keyboard mapping are mapped to spare keycodes first.
+        """
+        unmapped = [char for char in string if self.__usableKeyCode(char)[0] is None]
+        if any(char not in self.remappedChars for char in unmapped):
+            self.__remapChars(unmapped)
+
+        keyCodes = []
+        for char in string:
+            keyCode, offset = self.__usableKeyCode(char)
+            if keyCode is None:
+                keyCode, offset = self.remappedChars.get(char, (None, None))
+            if keyCode is None:
+                logger.warning("Unable to send character %r", char)
+            else:
+                keyCodes.append((char, keyCode, offset))
+        return keyCodes
+
+    def __remapChars(self, remapChars: typing.List[str]):
+        """Map the given characters to unused keycodes, two characters (unshifted and shifted) per keycode."""
+        self.__ignoreRemap = True
+        self.remappedChars = {}
+        remapChars = list(dict.fromkeys(remapChars))
+
+        logger.debug("Characters requiring remapping: %r", remapChars)
+        availCodes = self.__availableKeycodes
+        logger.debug("Remapping with keycodes in the range: %r", availCodes)
+        mapping = self.localDisplay.get_keyboard_mapping(8, 200)
+        firstCode = 8
+
+        for i in range(len(availCodes) - 1):
+            code = availCodes[i]
+            sym1 = 0
+            sym2 = 0
+
+            if len(remapChars) > 0:
+                char = remapChars.pop(0)
+                self.remappedChars[char] = (code, 0)
+                sym1 = ord(char)
+            if len(remapChars) > 0:
+                char = remapChars.pop(0)
+                self.remappedChars[char] = (code, 1)
+                sym2 = ord(char)
+
+            if sym1 != 0:
+                mapping[code - firstCode][0] = sym1
+                mapping[code - firstCode][1] = sym2
+
+        mapping = [tuple(l) for l in mapping]
+        self.localDisplay.change_keyboard_mapping(firstCode, mapping)
+        self.localDisplay.flush()
+        # Previously remapped keycodes are reused, so the old table might point to them
+        self.__reloadKeymapTable()
+
+    def __sendKeyCodeRun(self, keyCodes: typing.List[int], modifierKeys: typing.Tuple[str, ...], focus):
+        """
+        Send the given keycodes to the focus window, while holding down the given modifier keys.
+        The events are only buffered, the caller has to flush the display.
+        """
+        modifierCodes = [self.__lookupKeyCode(key) for key in modifierKeys]
+        mask = 0
+        for key in modifierKeys:
+            mask |= self.modMasks[key]
 
-        return None, None
+        for modifierCode in modifierCodes:
+            self.__sendKeyPressEvent(modifierCode, 0, focus)
+        try:
+            for position, keyCode in enumerate(keyCodes):
+                delay = self.__pacingDelay(keyCode)
+                if delay:
+                    return position, delay
+                self.__sendKeyCode(keyCode, mask, focus)
+        finally:
+            for modifierCode in reversed(modifierCodes):
+                self.__sendKeyReleaseEvent(modifierCode, 0, focus)
+        return len(keyCodes), 0.0
 
     def send_string(self, string):
-        self.__enqueue(self.__sendString, string)
+        self.__enqueueOutput(self.__sendString, string)
         
     def __sendString(self, string):
         """
         Send a string of printable characters.
         """
         logger.debug("Sending string: %r", string)
-        # Determine if workaround is needed
-        if not cm.ConfigManager.SETTINGS[cm.ENABLE_QT4_WORKAROUND]:
-            self.__checkWorkaroundNeeded()
+        if self.__activeTransaction is None:
+            self.__selectPacingProfile()
+        keyCodes = self.__resolveKeyCodes(string)
+        focus = self.__focusWindow()
+        self.__sendKeyCodes(keyCodes, focus, time.monotonic(), len(keyCodes))
 
-        # First find out if any chars need remapping
-        remapNeeded = False
-        for char in string:
-            keyCodeList = self.localDisplay.keysym_to_keycodes(ord(char))
-            usableCode, offset = self.__findUsableKeycode(keyCodeList)
-            if usableCode is None and char not in self.remappedChars:
-                remapNeeded = True
-                break
+    def __sendKeyCodes(self, keyCodes: typing.List[typing.Tuple[str, int, int]], focus, started: float, total: int):
+        """
+        Send the resolved characters of a string. If the pacing profile requires a pause, the remaining characters
+        are sent by a deferred call.
+        """
+        position, delay = self.__sendKeyCodeRuns(keyCodes, focus)
+        if delay:
+            self.__deferOutput(delay, self.__sendKeyCodes, keyCodes[position:], focus, started, total)
+            return
 
-        # Now we know chars need remapping, do it
-        if remapNeeded:
-            self.__ignoreRemap = True
-            self.remappedChars = {}
-            remapChars = []
-
-            for char in string:
-                keyCodeList = self.localDisplay.keysym_to_keycodes(ord(char))
-                usableCode, offset = self.__findUsableKeycode(keyCodeList)
-                if usableCode is None:
-                    remapChars.append(char)
-
-            logger.debug("Characters requiring remapping: %r", remapChars)
-            availCodes = self.__availableKeycodes
-            logger.debug("Remapping with keycodes in the range: %r", availCodes)
-            mapping = self.localDisplay.get_keyboard_mapping(8, 200)
-            firstCode = 8
-
-            for i in range(len(availCodes) - 1):
-                code = availCodes[i]
-                sym1 = 0
-                sym2 = 0
-
-                if len(remapChars) > 0:
-                    char = remapChars.pop(0)
-                    self.remappedChars[char] = (code, 0)
-                    sym1 = ord(char)
-                if len(remapChars) > 0:
-                    char = remapChars.pop(0)
-                    self.remappedChars[char] = (code, 1)
-                    sym2 = ord(char)
-
-                if sym1 != 0:
-                    mapping[code - firstCode][0] = sym1
-                    mapping[code - firstCode][1] = sym2
-
-            mapping = [tuple(l) for l in mapping]
-            self.localDisplay.change_keyboard_mapping(firstCode, mapping)
-            self.localDisplay.flush()
+        # All events are buffered so far, send them in one go
+        self.__flushOutput()
+        self.pacing.record_sent(self.__pacingProfile, total, time.monotonic() - started)
+        self.__ignoreRemap = False
 
-        focus = self.localDisplay.get_input_focus().focus
+    def __sendKeyCodeRuns(self, keyCodes: typing.List[typing.Tuple[str, int, int]], focus) -> typing.Tuple[int, float]:
+        """
+        Buffer the events for the resolved characters. Return the number of characters sent and the pause required
+        before the remaining ones can be sent.
+        """
+        position = 0
+        # Hold the modifiers down for whole runs of characters on the same level, instead of pressing and releasing
+        # them around every single character.
+        for offset, run in itertools.groupby(keyCodes, key=operator.itemgetter(2)):
+            run = list(run)
+            try:
+                sent, delay = self.__sendKeyCodeRun([item[1] for item in run], LEVEL_MODIFIERS[offset], focus)
+            except Exception as e:
+                logger.exception("Error sending chars %r: %s", "".join(item[0] for item in run), str(e))
+                sent, delay = len(run), 0.0
+            position += sent
+            if delay:
+                return position, delay
+        return position, 0.0
+
+    def send_instructions(self, instructions: Instructions):
+        """
+        Send a string compiled by instructions.InstructionCompiler. The whole string is sent by one task of the
+        output lane, to the window focused when it starts, and flushed once at the end.
+        """
+        self.__enqueueOutput(self.__sendInstructions, instructions, 0, None, None)
 
-        for char in string:
+    def __sendInstructions(self, instructions: Instructions, position: int, focus, text):
+        """
+        Execute the instructions from the given position on. When the pacing profile requires a pause, the
+        remaining instructions are executed by a deferred call. text holds the characters of a TEXT instruction
+        not sent yet, with the time the instruction was started: (keyCodes, started, total).
+        """
+        if focus is None:
+            logger.debug("Sending %d instructions", len(instructions))
+            if self.__activeTransaction is None:
+                self.__selectPacingProfile()
+            focus = self.__focusWindow()
+
+        for index in range(position, len(instructions)):
+            kind, name, modifiers = instructions[index]
             try:
-                keyCodeList = self.localDisplay.keysym_to_keycodes(ord(char))
-                keyCode, offset = self.__findUsableKeycode(keyCodeList)
-                if keyCode is not None:
-                    if offset == 0:
-                        self.__sendKeyCode(keyCode, theWindow=focus)
-                    if offset == 1:
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
-                    if offset == 4:
-                        self.__pressKey(Key.ALT_GR)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.ALT_GR], focus)
-                        self.__releaseKey(Key.ALT_GR)
-                    if offset == 5:
-                        self.__pressKey(Key.ALT_GR)
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.ALT_GR]|self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
-                        self.__releaseKey(Key.ALT_GR)
-
-                elif char in self.remappedChars:
-                    keyCode, offset = self.remappedChars[char]
-                    if offset == 0:
-                        self.__sendKeyCode(keyCode, theWindow=focus)
-                    if offset == 1:
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
+                if kind == TEXT:
+                    if text is None:
+                        keyCodes = self.__resolveKeyCodes(name)
+                        text = (keyCodes, time.monotonic(), len(keyCodes))
+                    keyCodes, started, total = text
+                    sent, delay = self.__sendKeyCodeRuns(keyCodes, focus)
+                    if delay:
+                        text = (keyCodes[sent:], started, total)
+                        self.__deferOutput(delay, self.__sendInstructions, instructions, index, focus, text)
+                        return
+                    self.pacing.record_sent(self.__pacingProfile, total, time.monotonic() - started)
+                elif kind in (KEY, CHORD):
+                    sent, delay = self.__sendKeyCodeRun([self.__lookupKeyCode(name)], modifiers, focus)
+                    if delay:
+                        self.__deferOutput(delay, self.__sendInstructions, instructions, index, focus, None)
+                        return
+                elif kind == PRESS:
+                    self.__sendKeyPressEvent(self.__lookupKeyCode(name), 0, focus)
                 else:
-                    logger.warning("Unable to send character %r", char)
+                    self.__sendKeyReleaseEvent(self.__lookupKeyCode(name), 0, focus)
             except Exception as e:
-                logger.exception("Error sending char %r: %s", char, str(e))
+                logger.warning("Error sending %s %r %r: %s", kind, modifiers, name, str(e))
+            text = None
 
+        # All events are buffered so far, send them in one go
+        self.__flushOutput()
         self.__ignoreRemap = False
 
-
     def send_key(self, keyName):
         """
         Send a specific non-printing key, eg Up, Left, etc
         """
-        self.__enqueue(self.__sendKey, keyName)
+        self.__enqueueOutput(self.__sendKey, keyName)
         
     def __sendKey(self, keyName):
         logger.debug("Send special key: [%r]", keyName)
-        self.__sendKeyCode(self.__lookupKeyCode(keyName))
+        keyCode = self.__lookupKeyCode(keyName)
+        delay = self.__pacingDelay(keyCode)
+        if delay:
+            self.__deferOutput(delay, self.__sendKey, keyName)
+        else:
+            self.__sendKeyCode(keyCode)
+
+    def send_key_repeated(self, keyName, count: int):
+        """
+        Send a non-printing key the given number of times, as one task of the output lane.
+        """
+        if count > 0:
+            self.__enqueueOutput(self.__sendKeyRepeated, keyName, count, None)
+
+    def __sendKeyRepeated(self, keyName, count: int, focus):
+        logger.debug("Send special key %d times: [%r]", count, keyName)
+        keyCode = self.__lookupKeyCode(keyName)
+        if focus is None:
+            focus = self.__focusWindow()
+        sent, delay = self.__sendKeyCodeRun([keyCode] * count, (), focus)
+        if delay:
+            self.__deferOutput(delay, self.__sendKeyRepeated, keyName, count - sent, focus)
+        else:
+            self.__flushOutput()
 
     def fake_keypress(self, keyName):
-         self.__enqueue(self.__fakeKeypress, keyName)
+         self.__enqueueOutput(self.__fakeKeypress, keyName)
          
     def __fakeKeypress(self, keyName):        
         keyCode = self.__lookupKeyCode(keyName)
@@ -808,14 +1199,14 @@ class XInterfaceBase(threading.Thread):
         xtest.fake_input(self.rootWindow, X.KeyRelease, keyCode)
 
     def fake_keydown(self, keyName):
-        self.__enqueue(self.__fakeKeydown, keyName)
+        self.__enqueueOutput(self.__fakeKeydown, keyName)
         
     def __fakeKeydown(self, keyName):
         keyCode = self.__lookupKeyCode(keyName)
         xtest.fake_input(self.rootWindow, X.KeyPress, keyCode)
 
     def fake_keyup(self, keyName):
-        self.__enqueue(self.__fakeKeyup, keyName)
+        self.__enqueueOutput(self.__fakeKeyup, keyName)
         
     def __fakeKeyup(self, keyName):
         keyCode = self.__lookupKeyCode(keyName)
@@ -825,7 +1216,7 @@ class XInterfaceBase(threading.Thread):
         """
         Send a modified key (e.g. when emulating a hotkey)
         """
-        self.__enqueue(self.__sendModifiedKey, keyName, modifiers)
+        self.__enqueueOutput(self.__sendModifiedKey, keyName, modifiers)
 
     def __sendModifiedKey(self, keyName, modifiers):
         logger.debug("Send modified key: modifiers: %s key: %s", modifiers, keyName)
@@ -834,6 +1225,10 @@ class XInterfaceBase(threading.Thread):
             for mod in modifiers:
                 mask |= self.modMasks[mod]
             keyCode = self.__lookupKeyCode(keyName)
+            delay = self.__pacingDelay(keyCode)
+            if delay:
+                self.__deferOutput(delay, self.__sendModifiedKey, keyName, modifiers)
+                return
             for mod in modifiers: self.__pressKey(mod)
             self.__sendKeyCode(keyCode, mask)
             for mod in modifiers: self.__releaseKey(mod)
@@ -841,14 +1236,14 @@ class XInterfaceBase(threading.Thread):
             logger.warning("Error sending modified key %r %r: %s", modifiers, keyName, str(e))
 
     def send_mouse_click(self, xCoord, yCoord, button, relative):
-        self.__enqueue(self.__sendMouseClick, xCoord, yCoord, button, relative)
+        self.__enqueueOutput(self.__sendMouseClick, xCoord, yCoord, button, relative)
         
     def __sendMouseClick(self, xCoord, yCoord, button, relative):    
         # Get current pointer position so we can return it there
         pos = self.rootWindow.query_pointer()
 
         if relative:
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__focusWindow()
             focus.warp_pointer(xCoord, yCoord)
             xtest.fake_input(focus, X.ButtonPress, button, x=xCoord, y=yCoord)
             xtest.fake_input(focus, X.ButtonRelease, button, x=xCoord, y=yCoord)
@@ -862,7 +1257,7 @@ class XInterfaceBase(threading.Thread):
         self.__flush()
 
     def send_mouse_click_relative(self, xoff, yoff, button):
-        self.__enqueue(self.__sendMouseClickRelative, xoff, yoff, button)
+        self.__enqueueOutput(self.__sendMouseClickRelative, xoff, yoff, button)
         
     def __sendMouseClickRelative(self, xoff, yoff, button):
         # Get current pointer position
@@ -880,47 +1275,60 @@ class XInterfaceBase(threading.Thread):
         self.__flush()
 
     def flush(self):
-        self.__enqueue(self.__flush)
+        self.__enqueueOutput(self.__flush)
         
     def __flush(self):
         self.localDisplay.flush()
         self.lastChars = []
 
     def press_key(self, keyName):
-        self.__enqueue(self.__pressKey, keyName)
+        self.__enqueueOutput(self.__pressKey, keyName)
         
     def __pressKey(self, keyName):
         self.__sendKeyPressEvent(self.__lookupKeyCode(keyName), 0)
 
     def release_key(self, keyName):
-        self.__enqueue(self.__releaseKey, keyName)
+        self.__enqueueOutput(self.__releaseKey, keyName)
         
     def __releaseKey(self, keyName):
         self.__sendKeyReleaseEvent(self.__lookupKeyCode(keyName), 0)
 
     def __flushEvents(self):
         logger.debug("__flushEvents: Entering event loop.")
-        while True:
+        while not self.shutdown:
             try:
-                readable, w, e = select.select([self.localDisplay], [], [], 1)
-                time.sleep(1)
-                if self.localDisplay in readable:
-                    createdWindows = []
-                    destroyedWindows = []
-                    
-                    for x in range(self.localDisplay.pending_events()):
-                        event = self.localDisplay.next_event()
-                        if event.type == X.CreateNotify:
-                            createdWindows.append(event.window)
-                        if event.type == X.DestroyNotify:
-                            destroyedWindows.append(event.window)
-                            
-                    for window in createdWindows:
-                        if window not in destroyedWindows:
-                            self.__enqueue(self.__grabHotkeysForWindow, window)
-
-                if self.shutdown:
-                    break
+                localDisplay = self.localDisplay
+                if not localDisplay.pending_events():
+                    # Block until the X server sends something or the wake-up pipe is written to. Events read by other
+                    # threads while waiting for a reply are queued inside Xlib without making the socket readable,
+                    # so the timeout is only a safety net for those.
+                    readable, w, e = select.select([localDisplay, self.__wakeUpRead], [], [], 1)
+                    if self.__wakeUpRead in readable:
+                        os.read(self.__wakeUpRead, 512)
+                    continue
+
+                received = time.monotonic()
+                createdWindows = []
+                destroyedWindows = []
+
+                for x in range(localDisplay.pending_events()):
+                    event = localDisplay.next_event()
+                    if event.type == X.CreateNotify:
+                        createdWindows.append(event.window)
+                    if event.type == X.DestroyNotify:
+                        destroyedWindows.append(event.window)
+                    if event.type in (X.PropertyNotify, X.FocusOut):
+                        self.__updateWindowInfoCache(event)
+                    if event.type == X.MappingNotify and event.request == X.MappingKeyboard:
+                        self.__enqueue(self.__reloadKeymapTable)
+
+                for window in createdWindows:
+                    if window not in destroyedWindows:
+                        self.__enqueue(self.__grabHotkeysForWindow, window, received)
+                for window in destroyedWindows:
+                    self.__enqueue(self.__forgetWindow, window)
+                    if self.windowInfoCache.is_watched(window):
+                        self.windowInfoCache.invalidate()
             except ConnectionClosedError:
                 # Autokey does not properly exit on logout. It causes an infinite exception loop, accumulating stack
                 # traces along. This acts like a memory leak, filling the system RAM until it hits an OOM condition.
@@ -929,24 +1337,63 @@ class XInterfaceBase(threading.Thread):
                 # the connection.
                 # See https://github.com/autokey/autokey/issues/198 for details
                 logger.exception("__flushEvents: Connection to the X server closed. Forcefully exiting Autokey now.")
-                import os
                 os._exit(1)
             except Exception:
                 logger.exception("__flushEvents: Some exception occured:")
                 pass
         logger.debug("__flushEvents: Left event loop.")
 
+    def __wakeUpListener(self):
+        os.write(self.__wakeUpWrite, b"\0")
+
+    def __updateWindowInfoCache(self, event):
+        if self.__changesWindowInfo(event):
+            self.windowInfoCache.invalidate()
+
+    def __changesWindowInfo(self, event) -> bool:
+        """
+        Tell if the event invalidates the cached window information: The focus left a watched window, the active
+        window changed or a title or class of a watched window changed. Other property changes, like the
+        _NET_WM_USER_TIME updates on every key press, are ignored.
+        """
+        if event.type == X.FocusOut:
+            return self.windowInfoCache.is_watched(event.window)
+        elif event.type != X.PropertyNotify:
+            return False
+        elif event.window == self.rootWindow:
+            return event.atom == self.__ActiveWindowAtom
+        return event.atom in self.__windowInfoAtoms and self.windowInfoCache.is_watched(event.window)
+
+    def __pendingWindowInfoChange(self) -> bool:
+        """
+        Tell if events not yet handled by the listener thread invalidate the cached window information. The listener
+        thread takes events from the Xlib event queue concurrently, so the queue is copied while holding the lock
+        Xlib changes the queue with.
+        """
+        if not self.localDisplay.pending_events():
+            return False
+        try:
+            xDisplay = self.localDisplay.display
+            xDisplay.event_queue_write_lock.acquire()
+            try:
+                pending = list(xDisplay.event_queue)
+            finally:
+                xDisplay.event_queue_write_lock.release()
+        except Exception:
+            # The queue of this Xlib version can't be inspected, assume the worst.
+            logger.debug("Unable to inspect the pending X events", exc_info=True)
+            return True
+        return any(self.__changesWindowInfo(event) for event in pending)
+
     def handle_keypress(self, keyCode):
         self.__enqueue(self.__handleKeyPress, keyCode)
     
     def __handleKeyPress(self, keyCode):
-        focus = self.localDisplay.get_input_focus().focus
-
         modifier = self.__decodeModifier(keyCode)
         if modifier is not None:
             self.mediator.handle_modifier_down(modifier)
         else:
-            window_info = self.get_window_info(focus)
+            window_info = self._get_focused_window_info()
             self.mediator.handle_keypress(keyCode, window_info)
 
     def handle_keyrelease(self, keyCode):
@@ -958,13 +1405,15 @@ class XInterfaceBase(threading.Thread):
             self.mediator.handle_modifier_up(modifier)
             
     def handle_mouseclick(self, button, x, y):
-        self.__enqueue(self.__handleMouseclick, button, x, y)
+        # Wait a bit to avoid timing issues. A mouse click might change the active application.
+        # If so, the switch happens asynchronously somewhere during the execution of the first two queries in
+        # __handleMouseclick, causing the queried window title (and maybe the window class or even none of those) to be
+        # invalid. Only the handling of further user input waits for this.
+        self.queue.put(self.__handleMouseclick, (button, x, y), INPUT_LANE, PacingEngine.MOUSE_CLICK_DELAY)
         
     def __handleMouseclick(self, button, x, y):
-        # Sleep a bit to timing issues. A mouse click might change the active application.
-        # If so, the switch happens asynchronously somewhere during the execution of the first two queries below,
-        # causing the queried window title (and maybe the window class or even none of those) to be invalid.
-        time.sleep(0.005)  # TODO: may need some tweaking
+        # The click might have moved the focus to another window. Don't wait for the focus event to arrive.
+        self.windowInfoCache.invalidate()
         window_info = self.get_window_info()
         
         if x is None and y is None:
@@ -990,34 +1439,36 @@ class XInterfaceBase(threading.Thread):
         return None
 
     def __sendKeyCode(self, keyCode, modifiers=0, theWindow=None):
-        if cm.ConfigManager.SETTINGS[cm.ENABLE_QT4_WORKAROUND] or self.__enableQT4Workaround:
-            self.__doQT4Workaround(keyCode)
         self.__sendKeyPressEvent(keyCode, modifiers, theWindow)
         self.__sendKeyReleaseEvent(keyCode, modifiers, theWindow)
 
-    def __checkWorkaroundNeeded(self):
-        focus = self.localDisplay.get_input_focus().focus
-        window_info = self.get_window_info(focus)
-        w = self.app.configManager.workAroundApps
-        if w.match(window_info.wm_title) or w.match(window_info.wm_class):
-            self.__enableQT4Workaround = True
-        else:
-            self.__enableQT4Workaround = False
+    def __selectPacingProfile(self):
+        settings = cm.ConfigManager.SETTINGS
+        self.pacing.configure(
+            settings[cm.WORKAROUND_APP_REGEX], settings[cm.ENABLE_QT4_WORKAROUND], settings[cm.PACING_PROFILES]
+        )
+        self.__pacingProfile = self.pacing.profile_for(self._get_focused_window_info())
 
-    def __doQT4Workaround(self, keyCode):
-        if len(self.lastChars) > 0:
-            if keyCode in self.lastChars:
-                self.localDisplay.flush()
-                time.sleep(0.0125)
+    def __pacingDelay(self, keyCode) -> float:
+        """
+        Return the time to wait before sending the given key (QT4 workaround). Slow applications lose keys, if the
+        same key is sent again before the previous one was processed.
+        """
+        delay = self.__pacingProfile.repeated_key_delay
+        if delay and keyCode in self.lastChars:
+            # The caller sends the key after the pause, so forget the keys sent before.
+            self.lastChars = []
+            return delay
 
         self.lastChars.append(keyCode)
 
         if len(self.lastChars) > 10:
             self.lastChars.pop(0)
+        return 0.0
 
     def __sendKeyPressEvent(self, keyCode, modifiers, theWindow=None):
         if theWindow is None:
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__focusWindow()
         else:
             focus = theWindow
         keyEvent = event.KeyPress(
@@ -1037,7 +1488,7 @@ class XInterfaceBase(threading.Thread):
 
     def __sendKeyReleaseEvent(self, keyCode, modifiers, theWindow=None):
         if theWindow is None:
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__focusWindow()
         else:
             focus = theWindow
         keyEvent = event.KeyRelease(
@@ -1057,12 +1508,12 @@ class XInterfaceBase(threading.Thread):
 
     def __lookupKeyCode(self, char: str) -> int:
         if char in AK_TO_XK_MAP:
-            return self.localDisplay.keysym_to_keycode(AK_TO_XK_MAP[char])
+            return self.keymapTable.keycode(AK_TO_XK_MAP[char])
         elif char.startswith("<code"):
             return int(char[5:-1])
         else:
             try:
-                return self.localDisplay.keysym_to_keycode(ord(char))
+                return self.keymapTable.keycode(ord(char))
             except Exception as e:
                 logger.error("Unknown key name: %s", char)
                 raise
@@ -1076,7 +1527,61 @@ class XInterfaceBase(threading.Thread):
             logger.exception("Got BadWindow error while requesting window information.")
             return self._create_window_info(window, "", "")
 
-    def _get_window_info(self, window, traverse: bool, wm_title: str=None, wm_class: str=None) -> WindowInfo:
+    def _get_focused_window_info(self) -> WindowInfo:
+        """
+        Return the window information of the currently focused window. The information is served from the window
+        info cache, if possible. Otherwise it is queried from the X server and the involved windows are watched for
+        changes, so that the result can be cached.
+        """
+        if self.__pendingWindowInfoChange():
+            self.windowInfoCache.invalidate()
+        window_info, generation = self.windowInfoCache.get()
+        if window_info is not None:
+            return window_info
+
+        focus = self.localDisplay.get_input_focus().focus
+        visited_windows = []
+        try:
+            window_info = self._get_window_info(focus, True, visited_windows=visited_windows)
+        except error.BadWindow:
+            logger.exception("Got BadWindow error while requesting window information.")
+            return self._create_window_info(focus, "", "")
+
+        if self.__watchWindows(focus, visited_windows):
+            self.windowInfoCache.store(window_info, visited_windows, generation)
+        return window_info
+
+    def __watchWindows(self, focus, windows: list) -> bool:
+        """
+        Select focus and property change events on the given windows, and stop selecting them on the windows watched
+        before. Returns True, if the events are selected and the focus did not move while doing so, i.e. if
+        information about the focused window may be cached.
+        """
+        # The root window already selects the events, and changing its mask would lose the SubstructureNotify selection
+        windows = [window for window in windows if window != self.rootWindow]
+        windowIds = {window.id for window in windows}
+        catcher = error.CatchError(error.BadWindow)
+        with self.__eventMaskLock:
+            for window in self.__watchedWindows:
+                if window.id not in windowIds:
+                    # Windows holding grabs still have to report their destruction
+                    mask = GRABBED_WINDOW_EVENT_MASK if self.grabRegistry.holds_grabs(window.id) else X.NoEventMask
+                    window.change_attributes(event_mask=mask, onerror=error.CatchError(error.BadWindow))
+            for window in windows:
+                window.change_attributes(event_mask=WATCHED_WINDOW_EVENT_MASK, onerror=catcher)
+            self.__watchedWindows = windows
+        # The reply to this request guarantees that the event selection is in effect
+        still_focused = self.localDisplay.get_input_focus().focus == focus
+        return still_focused and catcher.get_error() is None
+
+    def __isWatched(self, window) -> bool:
+        """Tell if the window selects WATCHED_WINDOW_EVENT_MASK. Must be called while holding __eventMaskLock."""
+        return any(watched.id == window.id for watched in self.__watchedWindows)
+
+    def _get_window_info(self, window, traverse: bool, wm_title: str=None, wm_class: str=None,
+                         visited_windows: list=None) -> WindowInfo:
+        if visited_windows is not None:
+            visited_windows.append(window)
         new_wm_title = self._try_get_window_title(window)
         new_wm_class = self._try_get_window_class(window)
 
@@ -1098,7 +1603,7 @@ class XInterfaceBase(threading.Thread):
                     # will replace any None with an empty string. See below.
                     return self._get_window_info(window, False, wm_title, wm_class)
                 else:
-                    return self._get_window_info(parent, traverse, wm_title, wm_class)
+                    return self._get_window_info(parent, traverse, wm_title, wm_class, visited_windows)
 
         else:
             # No recursion, so fill unknown values with empty strings.
@@ -1161,15 +1666,26 @@ class XInterfaceBase(threading.Thread):
         return self.get_window_info(window, traverse).wm_class
 
     def cancel(self):
+        logger.debug("XInterfaceBase: Window information lookups: %s", self.windowInfoCache)
+        logger.debug("XInterfaceBase: Output throughput: %s", self.pacing)
+        logger.debug("XInterfaceBase: %s", self.windowGrabLatency)
+        logger.debug("XInterfaceBase: %s", self.pasteLatency)
         logger.debug("XInterfaceBase: Try to exit event thread.")
-        self.queue.put_nowait((None, None))
+        # The exit marker goes to the end of the output lane, so that all queued output is still sent, including
+        # output held back by pacing delays, like restoring the clipboard after a paste.
+        self.queue.put(None, None, OUTPUT_LANE)
         logger.debug("XInterfaceBase: Event thread exit marker enqueued.")
         self.shutdown = True
+        self.__wakeUpListener()
         logger.debug("XInterfaceBase: self.shutdown set to True. This should stop the listener thread.")
         self.listenerThread.join()
         self.eventThread.join()
         self.localDisplay.flush()
         self.localDisplay.close()
+        if self.selectionOwner is not None:
+            self.selectionOwner.close()
+        os.close(self.__wakeUpRead)
+        os.close(self.__wakeUpWrite)
         self.join()
 
 
@@ -1361,6 +1877,14 @@ XK_TO_AK_MAP = {
 
 AK_TO_XK_MAP = dict((v,k) for k, v in XK_TO_AK_MAP.items())
 
+# Modifier keys that have to be held down to type the keysym at the given offset in a keycode's keysym list
+LEVEL_MODIFIERS = {
+    0: (),
+    1: (Key.SHIFT,),
+    4: (Key.ALT_GR,),
+    5: (Key.ALT_GR, Key.SHIFT),
+}
+
 XK_TO_AK_NUMLOCKED = {
            XK.XK_KP_Insert: "0",
            XK.XK_KP_Delete: ".",
@@ -5,6 +5,7 @@ import logging
 from ..configmanager import ConfigManager
 from ..configmanager_constants import INTERFACE_TYPE
 from ..interface import XRecordInterface, AtSpiInterface
+from ..instructions import InstructionCompiler, PRESS, RELEASE
 from autokey.model import SendMode
 
 from .key import Key
@@ -25,6 +26,8 @@ class IoMediator(threading.Thread):
     
     # List of targets interested in receiving keypress, hotkey and mouse events
     listeners = []
+    # Parsed send_string() arguments, shared by all instances
+    compiler = InstructionCompiler(Key.is_key, MODIFIERS)
     
     def __init__(self, service):
         threading.Thread.__init__(self, name="KeypressHandler-thread")
@@ -128,38 +131,15 @@ class IoMediator(threading.Thread):
         if not string:
             return
 
-        string = string.replace('\n', "<enter>")
-        string = string.replace('\t', "<tab>")
-        
         _logger.debug("Send via event interface")
-        self.__clearModifiers()
-        modifiers = []
-        for section in KEY_SPLIT_RE.split(string):
-            if len(section) > 0:
-                if Key.is_key(section[:-1]) and section[-1] == '+' and section[:-1] in MODIFIERS:
-                    # Section is a modifier application (modifier followed by '+')
-                    modifiers.append(section[:-1])
-                    
-                else:
-                    if len(modifiers) > 0:
-                        # Modifiers ready for application - send modified key
-                        if Key.is_key(section):
-                            self.interface.send_modified_key(section, modifiers)
-                            modifiers = []
-                        else:
-                            self.interface.send_modified_key(section[0], modifiers)
-                            if len(section) > 1:
-                                self.interface.send_string(section[1:])
-                            modifiers = []
-                    else:
-                        # Normal string/key operation
-                        if Key.is_key(section):
-                            self.interface.send_key(section)
-                        else:
-                            self.interface.send_string(section)
-                            
-        self.__reapplyModifiers()
-        
+        released = self.__heldModifiers()
+        instructions = self.compiler.compile(string)
+        self.interface.send_instructions(
+            tuple((RELEASE, modifier, ()) for modifier in released)
+            + instructions
+            + tuple((PRESS, modifier, ()) for modifier in released)
+        )
+
     def paste_string(self, string, pasteCommand: SendMode):
         if len(string) > 0:
             _logger.debug("Send via clipboard")
@@ -181,9 +161,12 @@ class IoMediator(threading.Thread):
                 
         self.send_backspace(backspaces)
 
-    def send_key(self, keyName):
+    def send_key(self, keyName, repeat: int=1):
         keyName = keyName.replace('\n', "<enter>")
-        self.interface.send_key(keyName)
+        if repeat == 1:
+            self.interface.send_key(keyName)
+        else:
+            self.interface.send_key_repeated(keyName, repeat)
 
     def press_key(self, keyName):
         keyName = keyName.replace('\n', "<enter>")
@@ -201,43 +184,37 @@ class IoMediator(threading.Thread):
         """
         Sends the given number of left key presses.
         """
-        for i in range(count):
-            self.interface.send_key(Key.LEFT)
+        self.interface.send_key_repeated(Key.LEFT, count)
 
     def send_right(self, count):
-        for i in range(count):
-            self.interface.send_key(Key.RIGHT)
+        self.interface.send_key_repeated(Key.RIGHT, count)
     
     def send_up(self, count):
         """
         Sends the given number of up key presses.
         """        
-        for i in range(count):
-            self.interface.send_key(Key.UP)
+        self.interface.send_key_repeated(Key.UP, count)
 
     def send_backspace(self, count):
         """
         Sends the given number of backspace key presses.
         """
-        for i in range(count):
-            self.interface.send_key(Key.BACKSPACE)
+        self.interface.send_key_repeated(Key.BACKSPACE, count)
 
     def flush(self):
         self.interface.flush()
         
     # Utility methods ----
     
-    def __clearModifiers(self):
-        self.releasedModifiers = []
-        
-        for modifier in list(self.modifiers.keys()):
-            if self.modifiers[modifier] and modifier not in (Key.CAPSLOCK, Key.NUMLOCK):
-                self.releasedModifiers.append(modifier)
-                self.interface.release_key(modifier)
-
-    def __reapplyModifiers(self):
-        for modifier in self.releasedModifiers:
-            self.interface.press_key(modifier)
+    def __heldModifiers(self):
+        """
+        Return the modifiers held down by the user, which are released while a string is sent and pressed again
+        afterwards. Caps lock and num lock are left alone.
+        """
+        return [
+            modifier for modifier, state in self.modifiers.items()
+            if state and modifier not in (Key.CAPSLOCK, Key.NUMLOCK)
+        ]
 
     def __getModifiersOn(self):
         modifiers = []
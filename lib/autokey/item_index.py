@@ -0,0 +1,192 @@
+"""
+Persisted metadata index of the folder, phrase and script tree.
+
+Loading the tree from disk lists every directory and reads the JSON file of every folder and item. With the
+"useItemIndex" setting enabled, the metadata of the whole tree is written to a single index file at shutdown and
+read back at the next start. The record of a directory is only used, if the modification time of the directory still
+matches the time it was loaded at, i.e. no entry was created, removed or renamed in it since. Other directories are
+loaded from disk as usual. Within a valid record, the metadata of a folder or item is only used, if the modification
+time and size of its JSON file still match the ones of the file the model was loaded from. Otherwise that single
+JSON file is read from disk.
+
+Changes reported by the FileMonitor refresh the record of the affected directory, see
+ConfigManager.apply_path_events(). The index file is removed after reading it, so after a crash the whole tree is
+loaded from disk.
+"""
+
+import logging
+import marshal
+import os
+import threading
+import typing
+
+_logger = logging.getLogger("config-manager").getChild("index")
+
+FORMAT_VERSION = 2
+
+# (modification time in ns, size) of a JSON file, None if the file doesn't exist
+Signature = typing.Optional[typing.Tuple[int, int]]
+# (directory modification time in ns, folder JSON signature, folder metadata, subfolder paths,
+#  [(item path, item JSON signature, item metadata), ...]). The metadata is None, if it has to be read from disk.
+DirectoryRecord = typing.Tuple[int, Signature, typing.Optional[dict], typing.List[str],
+                               typing.List[typing.Tuple[str, Signature, typing.Optional[dict]]]]
+# (folder metadata, subfolder paths, [(item path, item metadata), ...]) of a valid record, as returned by lookup()
+RestoredDirectory = typing.Tuple[typing.Optional[dict], typing.List[str],
+                                 typing.List[typing.Tuple[str, typing.Optional[dict]]]]
+
+
+class ItemIndex:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Marshalled records read from the index file, decoded on lookup
+        self._records = {}  # type: typing.Dict[str, bytes]
+        # directory -> modification time of the directory, when its content was loaded into the model
+        self._mtimes = {}  # type: typing.Dict[str, int]
+        # JSON file path -> signature of the file, when its content was loaded into the model
+        self._signatures = {}  # type: typing.Dict[str, Signature]
+        self.hits = 0
+        self.misses = 0
+        # JSON files read from disk, because they changed since the record was written
+        self.stale_files = 0
+
+    def load(self):
+        """Read the index file and remove it. It is written again by save() at a clean shutdown."""
+        try:
+            with open(self.path, "rb") as index_file:
+                version, records = marshal.load(index_file)
+        except FileNotFoundError:
+            return
+        except (OSError, EOFError, ValueError, TypeError):
+            _logger.warning("Ignoring unreadable item index %s", self.path)
+            records = {}
+        else:
+            if version != FORMAT_VERSION:
+                records = {}
+        try:
+            os.remove(self.path)
+        except OSError:
+            _logger.exception("Unable to remove the item index %s, not using it", self.path)
+            return
+        self._records = records
+
+    def lookup(self, directory: str) -> typing.Optional[RestoredDirectory]:
+        """
+        Return the content of the directory, if its record is still valid. Metadata of changed JSON files is
+        returned as None.
+        """
+        data = self._records.pop(directory, None)
+        if data is not None:
+            mtime = self.directory_mtime(directory)
+            recorded_mtime, folder_signature, folder_data, folder_paths, items = marshal.loads(data)
+            if recorded_mtime == mtime:
+                self.hits += 1
+                self.loaded(directory, mtime)
+                folder_data = self._restore(directory + "/.folder.json", folder_signature, folder_data)
+                items = [
+                    (item_path, self._restore(json_path(item_path), signature, item_data))
+                    for item_path, signature, item_data in items
+                ]
+                return folder_data, folder_paths, items
+        self.misses += 1
+        return None
+
+    def _restore(self, path: str, signature: Signature, data: typing.Optional[dict]) -> typing.Optional[dict]:
+        if data is None or self.file_signature(path) != signature:
+            self.stale_files += 1
+            return None
+        self.file_loaded(path, signature)
+        return data
+
+    @staticmethod
+    def directory_mtime(directory: str) -> typing.Optional[int]:
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def file_signature(path: str) -> Signature:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def loaded(self, directory: str, mtime: typing.Optional[int]):
+        """
+        Tell that the directory was loaded into the model. mtime must be taken before listing the directory, so that
+        concurrent changes make the record invalid instead of going unnoticed.
+        """
+        if mtime is not None:
+            with self._lock:
+                self._mtimes[directory] = mtime
+
+    def file_loaded(self, path: str, signature: Signature):
+        """
+        Tell that the JSON file was loaded into the model. As for directories, the signature must be taken before
+        reading the file.
+        """
+        with self._lock:
+            self._signatures[path] = signature
+
+    def invalidate(self, directory: str):
+        """The content of the directory changed, load it from disk on the next start."""
+        with self._lock:
+            self._mtimes.pop(directory, None)
+
+    def save(self, folders: typing.Iterable):
+        """Write the index for the given folder trees. Directories changed since they were loaded are left out."""
+        records = {}
+        folders = list(folders)
+        while folders:
+            folder = folders.pop()
+            folders.extend(folder.folders)
+            with self._lock:
+                mtime = self._mtimes.get(folder.path)
+            if mtime is None or any(item.path is None for item in folder.items):
+                continue
+            folder_signature, folder_data = self._snapshot(folder.path + "/.folder.json", folder)
+            items = []
+            for item in folder.items:
+                signature, data = self._snapshot(json_path(item.path), item)
+                if data is not None and "store" in data:
+                    data["store"] = dict(data["store"])
+                items.append((item.path, signature, data))
+            try:
+                records[folder.path] = marshal.dumps(
+                    (mtime, folder_signature, folder_data, [subfolder.path for subfolder in folder.folders], items)
+                )
+            except ValueError:
+                # A script store contains values that can't be marshalled, the directory is loaded from disk.
+                pass
+
+        temporary_path = self.path + ".tmp"
+        try:
+            with open(temporary_path, "wb") as index_file:
+                marshal.dump((FORMAT_VERSION, records), index_file)
+            os.replace(temporary_path, self.path)
+        except OSError:
+            _logger.exception("Unable to write the item index %s", self.path)
+        _logger.debug("Saved %d directories to the item index", len(records))
+
+    def _snapshot(self, path: str, entry) -> typing.Tuple[Signature, typing.Optional[dict]]:
+        """
+        The signature of the JSON file the entry was loaded from and the current metadata. The metadata is left out,
+        if the file wasn't loaded, like for entries created in the GUI, so that it is read from disk.
+        """
+        with self._lock:
+            if path not in self._signatures:
+                return None, None
+            signature = self._signatures[path]
+        return signature, entry.get_serializable()
+
+    def __str__(self):
+        return "ItemIndex(hits={}, misses={}, stale_files={})".format(self.hits, self.misses, self.stale_files)
+
+
+def json_path(item_path: str) -> str:
+    """The path of the JSON file of the phrase or script at the given path."""
+    directory, base_name = os.path.split(os.path.splitext(item_path)[0])
+    return "{}/.{}.json".format(directory, base_name)
@@ -0,0 +1,76 @@
+"""
+Client side copy of the X keyboard mapping, used to translate between keycodes and keysyms without going through
+the generic Xlib lookup functions for every sent or received key.
+
+A table is immutable. When the keyboard mapping changes, a new table is built from the new mapping and replaces the
+old one as a whole, so readers in other threads always see a consistent mapping.
+"""
+
+import typing
+
+NO_SYMBOL = 0
+
+KeyCodeIndex = typing.Tuple[int, int]
+
+
+class KeymapTable:
+    """
+    Keycode to keysym and keysym to keycode lookup tables, built from the reply to a GetKeyboardMapping request.
+    The keycode lists have the same order Xlib uses: Lowest keysym index first, then lowest keycode.
+    """
+
+    def __init__(self, first_keycode: int, mapping: typing.Sequence[typing.Sequence[int]]):
+        self.first_keycode = first_keycode
+        self._keysyms = {}  # type: typing.Dict[int, typing.Tuple[int, ...]]
+        self._keycodes = {}  # type: typing.Dict[int, typing.List[KeyCodeIndex]]
+
+        for keycode, keysyms in enumerate(mapping, first_keycode):
+            keysyms = tuple(keysyms)
+            self._keysyms[keycode] = keysyms
+            for index, keysym in enumerate(keysyms):
+                if keysym != NO_SYMBOL:
+                    self._keycodes.setdefault(keysym, []).append((keycode, index))
+
+        for keycodes in self._keycodes.values():
+            keycodes.sort(key=lambda code_index: (code_index[1], code_index[0]))
+
+    @classmethod
+    def from_display(cls, local_display) -> "KeymapTable":
+        """Fetch the complete keyboard mapping of the given Xlib display."""
+        first_keycode = local_display.display.info.min_keycode
+        count = local_display.display.info.max_keycode - first_keycode + 1
+        return cls(first_keycode, local_display.get_keyboard_mapping(first_keycode, count))
+
+    def keysym(self, keycode: int, index: int=0) -> int:
+        """Return the keysym at the given index of the keycode's keysym list, or NO_SYMBOL."""
+        try:
+            return self._keysyms[keycode][index]
+        except (KeyError, IndexError):
+            return NO_SYMBOL
+
+    def keycodes(self, keysym: int) -> typing.List[KeyCodeIndex]:
+        """Return all (keycode, index) pairs producing the given keysym."""
+        return self._keycodes.get(keysym, [])
+
+    def keycode(self, keysym: int) -> int:
+        """Return the preferred keycode for the given keysym, or 0, if the keysym is not mapped."""
+        keycodes = self._keycodes.get(keysym)
+        return keycodes[0][0] if keycodes else 0
+
+    def usable_keycode(self, keysym: int, usable_offsets: typing.Container[int]) \
+            -> typing.Tuple[typing.Optional[int], typing.Optional[int]]:
+        """
+        Return the first (keycode, index) pair producing the given keysym with an index in usable_offsets, or
+        (None, None), if there is none.
+        """
+        for keycode, index in self._keycodes.get(keysym, ()):
+            if index in usable_offsets:
+                return keycode, index
+        return None, None
+
+    def unused_keycodes(self, first: int, count: int) -> typing.List[int]:
+        """Return the keycodes in the given range that exist, but have no keysym assigned."""
+        return [
+            keycode for keycode in range(first, first + count)
+            if keycode in self._keysyms and not any(keysym != NO_SYMBOL for keysym in self._keysyms[keycode])
+        ]
@@ -0,0 +1,31 @@
+"""
+Simple timing statistics, used to instrument operations whose latency matters to the user.
+"""
+
+import threading
+
+
+class LatencyStatistics:
+    """
+    Collects the durations of a repeated operation, for example the time from the creation of a window until the
+    hotkeys are grabbed in it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.maximum = max(self.maximum, seconds)
+
+    def __str__(self):
+        mean = self.total / self.count if self.count else 0.0
+        return "{}: count={}, mean={:.1f} ms, max={:.1f} ms".format(
+            self.name, self.count, mean * 1000, self.maximum * 1000
+        )
@@ -1,4 +1,8 @@
+import collections
 import datetime
+import os
+import time
+import typing
 from abc import abstractmethod
 
 from autokey.iomediator.constants import KEY_SPLIT_RE
@@ -30,9 +34,30 @@ else:
     from gi.repository import Gtk
 
 
+class MacroTemplate:
+    """
+    An expansion string split into parts, with the macro calls found in it: (macro, part index, parsed arguments),
+    in the order they are processed.
+    """
+
+    def __init__(self, parts: typing.List[str], calls: typing.List[typing.Tuple["AbstractMacro", int, dict]]):
+        self.parts = parts
+        self.calls = calls
+        # Strings without macros expand to themselves
+        self.result = "".join(parts) if not calls else None
+
+
 class MacroManager:
+
+    # Number of parsed expansion strings kept
+    TEMPLATE_CACHE_SIZE = 256
     
     def __init__(self, engine):
+        # expansion string -> MacroTemplate, least recently used first. Edited phrases get a new entry, the
+        # template of the old text is dropped eventually.
+        self._templates = collections.OrderedDict()  # type: typing.Dict[str, MacroTemplate]
+        # (macro ID, macro token) -> (expiry time, result) of macros with a RESULT_TTL
+        self._results = {}  # type: typing.Dict[typing.Tuple[str, str], typing.Tuple[float, str]]
         self.macros = []
         
         self.macros.append(ScriptMacro(engine))
@@ -58,16 +83,57 @@ class MacroManager:
         return menu
         
     def process_expansion(self, expansion):
-        parts = KEY_SPLIT_RE.split(expansion.string)
-        
-        for macro in self.macros:        
-            macro.process(parts)
-        
+        template = self.get_template(expansion.string)
+        if template.result is not None:
+            expansion.string = template.result
+            return
+
+        parts = list(template.parts)
+        for macro, index, args in template.calls:
+            self.__call(macro, parts, index, args)
         expansion.string = ''.join(parts)
-        
+
+    def get_template(self, string: str) -> MacroTemplate:
+        try:
+            self._templates.move_to_end(string)
+            return self._templates[string]
+        except KeyError:
+            pass
+
+        parts = KEY_SPLIT_RE.split(string)
+        calls = []
+        for macro in self.macros:
+            # Only the tokens at odd indices can be macro calls, the others are plain text.
+            for index in range(1, len(parts), 2):
+                if macro._can_process(parts[index]):
+                    calls.append((macro, index, macro._get_args(parts[index])))
+
+        template = self._templates[string] = MacroTemplate(parts, calls)
+        if len(self._templates) > self.TEMPLATE_CACHE_SIZE:
+            self._templates.popitem(last=False)
+        return template
+
+    def __call(self, macro, parts: typing.List[str], index: int, args: dict):
+        if macro.RESULT_TTL is None:
+            macro.do_process(parts, index, args)
+            return
+
+        key = (macro.ID, parts[index])
+        now = time.monotonic()
+        expiry, result = self._results.get(key, (0.0, None))
+        if now >= expiry:
+            macro.do_process(parts, index, args)
+            result = parts[index]
+            self._results[key] = (now + macro.RESULT_TTL, result)
+        parts[index] = result
+
 
 class AbstractMacro:
 
+    # Seconds the result of a macro call may be reused by later expansions with the same call. None evaluates
+    # the macro on every expansion.
+    RESULT_TTL = None  # type: typing.Optional[float]
+
     def get_token(self):
         ret = "<%s" % self.ID
         # TODO: v not used in initial implementation? This results in something like "<%s a= b= c=>"
@@ -96,13 +162,9 @@ class AbstractMacro:
         
         return ret
         
-    def process(self, parts):
-        for i in range(len(parts)):
-            if self._can_process(parts[i]):
-                self.do_process(parts, i)
-
     @abstractmethod
-    def do_process(self, parts, i):
+    def do_process(self, parts, i, args):
+        """Replace parts[i], the macro call with the given arguments, by its result."""
         pass
 
 
@@ -112,7 +174,7 @@ class CursorMacro(AbstractMacro):
     TITLE = _("Position cursor")
     ARGS = []
     
-    def do_process(self, parts, i):
+    def do_process(self, parts, i, args):
         try:
             lefts = len(''.join(parts[i+1:]))
             parts.append(Key.LEFT * lefts)
@@ -131,8 +193,7 @@ class ScriptMacro(AbstractMacro):
     def __init__(self, engine):
         self.engine = engine
     
-    def do_process(self, parts, i):
-        args = self._get_args(parts[i])
+    def do_process(self, parts, i, args):
         self.engine.run_script_from_macro(args)
         parts[i] = self.engine.get_return_value()
 
@@ -143,8 +204,8 @@ class DateMacro(AbstractMacro):
     TITLE = _("Insert date")
     ARGS = [("format", _("Format"))]
     
-    def do_process(self, parts, i):
-        format_ = self._get_args(parts[i])["format"]
+    def do_process(self, parts, i, args):
+        format_ = args["format"]
         date = datetime.datetime.now().strftime(format_)
         parts[i] = date
 
@@ -154,9 +215,19 @@ class FileContentsMacro(AbstractMacro):
     ID = "file"
     TITLE = _("Insert file contents")
     ARGS = [("name", _("File name"))]
+
+    def __init__(self):
+        # file name -> (modification time, size, content)
+        self._contents = {}  # type: typing.Dict[str, typing.Tuple[int, int, str]]
     
-    def do_process(self, parts, i):
-        name = self._get_args(parts[i])["name"]
-        
+    def do_process(self, parts, i, args):
+        name = args["name"]
+        stat = os.stat(name)
+        cached = self._contents.get(name)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            parts[i] = cached[2]
+            return
+
         with open(name, "r") as inputFile:
             parts[i] = inputFile.read()
+        self._contents[name] = (stat.st_mtime_ns, stat.st_size, parts[i])
@@ -17,18 +17,25 @@
 
 import re
 import os
+import collections
 import os.path
 import glob
 import logging
 import json
-import shutil
 import typing
 import enum
+import hashlib
+import importlib.util
+import marshal
+import threading
 
 from autokey import configmanager as cm
+from autokey import common
 from autokey.iomediator.key import Key, NAVIGATION_KEYS
 from autokey.iomediator.constants import KEY_SPLIT_RE
 from autokey.scripting_Store import Store
+from autokey.item_index import ItemIndex
+from autokey.persistence import OWN_WRITES, compact_json
 
 _logger = logging.getLogger("model")
 
@@ -38,6 +45,12 @@ JSON_FILE_PATTERN = "{}/.{}.json"
 SPACES_RE = re.compile(r"^ | $")
 
 
+def record_json_file(path: str, exists: bool=True):
+    """Remember the state of a JSON file, before its content is loaded into the model. Used by the item index."""
+    if cm.ConfigManager.SETTINGS[cm.USE_ITEM_INDEX]:
+        Folder.INDEX.file_loaded(path, ItemIndex.file_signature(path) if exists else None)
+
+
 def make_wordchar_re(word_chars: str):
     return "[^{word_chars}]".format(word_chars=word_chars)
 
@@ -59,7 +72,7 @@ def get_safe_path(base_path, name, ext=""):
         jsonPath = base_path + '/.' + safe_name + ".json"
         n = 1
 
-    while os.path.exists(path) or os.path.exists(jsonPath):
+    while OWN_WRITES.exists(path) or OWN_WRITES.exists(jsonPath):
         path = base_path + '/' + safe_name + str(n) + ext
         jsonPath = base_path + '/.' + safe_name + str(n) + ".json"
         n += 1
@@ -261,8 +274,38 @@ class AbstractAbbreviation:
             return input_string[:split_index], input_string[split_index: split_index_2], input_string[split_index_2:]
 
 
+class WindowFilterCache:
+    """
+    Memoizes window filter decisions for the most recently seen window.
+    Decisions are keyed by the filter pattern, so all items sharing a filter share a single regex evaluation. The
+    memo is discarded whenever a different WindowInfo is checked, which usually happens after a focus change.
+    """
+
+    def __init__(self):
+        # Replaced as a whole, so that concurrent readers never see results belonging to another window.
+        self._state = (None, {})  # type: typing.Tuple[typing.Any, typing.Dict[str, bool]]
+
+    def matches(self, regex: typing.Pattern, window_info) -> bool:
+        state_window_info, decisions = self._state
+        if state_window_info != window_info:
+            decisions = {}
+            self._state = (window_info, decisions)
+        try:
+            return decisions[regex.pattern]
+        except KeyError:
+            decision = bool(regex.match(window_info.wm_title)) or bool(regex.match(window_info.wm_class))
+            decisions[regex.pattern] = decision
+            return decision
+
+    def clear(self):
+        self._state = (None, {})
+
+
 class AbstractWindowFilter:
 
+    # Filter decisions for the current window, shared by all items. Cleared by ConfigManager.config_altered()
+    FILTER_CACHE = WindowFilterCache()
+
     def __init__(self):
         self.windowInfoRegex = None
         self.isRecursive = False
@@ -283,15 +326,18 @@ class AbstractWindowFilter:
     def copy_window_filter(self, window_filter):
         self.windowInfoRegex = window_filter.windowInfoRegex
         self.isRecursive = window_filter.isRecursive
+        self._discard_precomputed_filter()
 
     def set_window_titles(self, regex):
         if regex is not None:
             self.windowInfoRegex = re.compile(regex, re.UNICODE)
         else:
             self.windowInfoRegex = regex
+        self._discard_precomputed_filter()
 
     def set_filter_recursive(self, recurse):
         self.isRecursive = recurse
+        self._discard_precomputed_filter()
 
     def has_filter(self) -> bool:
         return self.windowInfoRegex is not None
@@ -339,10 +385,24 @@ class AbstractWindowFilter:
 
         return None
 
+    def precompute_filter(self):
+        """
+        Resolve the applicable filter regex, which might be inherited from a parent folder, once instead of walking
+        the folder hierarchy on every check. Called by ConfigManager.config_altered() for all known items.
+        """
+        self._applicable_regex = (self.get_applicable_regex(),)
+
+    def _discard_precomputed_filter(self):
+        self.__dict__.pop("_applicable_regex", None)
+
     def _should_trigger_window_title(self, window_info):
-        r = self.get_applicable_regex()  # type: typing.Pattern
+        try:
+            r, = self._applicable_regex  # type: typing.Pattern
+        except AttributeError:
+            # Not yet processed by the configuration manager
+            r = self.get_applicable_regex()
         if r is not None:
-            return bool(r.match(window_info.wm_title)) or bool(r.match(window_info.wm_class))
+            return AbstractWindowFilter.FILTER_CACHE.matches(r, window_info)
         else:
             return True
 
@@ -400,12 +460,110 @@ class AbstractHotkey(AbstractWindowFilter):
         return ret
 
 
+class ItemBodyCache:
+    """
+    Phrase texts and script sources read on demand, when the "lazyItemBodies" setting is enabled. Only the metadata
+    of an item is loaded at startup, its body is read from the item's file on first access.
+
+    Bodies matching the file content are evicted in least recently used order, when their total size exceeds the
+    "itemBodyBudget" setting, and read again on the next access. Modified bodies stay resident, they are only
+    tracked again after they are persisted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # id(item) -> (item, size in bytes), least recently used first
+        self._entries = collections.OrderedDict()  # type: typing.Dict[int, typing.Tuple[typing.Any, int]]
+        self.size = 0
+        self.loads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return cm.ConfigManager.SETTINGS[cm.LAZY_ITEM_BODIES]
+
+    def get(self, item) -> str:
+        with self._lock:
+            body = item._body
+            if body is not None:
+                if id(item) in self._entries:
+                    self._entries.move_to_end(id(item))
+                return body
+        # Read without holding the lock, so that accesses to other items don't wait for the disk.
+        try:
+            data = OWN_WRITES.read_text(item.path)
+        except OSError:
+            _logger.exception("Unable to read %s", item.path)
+            return ""
+        with self._lock:
+            # Another thread might have loaded or replaced the body in the meantime.
+            if item._body is None:
+                item._body = data
+                self.loads += 1
+                self._track(item, len(data.encode("UTF-8")))
+            return item._body
+
+    def set(self, item, body: typing.Optional[str], clean: bool=False):
+        """
+        Replace the body of the item. clean tells that the body matches the content of the item's file, so it can
+        be evicted. A body of None is read from the file on the next access.
+        """
+        with self._lock:
+            entry = self._entries.pop(id(item), None)
+            if entry is not None:
+                self.size -= entry[1]
+            item._body = body
+            if body is not None and clean and self.enabled():
+                self._track(item, len(body.encode("UTF-8")))
+
+    def pin(self, item):
+        """Keep the body of the item resident, e.g. because its file is about to be removed."""
+        if self.enabled():
+            self.set(item, self.get(item))
+
+    def _track(self, item, size: int):
+        self._entries[id(item)] = (item, size)
+        self.size += size
+        budget = cm.ConfigManager.SETTINGS[cm.ITEM_BODY_BUDGET]
+        # Keep at least the body just loaded.
+        while self.size > budget and len(self._entries) > 1:
+            _, (evicted_item, evicted_size) = self._entries.popitem(last=False)
+            evicted_item._body = None
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def __str__(self):
+        return "ItemBodyCache(resident={} bytes in {} items, loads={}, evictions={})".format(
+            self.size, len(self._entries), self.loads, self.evictions
+        )
+
+
+class LazyBody:
+    """
+    Descriptor for the text of a phrase or the source code of a script, stored in the "_body" attribute of the item.
+    In lazy body mode, the body is None until it is first accessed.
+    """
+
+    CACHE = ItemBodyCache()
+
+    def __get__(self, item, owner=None):
+        if item is None:
+            return self
+        return LazyBody.CACHE.get(item)
+
+    def __set__(self, item, body: str):
+        LazyBody.CACHE.set(item, body)
+
+
 class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     """
     Manages a collection of subfolders/phrases/scripts, which may be associated
     with an abbreviation or hotkey.
     """
 
+    # Metadata of the folder tree, persisted between runs
+    INDEX = ItemIndex(os.path.join(common.CONFIG_DIR, "item_index"))
+
     def __init__(self, title: str, show_in_tray_menu: bool=False, path: str=None):
         AbstractAbbreviation.__init__(self)
         AbstractHotkey.__init__(self)
@@ -432,11 +590,11 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is None:
             self.build_path()
 
-        if not os.path.exists(self.path):
-            os.mkdir(self.path)
+        with OWN_WRITES.transaction():
+            if not OWN_WRITES.exists(self.path):
+                OWN_WRITES.make_directory(self.path)
 
-        with open(self.path + "/.folder.json", 'w') as outFile:
-            json.dump(self.get_serializable(), outFile, indent=4)
+            OWN_WRITES.write_text(self.path + "/.folder.json", compact_json(self.get_serializable()))
 
     def get_serializable(self):
         d = {
@@ -454,14 +612,24 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     def load(self, parent=None):
         self.parent = parent
 
+        if cm.ConfigManager.SETTINGS[cm.USE_ITEM_INDEX]:
+            record = Folder.INDEX.lookup(self.path)
+            if record is not None:
+                self.load_from_index(record)
+                return
+
+        self.load_settings()
+        self.load_children()
+
+    def load_settings(self):
         if os.path.exists(self.path + "/.folder.json"):
             self.load_from_serialized()
         else:
+            record_json_file(self.path + "/.folder.json", exists=False)
             self.title = os.path.basename(self.path)
 
-        self.load_children()
-
     def load_children(self):
+        mtime = ItemIndex.directory_mtime(self.path)
         entries = glob.glob(self.path + "/*")
         self.folders = []
         self.items = []
@@ -484,9 +652,34 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
                     i.load(self)
                     self.items.append(i)
 
+        Folder.INDEX.loaded(self.path, mtime)
+
+    def load_from_index(self, record):
+        data, folder_paths, items = record
+        if data is not None:
+            self.inject_json_data(data)
+        else:
+            self.load_settings()
+        self.folders = []
+        self.items = []
+
+        for folder_path in folder_paths:
+            f = Folder("", path=folder_path)
+            f.load(self)
+            self.folders.append(f)
+
+        for item_path, item_data in items:
+            if item_path.endswith(".txt"):
+                i = Phrase("", "", path=item_path)
+            else:
+                i = Script("", "", path=item_path)
+            i.load(self, item_data)
+            self.items.append(i)
+
     def load_from_serialized(self):
+        record_json_file(self.path + "/.folder.json")
         try:
-            with open(self.path + "/.folder.json", 'r') as inFile:
+            with open(self.path + "/.folder.json", 'r', encoding="UTF-8") as inFile:
                 data = json.load(inFile)
                 self.inject_json_data(data)
         except Exception:
@@ -507,9 +700,10 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     def rebuild_path(self):
         if self.path is not None:
             oldName = self.path
+            self.pin_bodies()
             self.path = get_safe_path(os.path.split(oldName)[0], self.title)
             self.update_children()
-            os.rename(oldName, self.path)
+            OWN_WRITES.rename(oldName, self.path)
         else:
             self.build_path()
 
@@ -523,10 +717,16 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def remove_data(self):
         if self.path is not None:
-            try:
-                shutil.rmtree(self.path)
-            except OSError:
-                pass
+            self.pin_bodies()
+            OWN_WRITES.remove(self.path)
+
+    def pin_bodies(self):
+        """Keep the bodies of all contained items resident, before their files are moved or removed."""
+        folders = [self]
+        for folder in folders:
+            folders.extend(folder.folders)
+            for item in folder.items:
+                LazyBody.CACHE.pin(item)
 
     def get_tuple(self):
         return "folder", self.title, self.get_abbreviations(), self.get_hotkey_string(), self
@@ -619,6 +819,8 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     Encapsulates all data and behaviour for a phrase.
     """
 
+    phrase = LazyBody()
+
     def __init__(self, description, phrase, path=None):
         AbstractAbbreviation.__init__(self)
         AbstractHotkey.__init__(self)
@@ -650,11 +852,11 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is None:
             self.build_path()
 
-        with open(self.get_json_path(), 'w') as json_file:
-            json.dump(self.get_serializable(), json_file, indent=4)
-
-        with open(self.path, "w") as out_file:
-            out_file.write(self.phrase)
+        body = self.phrase
+        with OWN_WRITES.transaction():
+            OWN_WRITES.write_text(self.get_json_path(), compact_json(self.get_serializable()))
+            OWN_WRITES.write_text(self.path, body)
+        LazyBody.CACHE.set(self, body, clean=True)
 
     def get_serializable(self):
         d = {
@@ -673,20 +875,28 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             }
         return d
 
-    def load(self, parent):
+    def load(self, parent, data: dict=None):
+        """Load the phrase from its files. data is the already known content of the JSON file, if given."""
         self.parent = parent
 
-        with open(self.path, "r") as inFile:
-            self.phrase = inFile.read()
+        if LazyBody.CACHE.enabled():
+            LazyBody.CACHE.set(self, None)
+        else:
+            with open(self.path, "r", encoding="UTF-8") as inFile:
+                self.phrase = inFile.read()
 
-        if os.path.exists(self.get_json_path()):
+        if data is not None:
+            self.inject_json_data(data)
+        elif os.path.exists(self.get_json_path()):
             self.load_from_serialized()
         else:
+            record_json_file(self.get_json_path(), exists=False)
             self.description = os.path.basename(self.path)[:-4]
 
     def load_from_serialized(self):
+        record_json_file(self.get_json_path())
         try:
-            with open(self.get_json_path(), "r") as json_file:
+            with open(self.get_json_path(), "r", encoding="UTF-8") as json_file:
                 data = json.load(json_file)
                 self.inject_json_data(data)
         except Exception:
@@ -710,18 +920,22 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is not None:
             old_name = self.path
             old_json = self.get_json_path()
+            LazyBody.CACHE.pin(self)
             self.build_path()
-            os.rename(old_name, self.path)
-            os.rename(old_json, self.get_json_path())
+            with OWN_WRITES.transaction():
+                OWN_WRITES.rename(old_name, self.path)
+                OWN_WRITES.rename(old_json, self.get_json_path())
         else:
             self.build_path()
 
     def remove_data(self):
         if self.path is not None:
-            if os.path.exists(self.path):
-                os.remove(self.path)
-            if os.path.exists(self.get_json_path()):
-                os.remove(self.get_json_path())
+            LazyBody.CACHE.pin(self)
+            with OWN_WRITES.transaction():
+                if OWN_WRITES.exists(self.path):
+                    OWN_WRITES.remove(self.path)
+                if OWN_WRITES.exists(self.get_json_path()):
+                    OWN_WRITES.remove(self.get_json_path())
 
     def copy(self, source_phrase):
         self.description = source_phrase.description
@@ -890,11 +1104,117 @@ class Expansion:
         self.backspaces = 0
 
 
+class ScriptCodeCache:
+    """
+    Compiled code objects of user scripts, so that a script is only compiled once and not on every execution.
+
+    Entries are keyed by the script path and carry the hash of the source they were compiled from, so a changed
+    source is never executed from an outdated code object. If enabled in the settings, the code objects are also
+    written to BYTECODE_DIR, like the __pycache__ directories of imported modules, so that they survive restarts.
+    """
+
+    BYTECODE_DIR = os.path.join(common.XDG_CACHE_HOME, "autokey", "script_bytecode")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # type: typing.Dict[str, typing.Tuple[str, typing.Any]]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source: str, path: typing.Optional[str]):
+        """Return the code object for the given script source, compiling it if necessary."""
+        digest = self._digest(source, path)
+        key = path if path is not None else digest
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == digest:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        code = self._load_bytecode(digest)
+        if code is None:
+            code = compile(source, path if path is not None else "<string>", "exec")
+            self._store_bytecode(digest, code)
+        with self._lock:
+            old_entry = self._entries.get(key)
+            self._entries[key] = (digest, code)
+        if old_entry is not None and old_entry[0] != digest:
+            self._remove_bytecode(old_entry[0])
+        return code
+
+    def invalidate(self, path: str, source: str):
+        """
+        Forget the code compiled for the script at the given path, unless it was compiled from the given source.
+        Called when the source is (re-)loaded.
+        """
+        digest = self._digest(source, path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] == digest:
+                return
+            del self._entries[path]
+        self._remove_bytecode(entry[0])
+
+    @staticmethod
+    def _digest(source: str, path: typing.Optional[str]) -> str:
+        return hashlib.sha1("{}\0{}".format(path, source).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _bytecode_enabled() -> bool:
+        return cm.ConfigManager.SETTINGS[cm.CACHE_SCRIPT_BYTECODE]
+
+    def _bytecode_path(self, digest: str) -> str:
+        return os.path.join(self.BYTECODE_DIR, digest + ".pyc")
+
+    def _load_bytecode(self, digest: str):
+        if not self._bytecode_enabled():
+            return None
+        try:
+            with open(self._bytecode_path(digest), "rb") as bytecode_file:
+                # Bytecode written by another Python version is ignored, like Python does for __pycache__ files.
+                if bytecode_file.read(len(importlib.util.MAGIC_NUMBER)) != importlib.util.MAGIC_NUMBER:
+                    return None
+                return marshal.load(bytecode_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError):
+            _logger.warning("Ignoring unreadable script bytecode file %s", self._bytecode_path(digest))
+            return None
+
+    def _store_bytecode(self, digest: str, code):
+        if not self._bytecode_enabled():
+            return
+        path = self._bytecode_path(digest)
+        try:
+            os.makedirs(self.BYTECODE_DIR, exist_ok=True)
+            with open(path + ".tmp", "wb") as bytecode_file:
+                bytecode_file.write(importlib.util.MAGIC_NUMBER)
+                marshal.dump(code, bytecode_file)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            _logger.exception("Unable to write script bytecode file %s", path)
+
+    def _remove_bytecode(self, digest: str):
+        try:
+            os.remove(self._bytecode_path(digest))
+        except OSError:
+            pass
+
+    def __str__(self):
+        return "ScriptCodeCache(hits={}, misses={})".format(self.hits, self.misses)
+
+
 class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     """
     Encapsulates all data and behaviour for a script.
     """
 
+    # Compiled scripts, shared by all script runners
+    CODE_CACHE = ScriptCodeCache()
+
+    code = LazyBody()
+
     def __init__(self, description: str, source_code: str, path=None):
         AbstractAbbreviation.__init__(self)
         AbstractHotkey.__init__(self)
@@ -925,10 +1245,11 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is None:
             self.build_path()
 
-        self._persist_metadata()
-
-        with open(self.path, "w") as out_file:
-            out_file.write(self.code)
+        source = self.code
+        with OWN_WRITES.transaction():
+            self._persist_metadata()
+            OWN_WRITES.write_text(self.path, source)
+        LazyBody.CACHE.set(self, source, clean=True)
 
     def get_serializable(self):
         d = {
@@ -963,8 +1284,7 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             self._try_persist_metadata(cleaned_data)
 
     def _try_persist_metadata(self, serializable_data: dict):
-        with open(self.get_json_path(), "w") as json_file:
-                json.dump(serializable_data, json_file, indent=4)
+        OWN_WRITES.write_text(self.get_json_path(), compact_json(serializable_data))
 
     @staticmethod
     def _remove_non_serializable_store_entries(store: Store) -> dict:
@@ -994,26 +1314,40 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         else:
             return True
 
-    def load(self, parent: Folder):
+    def load(self, parent: Folder, data: dict=None):
+        """Load the script from its files. data is the already known content of the JSON file, if given."""
         self.parent = parent
 
-        with open(self.path, "r", encoding="UTF-8") as in_file:
-            self.code = in_file.read()
+        if LazyBody.CACHE.enabled():
+            # A changed source is detected by the code cache, when the script is compiled on its next execution.
+            LazyBody.CACHE.set(self, None)
+        else:
+            with open(self.path, "r", encoding="UTF-8") as in_file:
+                self.code = in_file.read()
+            Script.CODE_CACHE.invalidate(self.path, self.code)
 
-        if os.path.exists(self.get_json_path()):
+        if data is not None:
+            self.inject_json_data(data)
+        elif os.path.exists(self.get_json_path()):
             self.load_from_serialized()
         else:
+            record_json_file(self.get_json_path(), exists=False)
             self.description = os.path.basename(self.path)[:-3]
 
     def load_from_serialized(self, **kwargs):
+        record_json_file(self.get_json_path())
         try:
-            with open(self.get_json_path(), "r") as jsonFile:
+            with open(self.get_json_path(), "r", encoding="UTF-8") as jsonFile:
                 data = json.load(jsonFile)
                 self.inject_json_data(data)
         except Exception:
             _logger.exception("Error while loading json data for " + self.description)
             _logger.error("JSON data not loaded (or loaded incomplete)")
 
+    def get_code_object(self):
+        """Return the compiled script code."""
+        return Script.CODE_CACHE.get(self.code, self.path)
+
     def inject_json_data(self, data: dict):
         self.description = data["description"]
         self.store = Store(data["store"])
@@ -1030,18 +1364,22 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is not None:
             oldName = self.path
             oldJson = self.get_json_path()
+            LazyBody.CACHE.pin(self)
             self.build_path()
-            os.rename(oldName, self.path)
-            os.rename(oldJson, self.get_json_path())
+            with OWN_WRITES.transaction():
+                OWN_WRITES.rename(oldName, self.path)
+                OWN_WRITES.rename(oldJson, self.get_json_path())
         else:
             self.build_path()
 
     def remove_data(self):
         if self.path is not None:
-            if os.path.exists(self.path):
-                os.remove(self.path)
-            if os.path.exists(self.get_json_path()):
-                os.remove(self.get_json_path())
+            LazyBody.CACHE.pin(self)
+            with OWN_WRITES.transaction():
+                if OWN_WRITES.exists(self.path):
+                    OWN_WRITES.remove(self.path)
+                if OWN_WRITES.exists(self.get_json_path()):
+                    OWN_WRITES.remove(self.get_json_path())
 
     def copy(self, source_script):
         self.description = source_script.description
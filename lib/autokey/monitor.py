@@ -19,10 +19,12 @@
 import threading
 import logging
 import os.path
-import time
 
 from pyinotify import WatchManager, Notifier, EventsCodes, ProcessEvent
 
+from autokey.path_events import PathEventBatch
+from autokey.persistence import OWN_WRITES
+
 _logger = logging.getLogger("inotify")
 
 m = EventsCodes.OP_FLAGS
@@ -43,30 +45,23 @@ class Processor(ProcessEvent):
         _logger.debug("Reporting %s event at %s", event.maskname, path)
         return path
     
+    def __addEvent(self, event, removed):
+        self.monitor.batch.add(self.__getEventPath(event), removed, event.dir)
+
     def process_IN_MOVED_TO(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        self.__addEvent(event, False)
     
     def process_IN_CREATE(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        self.__addEvent(event, False)
         
     def process_IN_MODIFY(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        self.__addEvent(event, False)
         
     def process_IN_DELETE(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():        
-            self.listener.path_removed(path)
+        self.__addEvent(event, True)
             
     def process_IN_MOVED_FROM(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_removed(path)
+        self.__addEvent(event, True)
 
 
 class FileMonitor(threading.Thread):
@@ -78,26 +73,13 @@ class FileMonitor(threading.Thread):
         self.notifier = Notifier(self.manager, self.__p)
         self.event = threading.Event()
         self.setDaemon(True)
-        self.watches = []
-        self.__isSuspended = False
-        
-    def suspend(self):
-        self.__isSuspended = True
-    
-    def unsuspend(self):
-        t = threading.Thread(target=self.__unsuspend)
-        t.start()
-        
-    def __unsuspend(self):
-        time.sleep(1.5)
-        self.__isSuspended = False
-        for watch in self.watches:
-            if not os.path.exists(watch):
-                _logger.debug("Removed stale watch on %s", watch)
-                self.watches.remove(watch)
-        
-    def is_suspended(self):
-        return self.__isSuspended
+        self.watches = set()
+        # Events are collected and passed to listener.path_events() in batches, see autokey.path_events. Events
+        # caused by AutoKey writing its own files are left out.
+        self.listener = listener
+        self.batch = PathEventBatch()
+        self.events_applied = 0
+        self.batches_applied = 0
         
     def has_watch(self, path):
         return path in self.watches
@@ -105,28 +87,56 @@ class FileMonitor(threading.Thread):
     def add_watch(self, path):
         _logger.debug("Adding watch for %s", path)
         self.manager.add_watch(path, MASK, self.__p)
-        self.watches.append(path)
+        self.watches.add(path)
         
     def remove_watch(self, path):
         _logger.debug("Removing watch for %s", path)
         wd = self.manager.get_wd(path)
         self.manager.rm_watch(wd, True)
-        self.watches.remove(path)
-        for i in range(len(self.watches)):
-            try:
-                if self.watches[i].startswith(path):
-                    self.watches.remove(self.watches[i])
-            except IndexError:
-                break       
+        self.watches = {watch for watch in self.watches if not watch.startswith(path)}
         
+    @property
+    def events_received(self):
+        return self.batch.received
+
     def run(self):        
         while not self.event.isSet():
-            self.notifier.process_events()
-            if self.notifier.check_events(1000):
+            timeout = self.batch.wait_time()
+            if self.notifier.check_events(1000 if timeout is None else max(1, int(timeout * 1000))):
                 self.notifier.read_events()
+                self.notifier.process_events()
+            if self.batch.due():
+                self.__applyBatch()
         
-        _logger.info("Shutting down file monitor")
+        self.__applyBatch()
+        _logger.info("Shutting down file monitor, %d events received, %d applied in %d batches, %d own changes ignored",
+                     self.events_received, self.events_applied, self.batches_applied, self.batch.ignored)
         self.notifier.stop()        
+
+    def __applyBatch(self):
+        received = self.batch.pending
+        ignored = self.batch.ignored
+        # Own changes are recognised by comparing the disk with the state they lead to.
+        OWN_WRITES.flush()
+        events = self.batch.take(OWN_WRITES.is_echo)
+        if received:
+            self.__removeStaleWatches()
+        if not events:
+            return
+        _logger.debug("Applying %d events, coalesced from %d received, %d own changes ignored",
+                      len(events), received, self.batch.ignored - ignored)
+        self.events_applied += len(events)
+        self.batches_applied += 1
+        try:
+            self.listener.path_events(events)
+        except Exception:
+            _logger.exception("Error while applying file system events")
+
+    def __removeStaleWatches(self):
+        stale = {watch for watch in self.watches if not os.path.exists(watch)}
+        if stale:
+            _logger.debug("Removed stale watches on %s", ", ".join(sorted(stale)))
+            self.watches = self.watches - stale
         
     def stop(self):
         self.event.set()
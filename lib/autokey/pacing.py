@@ -0,0 +1,197 @@
+"""
+Output pacing for the X interface.
+
+Some applications (for example VirtualBox or krdc) drop or reorder keys when they arrive too quickly. Instead of
+slowing down all output, the pacing engine selects a PacingProfile for the target window and only the slow profiles
+insert delays. Delays never block the X event thread: The PacingQueue keeps input handling and output in separate
+lanes, so a pending delay in the output lane only holds back further output, while key presses typed by the user
+are still processed.
+"""
+
+import collections
+import itertools
+import logging
+import re
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from autokey.interface import WindowInfo
+
+logger = logging.getLogger("interface").getChild("pacing")
+
+INPUT_LANE = "input"
+OUTPUT_LANE = "output"
+
+PacingProfile = typing.NamedTuple("PacingProfile", [
+    ("name", str),
+    ("window_regex", typing.Optional[typing.Pattern]),
+    # Pause before sending a key that was sent recently, giving the target the chance to process the previous one.
+    ("repeated_key_delay", float),
+    # Time the target application gets to request the clipboard or selection content, before it is restored
+    ("clipboard_restore_delay", float),
+    ("selection_restore_delay", float),
+])
+
+DEFAULT_PROFILE = PacingProfile("default", None, 0.0, 0.2, 1.0)
+# The QT4 workaround profile, used for the windows matched by the "workAroundApps" setting
+SLOW_PROFILE = PacingProfile("slow", None, 0.0125, 0.2, 1.0)
+
+
+def profile_from_dict(data: dict) -> PacingProfile:
+    """
+    Create a profile from its serialised form, as stored in the "pacingProfiles" setting. Missing delays default
+    to the values of the default profile.
+    """
+    return PacingProfile(
+        data["name"],
+        re.compile(data["windowRegex"]),
+        data.get("repeatedKeyDelay", DEFAULT_PROFILE.repeated_key_delay),
+        data.get("clipboardRestoreDelay", DEFAULT_PROFILE.clipboard_restore_delay),
+        data.get("selectionRestoreDelay", DEFAULT_PROFILE.selection_restore_delay),
+    )
+
+
+class PacingEngine:
+    """
+    Selects the pacing profile for a window and keeps throughput statistics per profile.
+    """
+
+    # A mouse click might change the active window. The switch happens asynchronously, so give it some time, before
+    # querying the window information.
+    MOUSE_CLICK_DELAY = 0.005
+
+    def __init__(self):
+        self._configuration = None
+        self._profiles = []  # type: typing.List[PacingProfile]
+        self._slow_everywhere = False
+        # The last (WindowInfo, profile) decision. Titles change all the time, so older windows are not kept.
+        self._last_decision = None  # type: typing.Optional[typing.Tuple[WindowInfo, PacingProfile]]
+        self._lock = threading.Lock()
+        # profile name -> [sent characters, seconds spent sending]
+        self._throughput = collections.defaultdict(lambda: [0, 0.0])  # type: typing.Dict[str, typing.List]
+
+    def configure(self, workaround_app_regex: str, slow_everywhere: bool, profiles: typing.List[dict]):
+        """
+        Update the profiles from the configuration. Cheap, if nothing changed, so it can be called before every
+        output operation.
+        """
+        configuration = (workaround_app_regex, slow_everywhere, repr(profiles))
+        if configuration == self._configuration:
+            return
+        new_profiles = []
+        for data in profiles:
+            try:
+                new_profiles.append(profile_from_dict(data))
+            except (KeyError, TypeError, re.error):
+                logger.exception("Ignoring invalid pacing profile: %r", data)
+        new_profiles.append(SLOW_PROFILE._replace(window_regex=re.compile(workaround_app_regex)))
+        with self._lock:
+            self._configuration = configuration
+            self._profiles = new_profiles
+            self._slow_everywhere = slow_everywhere
+            self._last_decision = None
+
+    def profile_for(self, window_info: "WindowInfo") -> PacingProfile:
+        """
+        Return the first profile whose window regex matches the window title or class, or the default profile.
+        """
+        if self._slow_everywhere:
+            return SLOW_PROFILE
+        last_decision = self._last_decision
+        if last_decision is not None and last_decision[0] == window_info:
+            return last_decision[1]
+        profiles = self._profiles
+        profile = DEFAULT_PROFILE
+        for candidate in profiles:
+            if candidate.window_regex.match(window_info.wm_title) or candidate.window_regex.match(window_info.wm_class):
+                profile = candidate
+                break
+        with self._lock:
+            # Not stored, if configure() replaced the profiles in the meantime
+            if self._profiles is profiles:
+                self._last_decision = (window_info, profile)
+        return profile
+
+    def record_sent(self, profile: PacingProfile, characters: int, seconds: float):
+        """Account characters sent to a window using the given profile."""
+        with self._lock:
+            statistics = self._throughput[profile.name]
+            statistics[0] += characters
+            statistics[1] += seconds
+
+    def throughput(self) -> typing.Dict[str, float]:
+        """Return the measured throughput in characters per second for each used profile."""
+        with self._lock:
+            return {
+                name: characters / seconds if seconds else float("inf")
+                for name, (characters, seconds) in self._throughput.items()
+            }
+
+    def __str__(self):
+        return "PacingEngine({})".format(", ".join(
+            "{}: {:.0f} chars/s".format(name, rate) for name, rate in sorted(self.throughput().items())
+        ))
+
+
+class _QueueItem:
+
+    __slots__ = ("sequence", "method", "args", "delay", "not_before")
+
+    def __init__(self, sequence: int, method: typing.Callable, args: tuple, delay: float):
+        self.sequence = sequence
+        self.method = method
+        self.args = args
+        self.delay = delay
+        self.not_before = None  # type: typing.Optional[float]
+
+
+class PacingQueue:
+    """
+    Work queue of the X event thread, with one FIFO lane per kind of work.
+
+    An item may carry a delay. The delay starts when the item reaches the head of its lane, i.e. after the previous
+    item of the same lane was taken by the (single) consumer, and only holds back the items in that lane. Items
+    ready in different lanes are returned in the order they were put.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._lanes = {INPUT_LANE: collections.deque(), OUTPUT_LANE: collections.deque()}
+        self._sequence = itertools.count()
+
+    def put(self, method: typing.Callable, args: tuple, lane: str=INPUT_LANE, delay: float=0.0):
+        with self._condition:
+            self._lanes[lane].append(_QueueItem(next(self._sequence), method, args, delay))
+            self._condition.notify()
+
+    def put_front(self, method: typing.Callable, args: tuple, lane: str=INPUT_LANE, delay: float=0.0):
+        """Put an item at the head of the lane. Used to continue partially done work after a delay."""
+        with self._condition:
+            self._lanes[lane].appendleft(_QueueItem(next(self._sequence), method, args, delay))
+            self._condition.notify()
+
+    def get(self) -> typing.Tuple[typing.Callable, tuple]:
+        """Block until an item is ready and return its method and arguments."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                ready = None
+                wake_up_at = None
+                for lane in self._lanes.values():
+                    if not lane:
+                        continue
+                    head = lane[0]
+                    if head.not_before is None:
+                        head.not_before = now + head.delay
+                    if head.not_before <= now:
+                        if ready is None or head.sequence < ready[0].sequence:
+                            ready = head, lane
+                    elif wake_up_at is None or head.not_before < wake_up_at:
+                        wake_up_at = head.not_before
+                if ready is not None:
+                    item, lane = ready
+                    lane.popleft()
+                    return item.method, item.args
+                self._condition.wait(None if wake_up_at is None else wake_up_at - now)
@@ -0,0 +1,119 @@
+"""
+Coalescing of file system events reported by the FileMonitor.
+
+Editors and tools like git create, modify and remove the same files several times in quick succession. Instead of
+applying every event on its own, the events are collected until no new event arrived for QUIET_PERIOD seconds, or
+at most MAX_DELAY seconds after the first one. The batch then contains at most one event per path, and events below
+a directory that has an event itself are dropped, because loading or removing the directory covers its content.
+
+Events caused by AutoKey writing its own files are recognised by autokey.persistence and left out of the batch.
+"""
+
+import collections
+import os.path
+import time
+import typing
+
+# States of a path in the batch
+CHANGED = "changed"
+REMOVED = "removed"
+# Removed and created again, e.g. by editors that save by writing a new file and renaming it
+REPLACED = "replaced"
+
+
+class PathEventBatch:
+
+    QUIET_PERIOD = 0.5
+    MAX_DELAY = 3.0
+
+    def __init__(self, quiet_period: float=QUIET_PERIOD, max_delay: float=MAX_DELAY):
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        # path -> (state, is_directory), in the order the paths were first reported
+        self._events = collections.OrderedDict()  # type: typing.Dict[str, typing.Tuple[str, bool]]
+        self._first = None  # type: typing.Optional[float]
+        self._last = None  # type: typing.Optional[float]
+        self.received = 0
+        # Events received since the last take()
+        self.pending = 0
+        # Paths left out by take(), because their change was already known
+        self.ignored = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, path: str, removed: bool, is_directory: bool=False, now: float=None):
+        now = time.monotonic() if now is None else now
+        self.received += 1
+        self.pending += 1
+        if self._first is None:
+            self._first = now
+        self._last = now
+
+        state, _ = self._events.get(path, (None, is_directory))
+        if removed:
+            state = REMOVED
+        elif state in (REMOVED, REPLACED):
+            state = REPLACED
+        else:
+            state = CHANGED
+        self._events[path] = (state, is_directory)
+
+    def wait_time(self, now: float=None) -> typing.Optional[float]:
+        """Seconds until the batch is due, or None if it is empty."""
+        if not self._events:
+            return None
+        now = time.monotonic() if now is None else now
+        due = min(self._last + self.quiet_period, self._first + self.max_delay)
+        return max(0.0, due - now)
+
+    def due(self, now: float=None) -> bool:
+        return self.wait_time(now) == 0.0
+
+    def take(self, ignore: typing.Callable[[str, bool], bool]=None) -> typing.List[typing.Tuple[str, bool]]:
+        """
+        Return the collected events as (path, removed) pairs and start a new batch. Directory events come first,
+        parents before their subdirectories, followed by the file events in the order they were reported.
+        ignore(path, removed) tells if the final state of a path is known already, like persistence.OwnWrites.is_echo().
+        """
+        events, self._events = self._events, collections.OrderedDict()
+        self._first = self._last = None
+        self.pending = 0
+
+        if ignore is not None:
+            kept = collections.OrderedDict()
+            for path, (state, is_directory) in events.items():
+                if ignore(path, state == REMOVED):
+                    self.ignored += 1
+                else:
+                    kept[path] = (state, is_directory)
+            events = kept
+
+        directories = {path for path, (_, is_directory) in events.items() if is_directory}
+        kept = [
+            (path, state, is_directory) for path, (state, is_directory) in events.items()
+            if not self._below(path, directories)
+        ]
+        kept.sort(key=lambda event: (not event[2], path_depth(event[0]) if event[2] else 0))
+
+        result = []
+        for path, state, _ in kept:
+            if state != CHANGED:
+                result.append((path, True))
+            if state != REMOVED:
+                result.append((path, False))
+        return result
+
+    @staticmethod
+    def _below(path: str, directories: typing.Set[str]) -> bool:
+        parent = os.path.dirname(path)
+        while parent and parent != path:
+            if parent in directories:
+                return True
+            path, parent = parent, os.path.dirname(parent)
+        return False
+
+
+def path_depth(path: str) -> int:
+    return path.rstrip(os.sep).count(os.sep)
+
@@ -0,0 +1,45 @@
+"""
+Lookup of folders and items by file path, used to route file system events to the affected model object.
+"""
+
+import typing
+
+
+class PathIndex:
+    """
+    Maps paths to model objects, using key_function to get the path of an object. Objects without a path are not
+    indexed. The index remembers the path each object was added with, so an object can still be removed after its
+    path changed, for example after it was renamed or moved.
+    """
+
+    def __init__(self, key_function: typing.Callable[[typing.Any], typing.Optional[str]]):
+        self._key_function = key_function
+        self._objects = {}  # type: typing.Dict[str, typing.Any]
+        # id(object) -> the path the object is indexed with
+        self._paths = {}  # type: typing.Dict[int, str]
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get(self, path: str):
+        """Return the object stored at the given path, or None."""
+        return self._objects.get(path)
+
+    def add(self, entry):
+        self.remove(entry)
+        path = self._key_function(entry)
+        if path is not None:
+            self._objects[path] = entry
+            self._paths[id(entry)] = path
+
+    def remove(self, entry):
+        path = self._paths.pop(id(entry), None)
+        # Another object might have taken over the path in the meantime.
+        if path is not None and self._objects.get(path) is entry:
+            del self._objects[path]
+
+    def rebuild(self, entries: typing.Iterable):
+        self._objects.clear()
+        self._paths.clear()
+        for entry in entries:
+            self.add(entry)
@@ -0,0 +1,301 @@
+"""
+Writes of the folder, phrase, script and settings files.
+
+All file system changes of AutoKey go through OWN_WRITES. Files are written to a temporary file in the target
+directory, which then replaces the target, so a crash never leaves a half-written file behind. The changes are
+performed in order by a background thread, so the UI doesn't wait for the disk. Changes made inside a transaction()
+are handed to the thread together, when the outermost transaction ends, and repeated writes of the same file are
+written once. With the "fsyncWrites" setting enabled, files and the changed directories are synced to disk before
+a batch is reported as written.
+
+Before a change is queued, the resulting state of the path is recorded: a hash of the written content, DIRECTORY or
+ABSENT. File system events reporting such a change back are recognised by comparing the record with the current
+state of the path, so they are ignored, while any other change of the same path is still applied. A record is kept
+until an event shows that the path was changed by someone else.
+"""
+
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import os.path
+import queue
+import shutil
+import threading
+import typing
+
+_logger = logging.getLogger("persistence")
+
+# Markers used instead of a content hash
+DIRECTORY = "directory"
+ABSENT = "absent"
+
+# Appended to the target path to get the temporary file. Never used for configuration files.
+TEMPORARY_SUFFIX = ".autokey-tmp"
+
+# Kinds of queued changes
+WRITE = "write"
+MAKE_DIRECTORY = "mkdir"
+RENAME = "rename"
+REMOVE = "remove"
+
+Operation = typing.Tuple[str, str, typing.Optional[str]]
+
+
+def compact_json(data) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+class OwnWrites:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # path -> content hash, DIRECTORY or ABSENT
+        self._records = {}  # type: typing.Dict[str, str]
+        # path -> text of the queued writes, not written yet
+        self._texts = {}  # type: typing.Dict[str, str]
+        # Changes of the current transaction, per thread
+        self._transactions = threading.local()
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._worker = None  # type: typing.Optional[threading.Thread]
+        self.fsync = True
+        self.batches_written = 0
+        self.files_written = 0
+        self.bytes_written = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8", "surrogateescape")).hexdigest()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Collect the changes made inside the block and queue them together. Changes made before an exception are
+        queued as well, as the model objects already reflect them.
+        """
+        if getattr(self._transactions, "operations", None) is not None:
+            yield
+            return
+        self._transactions.operations = []
+        try:
+            yield
+        finally:
+            operations, self._transactions.operations = self._transactions.operations, None
+            self._submit(operations)
+
+    def write_text(self, path: str, text: str):
+        with self._lock:
+            self._records[path] = self.digest(text)
+            self._texts[path] = text
+        self._add((WRITE, path, text))
+
+    def make_directory(self, path: str):
+        with self._lock:
+            self._records[path] = DIRECTORY
+        self._add((MAKE_DIRECTORY, path, None))
+
+    def rename(self, old_path: str, new_path: str):
+        with self._lock:
+            record = self._records.get(old_path)
+            if record is None or record == ABSENT:
+                record = DIRECTORY if os.path.isdir(old_path) else self._file_digest(old_path)
+            # Queued writes move along with the file or directory.
+            prefix = old_path + os.sep
+            texts = {
+                new_path + path[len(old_path):]: text for path, text in self._texts.items()
+                if path == old_path or path.startswith(prefix)
+            }
+            self._forget(old_path)
+            self._texts.update(texts)
+            self._records[old_path] = ABSENT
+            if record is not None:
+                self._records[new_path] = record
+        self._add((RENAME, old_path, new_path))
+
+    def remove(self, path: str):
+        """Remove a file or a directory tree."""
+        with self._lock:
+            self._forget(path)
+            self._records[path] = ABSENT
+        self._add((REMOVE, path, None))
+
+    def read_text(self, path: str) -> str:
+        """Read a file, including the queued changes. Raises OSError, if the file can't be read."""
+        with self._lock:
+            text = self._texts.get(path)
+        if text is not None:
+            return text
+        self.flush()
+        with open(path, "r", encoding="UTF-8") as in_file:
+            return in_file.read()
+
+    def exists(self, path: str) -> bool:
+        """Tell if the path exists, once the queued changes are written."""
+        with self._lock:
+            record = self._records.get(path)
+            if record == ABSENT or self._below_removed(path):
+                return False
+        return record is not None or os.path.exists(path)
+
+    def flush(self):
+        """Wait until all queued changes are written."""
+        if self._worker is not None:
+            self._queue.join()
+
+    def is_echo(self, path: str, removed: bool) -> bool:
+        """Tell if the current state of the path is the one written by AutoKey."""
+        if path.endswith(TEMPORARY_SUFFIX):
+            return True
+        with self._lock:
+            record = self._records.get(path)
+            if removed:
+                echo = not os.path.lexists(path) and (record == ABSENT or self._below_removed(path))
+            elif record == DIRECTORY:
+                echo = os.path.isdir(path)
+            elif record is not None and record != ABSENT:
+                echo = self._file_digest(path) == record
+            else:
+                echo = False
+            if not echo:
+                self._records.pop(path, None)
+            return echo
+
+    def _forget(self, directory: str):
+        """Drop the records of the path and the paths inside it."""
+        prefix = directory + os.sep
+        for path in [path for path in self._records if path.startswith(prefix)]:
+            del self._records[path]
+        for path in [path for path in self._texts if path == directory or path.startswith(prefix)]:
+            del self._texts[path]
+
+    def _below_removed(self, path: str) -> bool:
+        parent = os.path.dirname(path)
+        while parent and parent != path:
+            if self._records.get(parent) == ABSENT:
+                return True
+            path, parent = parent, os.path.dirname(parent)
+        return False
+
+    @classmethod
+    def _file_digest(cls, path: str) -> typing.Optional[str]:
+        try:
+            with open(path, "r", encoding="UTF-8", errors="surrogateescape") as in_file:
+                return cls.digest(in_file.read())
+        except OSError:
+            return None
+
+    def _add(self, operation: Operation):
+        operations = getattr(self._transactions, "operations", None)
+        if operations is None:
+            self._submit([operation])
+        else:
+            operations.append(operation)
+
+    def _submit(self, operations: typing.List[Operation]):
+        if not operations:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="persistence", daemon=True)
+                self._worker.start()
+        self._queue.put(operations)
+
+    def _run(self):
+        while True:
+            operations = self._queue.get()
+            try:
+                self._perform(operations)
+            except Exception:
+                _logger.exception("Error while writing the configuration")
+            finally:
+                self._queue.task_done()
+
+    def _perform(self, operations: typing.List[Operation]):
+        # Writes are collected until another kind of change, so that each file is written once.
+        writes = collections.OrderedDict()  # type: typing.Dict[str, str]
+        directories = set()
+        files = size = 0
+        for kind, path, argument in operations:
+            if kind == WRITE:
+                writes.pop(path, None)
+                writes[path] = argument
+                continue
+            written_files, written_size = self._write_files(writes, directories)
+            files += written_files
+            size += written_size
+            writes.clear()
+            try:
+                if kind == MAKE_DIRECTORY:
+                    os.makedirs(path, exist_ok=True)
+                elif kind == RENAME:
+                    os.rename(path, argument)
+                    directories.add(os.path.dirname(argument))
+                elif os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.lexists(path):
+                    os.remove(path)
+            except OSError:
+                _logger.exception("Unable to %s %s", kind, path)
+            directories.add(os.path.dirname(path))
+        written_files, written_size = self._write_files(writes, directories)
+        files += written_files
+        size += written_size
+
+        if self.fsync:
+            for directory in directories:
+                self._sync_directory(directory)
+        self.batches_written += 1
+        self.files_written += files
+        self.bytes_written += size
+        _logger.debug("Wrote %d files, %d bytes in %d changes", files, size, len(operations))
+
+    def _write_files(self, writes: typing.Dict[str, str], directories: typing.Set[str]) -> typing.Tuple[int, int]:
+        files = size = 0
+        for path, text in writes.items():
+            temporary_path = path + TEMPORARY_SUFFIX
+            try:
+                with open(temporary_path, "w", encoding="UTF-8") as out_file:
+                    out_file.write(text)
+                    out_file.flush()
+                    if self.fsync:
+                        os.fsync(out_file.fileno())
+                    size += os.fstat(out_file.fileno()).st_size
+                os.replace(temporary_path, path)
+            except OSError:
+                _logger.exception("Unable to write %s", path)
+                with contextlib.suppress(OSError):
+                    os.remove(temporary_path)
+                continue
+            finally:
+                with self._lock:
+                    if self._texts.get(path) is text:
+                        del self._texts[path]
+            files += 1
+            directories.add(os.path.dirname(path))
+        return files, size
+
+    @staticmethod
+    def _sync_directory(directory: str):
+        try:
+            descriptor = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(descriptor)
+
+    def __str__(self):
+        return "OwnWrites(batches={}, files={}, bytes={}, records={})".format(
+            self.batches_written, self.files_written, self.bytes_written, len(self._records)
+        )
+
+
+OWN_WRITES = OwnWrites()
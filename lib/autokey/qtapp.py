@@ -25,7 +25,6 @@ import logging
 import logging.handlers
 import subprocess
 import queue
-import time
 import dbus
 import argparse
 from typing import NamedTuple, Iterable
@@ -232,8 +231,16 @@ class Application(QApplication):
         configManager.toggleServiceHotkey.set_closure(self.toggle_service)
         configManager.configHotkey.set_closure(self.show_configure_signal.emit)
 
-    def config_altered(self, persistGlobal):
-        self.configManager.config_altered(persistGlobal)
+    def config_altered(self, persistGlobal, modifiedItem=None):
+        if modifiedItem is None:
+            self.configManager.config_altered(persistGlobal)
+        else:
+            self.configManager.item_modified(modifiedItem, persistGlobal)
+        self.notifier.create_assign_context_menu()
+
+    def items_changed(self, persistGlobal, added=(), removed=(), modified=()):
+        """Update the configuration after folders, phrases or scripts were added, removed or moved in the GUI."""
+        self.configManager.items_changed(added, removed, modified, persistGlobal)
         self.notifier.create_assign_context_menu()
 
     def hotkey_created(self, item):
@@ -244,15 +251,8 @@ class Application(QApplication):
         logging.debug("Removed hotkey: %r %s", item.modifiers, item.hotKey)
         self.service.mediator.interface.ungrab_hotkey(item)
 
-    def path_created_or_modified(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_created_or_modified(path)
-        if changed and self.configWindow is not None:
-            self.configWindow.config_modified()
-
-    def path_removed(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_removed(path)
+    def path_events(self, events):
+        changed = self.configManager.apply_path_events(events)
         if changed and self.configWindow is not None:
             self.configWindow.config_modified()
 
@@ -285,8 +285,8 @@ class Application(QApplication):
         logging.info("Shutting down")
         self.closeAllWindows()
         self.notifier.hide()
-        self.service.shutdown()
         self.monitor.stop()
+        self.service.shutdown()
         self.quit()
         os.remove(common.LOCK_FILE)  # TODO: maybe use atexit to remove the lock/pid file?
         logging.debug("All shutdown tasks complete... quitting")
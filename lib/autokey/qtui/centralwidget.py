@@ -24,6 +24,7 @@ from PyQt5.QtWidgets import QListWidget, QListWidgetItem
 from autokey import iomediator
 from autokey import model
 from autokey import configmanager as cm
+from autokey.persistence import OWN_WRITES
 
 from . import common as ui_common
 from . import autokey_treewidget as ak_tree
@@ -135,13 +136,12 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
                     "The name can't be empty.",
                     None,
                     self.window()):
-                self.window().app.monitor.suspend()
-                self.stack.currentWidget().set_item_title(newText)
-                self.stack.currentWidget().rebuild_item_path()
+                with OWN_WRITES.transaction():
+                    self.stack.currentWidget().set_item_title(newText)
+                    self.stack.currentWidget().rebuild_item_path()
 
-                persistGlobal = self.stack.currentWidget().save()
-                self.window().app.monitor.unsuspend()
-                self.window().app.config_altered(persistGlobal)
+                    persistGlobal = self.stack.currentWidget().save()
+                self.window().app.config_altered(persistGlobal, self.__extractData(item))
 
                 self.treeWidget.sortItems(0, Qt.AscendingOrder)
             else:
@@ -184,8 +184,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         message_box.button(QMessageBox.No).setText("Create elsewhere")  # TODO: i18n
         result = message_box.exec_()
 
-        self.window().app.monitor.suspend()
-
         if result == QMessageBox.Yes:
             logger.debug("User creates a new top-level folder.")
             self.__createFolder(None)
@@ -203,12 +201,10 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
                 new_item = ak_tree.FolderWidgetItem(None, folder)
                 self.treeWidget.addTopLevelItem(new_item)
                 self.configManager.folders.append(folder)
-                self.window().app.config_altered(True)
+                self.window().app.items_changed(True, added=[folder])
 
-            self.window().app.monitor.unsuspend()
         else:
             logger.debug("User canceled top-level folder creation.")
-            self.window().app.monitor.unsuspend()
 
     def on_new_folder(self):
         parent_item = self.treeWidget.selectedItems()[0]
@@ -217,7 +213,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
     def __createFolder(self, parent_item):
         folder = model.Folder("New Folder")
         new_item = ak_tree.FolderWidgetItem(parent_item, folder)
-        self.window().app.monitor.suspend()
 
         if parent_item is not None:
             parentFolder = self.__extractData(parent_item)
@@ -227,7 +222,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
             self.configManager.folders.append(folder)
 
         folder.persist()
-        self.window().app.monitor.unsuspend()
 
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
         self.treeWidget.setCurrentItem(new_item)
@@ -235,7 +229,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         self.on_rename()
 
     def on_new_phrase(self):
-        self.window().app.monitor.suspend()
         tree_widget = self.treeWidget  # type: ak_tree.AkTreeWidget
         parent_item = tree_widget.selectedItems()[0]  # type: ak_tree.ItemWidgetType
         parent = self.__extractData(parent_item)
@@ -245,8 +238,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         parent.add_item(phrase)
         phrase.persist()
 
-        self.window().app.monitor.unsuspend()
-
         tree_widget.sortItems(0, Qt.AscendingOrder)
         tree_widget.setCurrentItem(new_item)
         parent_item.setSelected(False)
@@ -254,7 +245,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         self.on_rename()
 
     def on_new_script(self):
-        self.window().app.monitor.suspend()
         tree_widget = self.treeWidget  # type: ak_tree.AkTreeWidget
         parent_item = tree_widget.selectedItems()[0]  # type: ak_tree.ItemWidgetType
         parent = self.__extractData(parent_item)
@@ -264,7 +254,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         parent.add_item(script)
         script.persist()
 
-        self.window().app.monitor.unsuspend()
         tree_widget.sortItems(0, Qt.AscendingOrder)
         tree_widget.setCurrentItem(new_item)
         parent_item.setSelected(False)
@@ -304,49 +293,47 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
             new_item = ak_tree.ScriptWidgetItem(parent_item, new_obj)
 
         parent.add_item(new_obj)
-        self.window().app.monitor.suspend()
         new_obj.persist()
 
-        self.window().app.monitor.unsuspend()
         tree_widget.sortItems(0, Qt.AscendingOrder)
         tree_widget.setCurrentItem(new_item)
         parent_item.setSelected(False)
         self.on_treeWidget_itemSelectionChanged()
-        self.window().app.config_altered(False)
+        self.window().app.items_changed(False, added=[new_obj])
 
     def on_cut(self):
         self.cutCopiedItems = self.__getSelection()
-        self.window().app.monitor.suspend()
 
         source_items = self.treeWidget.selectedItems()
         result = [f for f in source_items if f.parent() not in source_items]
-        for item in result:
-            self.__removeItem(item)
+        with OWN_WRITES.transaction():
+            for item in result:
+                self.__removeItem(item)
 
-        self.window().app.monitor.unsuspend()
-        self.window().app.config_altered(False)
+        self.window().app.items_changed(False, removed=[self.__extractData(item) for item in result])
 
     def on_paste(self):
         parent_item = self.treeWidget.selectedItems()[0]
         parent = self.__extractData(parent_item)
-        self.window().app.monitor.suspend()
 
         new_items = []
-        for item in self.cutCopiedItems:
-            if isinstance(item, model.Folder):
-                new_item = ak_tree.FolderWidgetItem(parent_item, item)
-                ak_tree.WidgetItemFactory.process_folder(new_item, item)
-                parent.add_folder(item)
-            elif isinstance(item, model.Phrase):
-                new_item = ak_tree.PhraseWidgetItem(parent_item, item)
-                parent.add_item(item)
-            else:
-                new_item = ak_tree.ScriptWidgetItem(parent_item, item)
-                parent.add_item(item)
-
-            item.persist()
-
-            new_items.append(new_item)
+        pasted_items = self.cutCopiedItems
+        with OWN_WRITES.transaction():
+            for item in pasted_items:
+                if isinstance(item, model.Folder):
+                    new_item = ak_tree.FolderWidgetItem(parent_item, item)
+                    ak_tree.WidgetItemFactory.process_folder(new_item, item)
+                    parent.add_folder(item)
+                elif isinstance(item, model.Phrase):
+                    new_item = ak_tree.PhraseWidgetItem(parent_item, item)
+                    parent.add_item(item)
+                else:
+                    new_item = ak_tree.ScriptWidgetItem(parent_item, item)
+                    parent.add_item(item)
+
+                item.persist()
+
+                new_items.append(new_item)
 
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
         self.treeWidget.setCurrentItem(new_items[-1])
@@ -354,12 +341,10 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         self.cutCopiedItems = []
         for item in new_items:
             item.setSelected(True)
-        self.window().app.monitor.unsuspend()
-        self.window().app.config_altered(False)
+        self.window().app.items_changed(False, added=pasted_items)
 
     def on_delete(self):
         widget_items = self.treeWidget.selectedItems()
-        self.window().app.monitor.suspend()
 
         if len(widget_items) == 1:
             widget_item = widget_items[0]
@@ -380,12 +365,12 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         result = QMessageBox.question(self.window(), header, msg, QMessageBox.Yes | QMessageBox.No)
 
         if result == QMessageBox.Yes:
-            for widget_item in widget_items:
-                self.__removeItem(widget_item)
+            with OWN_WRITES.transaction():
+                for widget_item in widget_items:
+                    self.__removeItem(widget_item)
 
-        self.window().app.monitor.unsuspend()
         if result == QMessageBox.Yes:
-            self.window().app.config_altered(False)
+            self.window().app.items_changed(False, removed=[self.__extractData(item) for item in widget_items])
 
     def on_rename(self):
         widget_item = self.treeWidget.selectedItems()[0]
@@ -394,16 +379,14 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
     def on_save(self):
         logger.info("User requested file save.")
         if self.stack.currentWidget().validate():
-            self.window().app.monitor.suspend()
             persist_global = self.stack.currentWidget().save()
-            self.window().save_completed(persist_global)
+            self.window().save_completed(persist_global, self.__extractData(self.treeWidget.selectedItems()[0]))
             self.set_dirty(False)
 
             item = self.treeWidget.selectedItems()[0]
             item.update()
             self.treeWidget.update()
             self.treeWidget.sortItems(0, Qt.AscendingOrder)
-            self.window().app.monitor.unsuspend()
             return False
 
         return True
@@ -442,25 +425,23 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         # Filter out any child objects that belong to a parent already in the list
         result = [f for f in sourceItems if f.parent() not in sourceItems]
 
-        self.window().app.monitor.suspend()
+        with OWN_WRITES.transaction():
+            for source in result:
+                self.__removeItem(source)
+                source_model_item = self.__extractData(source)
 
-        for source in result:
-            self.__removeItem(source)
-            source_model_item = self.__extractData(source)
-
-            if isinstance(source_model_item, model.Folder):
-                target_model_item.add_folder(source_model_item)
-                self.__moveRecurseUpdate(source_model_item)
-            else:
-                target_model_item.add_item(source_model_item)
-                source_model_item.path = None
-                source_model_item.persist()
+                if isinstance(source_model_item, model.Folder):
+                    target_model_item.add_folder(source_model_item)
+                    self.__moveRecurseUpdate(source_model_item)
+                else:
+                    target_model_item.add_item(source_model_item)
+                    source_model_item.path = None
+                    source_model_item.persist()
 
-            target.addChild(source)
+                target.addChild(source)
 
-        self.window().app.monitor.unsuspend()
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
-        self.window().app.config_altered(True)
+        self.window().app.items_changed(True, modified=[self.__extractData(source) for source in result])
 
     def __moveRecurseUpdate(self, folder):
         folder.path = None
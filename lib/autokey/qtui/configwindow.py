@@ -222,10 +222,10 @@ class ConfigWindow(*autokey.qtui.common.inherits_from_ui_file_with_name("mainwin
     def set_redo_available(self, state):
         self.action_redo.setEnabled(state)
 
-    def save_completed(self, persist_global):
+    def save_completed(self, persist_global, item=None):
         _logger.debug("Saving completed. persist_global: {}".format(persist_global))
         self.action_save.setEnabled(False)
-        self.app.config_altered(persist_global)
+        self.app.config_altered(persist_global, item)
         
     def cancel_record(self):
         if self.action_record_script.isChecked():
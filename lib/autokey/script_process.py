@@ -0,0 +1,326 @@
+"""
+Runs user scripts in worker processes instead of the AutoKey daemon.
+
+A script executed in the daemon shares its interpreter, so a CPU heavy script holds the GIL and delays the processing
+of key events. In the out of process mode, scripts are executed by a fixed number of worker processes. The workers
+are started in advance and pre-import the modules scripts commonly use, so running a script only costs a message
+round trip over a local socket.
+
+The workers have no access to the X server or the GUI. Calls to the scripting API objects (keyboard, mouse, window,
+clipboard, store, ...) are forwarded to the daemon, executed there and the result is sent back.
+
+The worker processes are not a sandbox. They only keep scripts from blocking the daemon's interpreter, and scripts
+still run with all permissions of the user. Compared to running in the daemon, scripts have these limits:
+
+- Arguments and results of API calls are pickled, so both have to be picklable. API calls returning model objects,
+  like engine.get_folder() or engine.create_folder(), fail in the workers. Values put in the store must be
+  picklable, too.
+- Scripts in the daemon see the globals of autokey.service, like highlevel, model, common, traceback or logging.
+  The workers only provide the API objects and the time module, other modules have to be imported by the script.
+- engine.run_script() runs the called script in the daemon, not in the worker of the calling script.
+
+This module is also the entry point of the worker processes, so it must only import standard library modules.
+"""
+
+import builtins
+import importlib
+import logging
+import marshal
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import types
+import typing
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+
+from .latency import LatencyStatistics
+
+logger = logging.getLogger("service").getChild("script_process")
+
+# API objects of the daemon, that are reachable from scripts running in a worker
+PROXIED_APIS = ("keyboard", "mouse", "window", "clipboard", "store", "system", "dialog", "engine")
+# Dict operations forwarded to the store, in addition to its public methods
+STORE_OPERATIONS = ("__getitem__", "__setitem__", "__delitem__", "__contains__", "__len__")
+# Imported by the workers before they report ready
+WARM_MODULES = ("os", "re", "sys", "time", "json", "datetime", "random", "subprocess", "traceback", "logging")
+
+# Message types. Daemon -> worker: RUN, RESULT, ERROR. Worker -> daemon: READY, CALL, DONE.
+RUN = "run"
+RESULT = "result"
+ERROR = "error"
+READY = "ready"
+CALL = "call"
+DONE = "done"
+
+# Directory containing the autokey package, so that the workers import the same code as the daemon
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ScriptProcessError(Exception):
+    """A script failed in a worker process. The message contains the traceback from the worker."""
+
+
+class ScriptApiError(Exception):
+    """Raised in a worker, when a forwarded API call raised an exception in the daemon."""
+
+
+class _Worker:
+
+    def __init__(self, process: subprocess.Popen, connection: Connection):
+        self.process = process
+        self.connection = connection
+
+
+class ScriptProcessPool:
+    """
+    Executes compiled scripts in worker_count worker processes. execute() blocks the calling thread until the script
+    is finished, serving the API calls of the script in the meantime, so the ExecutionPool still limits the script
+    executions.
+    """
+
+    # Interval for checking the cancellation and the liveness of the worker, while waiting for a message
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, worker_count: int, run_dir: str, api_objects: typing.Dict[str, object]):
+        self.worker_count = max(1, worker_count)
+        self.api_objects = api_objects
+        self._address = os.path.join(run_dir, "script-workers-{}.socket".format(os.getpid()))
+        self._authkey = os.urandom(32)
+        self._listener = None  # type: typing.Optional[Listener]
+        self._lock = threading.Lock()
+        # pid -> (process, start time) of the workers that did not report ready yet
+        self._starting = {}  # type: typing.Dict[int, typing.Tuple[subprocess.Popen, float]]
+        self._processes = set()  # type: typing.Set[subprocess.Popen]
+        self._idle = queue.Queue()  # type: queue.Queue
+        self._shutdown = False
+        self.replaced_workers = 0
+        self.startup_time = LatencyStatistics("Script worker startup")
+        self.api_call_time = LatencyStatistics("Script API call")
+
+    def start(self):
+        """Listen on the socket and start the workers."""
+        if os.path.exists(self._address):
+            os.unlink(self._address)
+        self._listener = Listener(self._address, family="AF_UNIX", authkey=self._authkey)
+        threading.Thread(target=self._accept, name="ScriptWorkerListener", daemon=True).start()
+        for _ in range(self.worker_count):
+            self._spawn()
+
+    def shutdown(self):
+        """Stop all workers. Running scripts are aborted."""
+        with self._lock:
+            self._shutdown = True
+            processes = list(self._processes)
+            self._processes.clear()
+        # Wakes up the callers waiting for an idle worker.
+        self._idle.put(None)
+        if self._listener is not None:
+            self._listener.close()
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    def execute(self, code: types.CodeType, script_file: typing.Optional[str], store):
+        """
+        Run the code object in an idle worker, waiting for one if all are busy. Raises ScriptProcessError, if the
+        script failed. Cancelling the calling ExecutionPool task kills the worker and starts a replacement.
+        """
+        worker = None
+        try:
+            worker = self._idle.get()
+            if worker is None:
+                self._idle.put(None)
+                raise ScriptProcessError("The script worker processes are shut down")
+            worker.connection.send((RUN, marshal.dumps(code), script_file))
+            error = self._serve(worker, store)
+        except (OSError, EOFError) as e:
+            self._replace(worker)
+            raise ScriptProcessError("Script worker process failed: {}".format(e)) from e
+        except BaseException:
+            if worker is not None:
+                self._replace(worker)
+            raise
+        self._idle.put(worker)
+        if error is not None:
+            raise ScriptProcessError(error)
+
+    def __str__(self):
+        return "ScriptProcessPool: {} workers, {} replaced; {}; {}".format(
+            self.worker_count, self.replaced_workers, self.startup_time, self.api_call_time
+        )
+
+    def _serve(self, worker: _Worker, store) -> typing.Optional[str]:
+        """Execute the API calls of the running script. Returns the traceback of the script, if it failed."""
+        while True:
+            while not worker.connection.poll(self.POLL_INTERVAL):
+                if worker.process.poll() is not None:
+                    raise EOFError("Exited with status {}".format(worker.process.returncode))
+            message = worker.connection.recv()
+            if message[0] == DONE:
+                return message[1]
+            started = time.monotonic()
+            worker.connection.send(self._call(store, *message[1:]))
+            self.api_call_time.add(time.monotonic() - started)
+
+    def _call(self, store, api: str, method: str, args: tuple, kwargs: dict) -> tuple:
+        try:
+            if api == "store":
+                target = store
+                allowed = not method.startswith("_") or method in STORE_OPERATIONS
+            else:
+                target = self.api_objects[api]
+                allowed = not method.startswith("_")
+            if not allowed:
+                raise AttributeError("'{}' is not accessible from scripts".format(method))
+            result = getattr(target, method)(*args, **kwargs)
+        except Exception as e:
+            logger.debug("Script API call %s.%s failed", api, method, exc_info=True)
+            return ERROR, "{}: {}".format(type(e).__name__, e)
+        try:
+            # Fail here, so that the script gets an error instead of losing its worker, if send() can't pickle it.
+            pickle.dumps(result)
+        except Exception as e:
+            logger.debug("Result of script API call %s.%s is not picklable", api, method, exc_info=True)
+            return ERROR, "{}.{}() returned a {}, which can't be passed to a script worker process ({}). Run the " \
+                          "script in the daemon instead.".format(api, method, type(result).__name__, e)
+        return RESULT, result
+
+    def _spawn(self):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "autokey.script_process", self._address],
+            stdin=subprocess.PIPE,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (PACKAGE_ROOT, os.getenv("PYTHONPATH")))))
+        )
+        with self._lock:
+            self._starting[process.pid] = (process, time.monotonic())
+            self._processes.add(process)
+        # Passed through a pipe instead of the command line or the environment, so other users can't read it.
+        process.stdin.write(self._authkey.hex().encode() + b"\n")
+        process.stdin.close()
+
+    def _replace(self, worker: _Worker):
+        """Kill a worker in an unknown state and start a new one in its place."""
+        worker.connection.close()
+        worker.process.kill()
+        worker.process.wait()
+        with self._lock:
+            self._processes.discard(worker.process)
+            if self._shutdown:
+                return
+            self.replaced_workers += 1
+        logger.info("Replacing script worker process %d", worker.process.pid)
+        self._spawn()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+                message, pid = connection.recv()
+            except (OSError, EOFError, AuthenticationError):
+                if self._shutdown:
+                    return
+                logger.exception("Failed to accept a script worker connection")
+                continue
+            with self._lock:
+                process, started = self._starting.pop(pid, (None, None))
+            if message != READY or process is None:
+                logger.warning("Ignoring connection from unknown script worker %s", pid)
+                connection.close()
+                continue
+            self.startup_time.add(time.monotonic() - started)
+            self._idle.put(_Worker(process, connection))
+
+
+class _ApiProxy:
+    """Stand-in for a scripting API object of the daemon inside a worker. Method calls are forwarded to the daemon."""
+
+    def __init__(self, connection: Connection, lock: threading.Lock, api: str):
+        self._connection = connection
+        self._lock = lock
+        self._api = api
+
+    def _call(self, method: str, *args, **kwargs):
+        # Scripts may call the API from several threads, each call has to wait for its reply.
+        with self._lock:
+            self._connection.send((CALL, self._api, method, args, kwargs))
+            kind, value = self._connection.recv()
+        if kind == ERROR:
+            raise ScriptApiError(value)
+        return value
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            return self._call(method, *args, **kwargs)
+        call.__name__ = method
+        return call
+
+
+class _StoreProxy(_ApiProxy):
+
+    def __getitem__(self, key):
+        return self._call("__getitem__", key)
+
+    def __setitem__(self, key, value):
+        self._call("__setitem__", key, value)
+
+    def __delitem__(self, key):
+        self._call("__delitem__", key)
+
+    def __contains__(self, key):
+        return self._call("__contains__", key)
+
+    def __len__(self):
+        return self._call("__len__")
+
+
+def _warm_scope(connection: Connection) -> dict:
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    lock = threading.Lock()
+    scope = {
+        "__name__": "__main__",
+        "__builtins__": builtins,
+        # Scripts running in the daemon can use time without importing it, keep them working.
+        "time": time,
+    }
+    for api in PROXIED_APIS:
+        scope[api] = (_StoreProxy if api == "store" else _ApiProxy)(connection, lock, api)
+    return scope
+
+
+def main():
+    address = sys.argv[1]
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    connection = Client(address, family="AF_UNIX", authkey=authkey)
+    warm_scope = _warm_scope(connection)
+    connection.send((READY, os.getpid()))
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            # The daemon exited.
+            return
+        code, script_file = message[1:]
+        scope = warm_scope.copy()
+        if script_file is not None:
+            scope["__file__"] = script_file
+        error = None
+        try:
+            exec(marshal.loads(code), scope)
+        except BaseException:
+            # Includes SystemExit, a script must not be able to end the worker.
+            error = traceback.format_exc()
+        connection.send((DONE, error))
+
+
+if __name__ == "__main__":
+    main()
@@ -118,8 +118,7 @@ class Keyboard:
         @param key: they key to be sent (e.g. "s" or "<enter>")
         @param repeat: number of times to repeat the key event
         """        
-        for _ in range(repeat):
-            self.mediator.send_key(key)
+        self.mediator.send_key(key, repeat)
         self.mediator.flush()
         
     def press_key(self, key):
@@ -1161,12 +1160,10 @@ class Engine:
         @param description: description for the phrase
         @param contents: the expansion text
         """
-        self.monitor.suspend()
         p = model.Phrase(description, contents)
         folder.add_item(p)
         p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.configManager.item_added(p)
         
     def create_abbreviation(self, folder, description, abbr, contents):
         """
@@ -1186,14 +1183,12 @@ class Engine:
         if not self.configManager.check_abbreviation_unique(abbr, None, None):
             raise Exception("The specified abbreviation is already in use")
         
-        self.monitor.suspend()
         p = model.Phrase(description, contents)
         p.modes.append(model.TriggerMode.ABBREVIATION)
         p.abbreviations = [abbr]
         folder.add_item(p)
         p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.configManager.item_added(p)
         
     def create_hotkey(self, folder, description, modifiers, key, contents):
         """
@@ -1225,14 +1220,12 @@ class Engine:
         if not self.configManager.check_hotkey_unique(modifiers, key, None, None):
             raise Exception("The specified hotkey and modifier combination is already in use")
         
-        self.monitor.suspend()
         p = model.Phrase(description, contents)
         p.modes.append(model.TriggerMode.HOTKEY)
         p.set_hotkey(modifiers, key)
         folder.add_item(p)
         p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.configManager.item_added(p)
 
     def run_script(self, description):
         """
@@ -1252,6 +1245,26 @@ class Engine:
             self.runner.run_subscript(targetScript)
         else:
             raise Exception("No script with description '%s' found" % description)
+
+    def cancel_script(self, description):
+        """
+        Cancel the running and waiting executions of an existing script, using its description to look it up
+
+        Usage: C{engine.cancel_script(description)}
+
+        A running execution is stopped with an exception raised inside the script. A script blocked in a
+        long-running call, like C{time.sleep()}, only stops after the call returns. Scripts run by
+        C{engine.run_script()} are part of the calling script and are not cancelled separately.
+
+        @param description: description of the script to cancel
+        @return: the number of cancelled executions
+        @raise Exception: if the specified script does not exist
+        """
+        for item in self.configManager.allItems:
+            if item.description == description and isinstance(item, model.Script):
+                return self.runner.cancel(item)
+
+        raise Exception("No script with description '%s' found" % description)
             
     def run_script_from_macro(self, args):
         """
@@ -0,0 +1,176 @@
+"""
+Clipboard and selection ownership for pasted phrases.
+
+To paste a phrase, AutoKey puts it into the clipboard, sends the paste command and restores the previous content
+afterwards. Restoring too early pastes the old content, restoring late holds up all following output. Instead of
+waiting a fixed time, the SelectionOwner owns the selection with a window on its own X connection and answers the
+SelectionRequest of the target application itself. Once the target has fetched the text, the paste is complete and
+the previous content can be restored right away.
+"""
+
+import logging
+import os
+import select
+import threading
+import time
+import typing
+
+from Xlib import X, Xatom, display
+from Xlib.error import ConnectionClosedError
+from Xlib.protocol import event
+
+logger = logging.getLogger("interface").getChild("selection_owner")
+
+CLIPBOARD = "CLIPBOARD"
+PRIMARY = "PRIMARY"
+
+
+class PasteTransaction:
+    """
+    A paste in progress: The text offered in a selection, until the target application fetched it, someone else took
+    over the selection or the transaction timed out.
+    """
+
+    # Seconds the target application gets to request the text, at least
+    TIMEOUT = 2.0
+
+    def __init__(self, selection: str, text: str, timeout: float=TIMEOUT):
+        self.selection = selection
+        self.data = text.encode("utf-8")
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        # Seconds from taking the selection until the text was first requested
+        self.latency = None  # type: typing.Optional[float]
+        # Another client took the selection before the text was requested
+        self.lost = False
+
+    @property
+    def done(self) -> bool:
+        return self.latency is not None or self.lost
+
+    def timed_out(self, now: float=None) -> bool:
+        return not self.done and (time.monotonic() if now is None else now) >= self.deadline
+
+    def served(self):
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+    def __str__(self):
+        return "PasteTransaction({}, {} bytes)".format(self.selection, len(self.data))
+
+
+class SelectionOwner:
+    """
+    Offers the text of paste transactions as UTF8_STRING, STRING or TEXT, from a hidden window on a dedicated X
+    connection. Requests are answered by a thread of its own, so pasting never depends on the X event thread.
+    """
+
+    def __init__(self):
+        self._display = display.Display()
+        self._window = self._display.screen().root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self._atoms = {name: self._display.intern_atom(name) for name in (CLIPBOARD, "TARGETS", "UTF8_STRING", "TEXT")}
+        self._atoms[PRIMARY] = Xatom.PRIMARY
+        # Texts larger than a single request would have to be transferred incrementally (INCR), which is not
+        # supported. The caller falls back to the toolkit clipboard for those.
+        self.max_size = self._display.info.max_request_length * 4 - 1024
+        self._lock = threading.Lock()
+        # selection atom -> PasteTransaction
+        self._transactions = {}  # type: typing.Dict[int, PasteTransaction]
+        self._shutdown = False
+        self._wakeUpRead, self._wakeUpWrite = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="SelectionOwner-thread", daemon=True)
+        self._thread.start()
+
+    def own(self, selection: str, text: str, timeout: float=PasteTransaction.TIMEOUT) \
+            -> typing.Optional[PasteTransaction]:
+        """
+        Take the selection to offer the text. Returns the transaction, or None if the text can't be offered.
+        """
+        transaction = PasteTransaction(selection, text, timeout)
+        if len(transaction.data) > self.max_size:
+            return None
+        atom = self._atoms[selection]
+        with self._lock:
+            self._transactions[atom] = transaction
+        self._window.set_selection_owner(atom, X.CurrentTime)
+        # The round trip also makes sure the ownership is established before the paste command is sent.
+        if self._display.get_selection_owner(atom) != self._window:
+            logger.warning("Unable to own the %s selection", selection)
+            with self._lock:
+                self._transactions.pop(atom, None)
+            return None
+        return transaction
+
+    def release(self, transaction: PasteTransaction):
+        """Stop offering the text of the transaction. The selection itself is left to the next owner."""
+        with self._lock:
+            atom = self._atoms[transaction.selection]
+            if self._transactions.get(atom) is transaction:
+                del self._transactions[atom]
+
+    def close(self):
+        self._shutdown = True
+        os.write(self._wakeUpWrite, b"\0")
+        self._thread.join()
+        self._display.close()
+        os.close(self._wakeUpRead)
+        os.close(self._wakeUpWrite)
+
+    def _run(self):
+        while not self._shutdown:
+            try:
+                if not self._display.pending_events():
+                    readable, w, e = select.select([self._display, self._wakeUpRead], [], [], 1)
+                    if self._wakeUpRead in readable:
+                        os.read(self._wakeUpRead, 512)
+                    continue
+                for x in range(self._display.pending_events()):
+                    received = self._display.next_event()
+                    if received.type == X.SelectionRequest:
+                        self._answer(received)
+                    elif received.type == X.SelectionClear:
+                        self._cleared(received.atom)
+            except ConnectionClosedError:
+                logger.error("Connection to the X server closed")
+                return
+            except Exception:
+                logger.exception("Error while answering selection requests")
+
+    def _answer(self, request):
+        with self._lock:
+            transaction = self._transactions.get(request.selection)
+        # Obsolete clients leave the property out and expect the answer in the target property.
+        reply_property = request.property or request.target
+        target = request.target
+        requestor = request.requestor
+
+        if transaction is None:
+            reply_property = X.NONE
+        elif target == self._atoms["TARGETS"]:
+            targets = [self._atoms["TARGETS"], self._atoms["UTF8_STRING"], Xatom.STRING, self._atoms["TEXT"]]
+            requestor.change_property(reply_property, Xatom.ATOM, 32, targets)
+        elif target in (self._atoms["UTF8_STRING"], self._atoms["TEXT"]):
+            requestor.change_property(reply_property, self._atoms["UTF8_STRING"], 8, transaction.data)
+            transaction.served()
+        elif target == Xatom.STRING:
+            data = transaction.data.decode("utf-8").encode("latin-1", "replace")
+            requestor.change_property(reply_property, Xatom.STRING, 8, data)
+            transaction.served()
+        else:
+            reply_property = X.NONE
+
+        notify = event.SelectionNotify(
+            time=request.time,
+            requestor=requestor,
+            selection=request.selection,
+            target=target,
+            property=reply_property
+        )
+        requestor.send_event(notify)
+        self._display.flush()
+
+    def _cleared(self, atom: int):
+        with self._lock:
+            transaction = self._transactions.pop(atom, None)
+        if transaction is not None and not transaction.done:
+            transaction.lost = True
@@ -17,7 +17,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import traceback
-import collections
 import time
 import logging
 
@@ -26,27 +25,19 @@ from autokey.iomediator.key import Key, KEY_FIND_RE
 from autokey.iomediator import IoMediator
 
 from .macro import MacroManager
+from .abbreviation_trie import InputBuffer
+from .execution_pool import ExecutionCancelled, ExecutionPool, pooled
+from .script_process import ScriptProcessPool, PROXIED_APIS
+from .persistence import OWN_WRITES
 
 from . import scripting, model, scripting_Store, scripting_highlevel
-from .configmanager import ConfigManager, SERVICE_RUNNING, SCRIPT_GLOBALS, save_config, UNDO_USING_BACKSPACE
-import threading
+from .configmanager import ConfigManager, SERVICE_RUNNING, SCRIPT_GLOBALS, save_config, UNDO_USING_BACKSPACE, \
+    EXECUTION_POOL_SIZE, EXECUTION_QUEUE_DEPTH, SCRIPT_WORKER_PROCESSES, USE_ITEM_INDEX
 logger = logging.getLogger("service")
 
 MAX_STACK_LENGTH = 150
 
 
-def threaded(f):
-
-    def wrapper(*args):
-        t = threading.Thread(target=f, args=args, name="Phrase-thread")
-        t.setDaemon(False)
-        t.start()
-
-    wrapper.__name__ = f.__name__
-    wrapper.__dict__ = f.__dict__
-    wrapper.__doc__ = f.__doc__
-    return wrapper
-
 def synchronized(lock):
     """ Synchronization decorator. """
 
@@ -73,9 +64,14 @@ class Service:
         ConfigManager.SETTINGS[SERVICE_RUNNING] = False
         self.mediator = None
         self.app = app
-        self.inputStack = collections.deque(maxlen=MAX_STACK_LENGTH)
+        self.inputStack = InputBuffer(MAX_STACK_LENGTH)
         self.lastStackState = ''
         self.lastMenu = None
+        self.scriptRunner = None
+        # Runs phrases, scripts and items selected in popup menus. Accessed by the pooled methods as self.pool
+        self.pool = ExecutionPool(
+            "Execution", ConfigManager.SETTINGS[EXECUTION_POOL_SIZE], ConfigManager.SETTINGS[EXECUTION_QUEUE_DEPTH]
+        )
 
     def start(self):
         self.mediator = IoMediator(self)
@@ -83,7 +79,7 @@ class Service:
         self.mediator.interface.start()
         self.mediator.start()
         ConfigManager.SETTINGS[SERVICE_RUNNING] = True
-        self.scriptRunner = ScriptRunner(self.mediator, self.app)
+        self.scriptRunner = ScriptRunner(self.mediator, self.app, self.pool)
         self.phraseRunner = PhraseRunner(self)
         scripting_Store.Store.GLOBALS = ConfigManager.SETTINGS[SCRIPT_GLOBALS]
         logger.info("Service now marked as running")
@@ -101,9 +97,20 @@ class Service:
 
     def shutdown(self, save=True):
         logger.info("Service shutting down")
+        self.pool.shutdown()
+        logger.debug("%s", self.pool)
+        if self.scriptRunner is not None: self.scriptRunner.shutdown()
         if self.mediator is not None: self.mediator.shutdown()
         if save:
             save_config(self.configManager)
+        OWN_WRITES.flush()
+        logger.debug("Configuration writes: %s", OWN_WRITES)
+        if ConfigManager.SETTINGS[USE_ITEM_INDEX]:
+            with self.configManager.lock:
+                model.Folder.INDEX.save(self.configManager.folders)
+            logger.debug("%s", model.Folder.INDEX)
+        logger.debug("Compiled scripts: %s", model.Script.CODE_CACHE)
+        logger.debug("Item bodies: %s", model.LazyBody.CACHE)
         logger.debug("Service shutdown completed.")
 
     def handle_mouseclick(self, rootX, rootY, relX, relY, button, windowTitle):
@@ -121,16 +128,18 @@ class Service:
         logger.debug("Raw key: %r, modifiers: %r, Key: %s", rawKey, modifiers, key)
         logger.debug("Window visible title: %r, Window class: %r" % window_info)
         self.configManager.lock.acquire()
+        # Only items sharing the pressed key combination can match, so only those need their window filter checked
+        hotkeyCombination = (tuple(modifiers), rawKey)
 
         # Always check global hotkeys
-        for hotkey in self.configManager.globalHotkeys:
+        for hotkey in self.configManager.globalHotkeyTable.get(hotkeyCombination, ()):
             hotkey.check_hotkey(modifiers, rawKey, window_info)
 
         if self.__shouldProcess(window_info):
             itemMatch = None
             menu = None
 
-            for item in self.configManager.hotKeys:
+            for item in self.configManager.hotKeyTable.get(hotkeyCombination, ()):
                 if item.check_hotkey(modifiers, rawKey, window_info):
                     itemMatch = item
                     break
@@ -143,7 +152,7 @@ class Service:
                     menu = ([], [itemMatch])
 
             else:
-                for folder in self.configManager.hotKeyFolders:
+                for folder in self.configManager.hotKeyFolderTable.get(hotkeyCombination, ()):
                     if folder.check_hotkey(modifiers, rawKey, window_info):
                         #menu = PopupMenu(self, [folder], [])
                         menu = ([folder], [])
@@ -176,14 +185,20 @@ class Service:
             ### --- end of processing if non-printing modifiers are on --- ###
 
             if self.__updateStack(key):
-                currentInput = ''.join(self.inputStack)
-                item, menu = self.__checkTextMatches([], self.configManager.abbreviations,
-                                                    currentInput, window_info, True)
-                if not item or menu:
-                    item, menu = self.__checkTextMatches(
-                        self.configManager.allFolders,
-                        self.configManager.allItems,
-                        currentInput, window_info)  # type: model.Phrase, list
+                # Only items having an abbreviation that ends at the cursor position can possibly match
+                candidateItems = self.inputStack.candidates(self.configManager.abbreviationTrie)
+                candidateFolders = self.inputStack.candidates(self.configManager.folderAbbreviationTrie)
+                if candidateItems or candidateFolders:
+                    currentInput = self.inputStack.text
+                    item, menu = self.__checkTextMatches([], candidateItems,
+                                                        currentInput, window_info, True)
+                    if not item or menu:
+                        item, menu = self.__checkTextMatches(
+                            candidateFolders,
+                            candidateItems,
+                            currentInput, window_info)  # type: model.Phrase, list
+                else:
+                    item, menu = None, None
 
                 if item:
                     self.__tryReleaseLock()
@@ -228,6 +243,10 @@ class Service:
         script = self.__findItem(name, model.Script, "script")
         self.scriptRunner.execute(script)
 
+    def cancel_script(self, name) -> int:
+        script = self.__findItem(name, model.Script, "script")
+        return self.scriptRunner.cancel(script)
+
     def __findItem(self, name, objType, typeDescription):
         for item in self.configManager.allItems:
             if item.description == name and isinstance(item, objType):
@@ -235,7 +254,7 @@ class Service:
 
         raise Exception("No %s found with name '%s'" % (typeDescription, name))
 
-    @threaded
+    @pooled(lambda service, item: item)
     def item_selected(self, item):
         time.sleep(0.25) # wait for window to be active
         self.lastMenu = None # if an item has been selected, the menu has been hidden
@@ -247,7 +266,7 @@ class Service:
         """
         extraBs = len(self.inputStack) - len(buffer)
         if extraBs > 0:
-            extraKeys = ''.join(self.inputStack[len(buffer)])
+            extraKeys = self.inputStack.text[len(buffer):]
         else:
             extraBs = 0
             extraKeys = ''
@@ -278,11 +297,7 @@ class Service:
                 self.phraseRunner.undo_expansion()
             else:
                 # handle backspace by dropping the last saved character
-                try:
-                    self.inputStack.pop()
-                except IndexError:
-                    # in case self.inputStack is empty
-                    pass
+                self.inputStack.backspace()
 
             return False
 
@@ -294,7 +309,7 @@ class Service:
         else:
             # Key is a character
             self.phraseRunner.clear_last()
-            # if len(self.inputStack) == MAX_STACK_LENGTH, front items will removed for appending new items.
+            # if len(self.inputStack) == MAX_STACK_LENGTH, front items will be removed for appending new items.
             self.inputStack.append(key)
             return True
 
@@ -377,21 +392,23 @@ class PhraseRunner:
 
     def __init__(self, service: Service):
         self.service = service
+        self.pool = service.pool
         self.macroManager = MacroManager(service.scriptRunner.engine)
         self.lastExpansion = None
         self.lastPhrase = None
         self.lastBuffer = None
         self.contains_special_keys = False
 
-    @threaded
+    # All phrases share one key, so that the output of simultaneously triggered phrases does not interleave.
+    @pooled(lambda runner, phrase, buffer='': runner)
     #@synchronized(iomediator.SEND_LOCK)
     def execute(self, phrase: model.Phrase, buffer=''):
         mediator = self.service.mediator  # type: IoMediator
+        expansion = phrase.build_phrase(buffer)
+        # Macros like <script> might change the focused window, so the send transaction starts afterwards.
+        self.macroManager.process_expansion(expansion)
         mediator.interface.begin_send()
         try:
-            expansion = phrase.build_phrase(buffer)
-            self.macroManager.process_expansion(expansion)
-
             self.contains_special_keys = self.phrase_contains_special_keys(expansion)
             mediator.send_backspace(expansion.backspaces)
             if phrase.sendMode == model.SendMode.KEYBOARD:
@@ -448,9 +465,10 @@ class PhraseRunner:
 
 class ScriptRunner:
 
-    def __init__(self, mediator: IoMediator, app):
+    def __init__(self, mediator: IoMediator, app, pool: ExecutionPool):
         self.mediator = mediator
         self.app = app
+        self.pool = pool
         self.error = ''
         self.scope = globals()
         self.scope["highlevel"] = scripting_highlevel
@@ -469,7 +487,18 @@ class ScriptRunner:
 
         self.engine = self.scope["engine"]
 
-    @threaded
+        self.processPool = None
+        if ConfigManager.SETTINGS[SCRIPT_WORKER_PROCESSES] > 0:
+            self.processPool = ScriptProcessPool(
+                ConfigManager.SETTINGS[SCRIPT_WORKER_PROCESSES],
+                common.RUN_DIR,
+                {name: self.scope[name] for name in PROXIED_APIS if name != "store"}
+            )
+            self.processPool.start()
+
+    # Scripts triggered again while running run in parallel, like toggle scripts checking their store. The key
+    # only identifies the executions for cancel().
+    @pooled(lambda runner, script, buffer='': script, serialize=False)
     def execute(self, script: model.Script, buffer=''):
         logger.debug("Script runner executing: %r", script)
 
@@ -482,7 +511,12 @@ class ScriptRunner:
             # Overwrite __file__ to contain the path to the user script instead of the path to this service.py file.
             scope["__file__"] = script.path
         try:
-            exec(script.code, scope)
+            if self.processPool is not None:
+                self.processPool.execute(script.get_code_object(), script.path, script.store)
+            else:
+                exec(script.get_code_object(), scope)
+        except ExecutionCancelled:
+            raise
         except Exception as e:
             logger.exception("Script error")
             self.error = "Script name: '{}'\n{}".format(script.description, traceback.format_exc())
@@ -490,7 +524,18 @@ class ScriptRunner:
 
         self.mediator.send_string(stringAfter)
 
+    def cancel(self, script: model.Script) -> int:
+        """
+        Cancel the waiting and running executions of the given script. Returns the number of cancelled executions.
+        """
+        return self.pool.cancel(script)
+
+    def shutdown(self):
+        if self.processPool is not None:
+            self.processPool.shutdown()
+            logger.debug("%s", self.processPool)
+
     def run_subscript(self, script):
         scope = self.scope.copy()
         scope["store"] = script.store
-        exec(script.code, scope)
+        exec(script.get_code_object(), scope)
@@ -0,0 +1,99 @@
+import unittest
+
+from autokey.abbreviation_trie import AbbreviationTrie, InputBuffer
+
+
+class FakeItem:
+
+    def __init__(self, *abbreviations, ignoreCase=False):
+        self.abbreviations = list(abbreviations)
+        self.ignoreCase = ignoreCase
+
+
+class AbbreviationTrieTest(unittest.TestCase):
+
+    def testImmediateAndTriggerCharPositions(self):
+        item = FakeItem("brb")
+        trie = AbbreviationTrie([item])
+        self.assertEqual(trie.candidates("brb"), [item])
+        self.assertEqual(trie.candidates("say brb "), [item])
+        self.assertEqual(trie.candidates("brb  "), [])
+        self.assertEqual(trie.candidates("br"), [])
+        self.assertEqual(trie.candidates(""), [])
+
+    def testIgnoreCase(self):
+        sensitive = FakeItem("adr")
+        insensitive = FakeItem("AdR", ignoreCase=True)
+        trie = AbbreviationTrie([sensitive, insensitive])
+        self.assertEqual(trie.candidates("ADR "), [insensitive])
+        self.assertEqual(trie.candidates("adr "), [sensitive, insensitive])
+
+    def testResultKeepsInsertionOrder(self):
+        items = [FakeItem("xp@"), FakeItem("p@"), FakeItem("@"), FakeItem("xp@", "@")]
+        trie = AbbreviationTrie(items)
+        self.assertEqual(trie.candidates("xp@"), items)
+        self.assertEqual(trie.candidates("p@"), items[1:])
+
+    def testRemoveAndUpdate(self):
+        first, second, third = FakeItem("brb"), FakeItem("rb"), FakeItem("b")
+        trie = AbbreviationTrie([first, second, third])
+        trie.remove(second)
+        self.assertEqual(trie.candidates("brb"), [first, third])
+        self.assertNotIn(second, trie)
+        self.assertEqual(2, len(trie))
+
+        first.abbreviations = ["cya"]
+        trie.update(first)
+        trie.add(second)
+        self.assertEqual(trie.candidates("brb"), [third, second])
+        self.assertEqual(trie.candidates("cya"), [first])
+        third.abbreviations.append("cya")
+        trie.update(third)
+        # Updated items keep their position
+        self.assertEqual(trie.candidates("cya"), [first, third])
+
+    def testCandidateCountIndependentOfItemCount(self):
+        small = AbbreviationTrie(build_items(100))
+        large = AbbreviationTrie(build_items(10000))
+        self.assertEqual(len(small.candidates("abbr50 ")), len(large.candidates("abbr50 ")))
+
+
+class InputBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.item = FakeItem("brb")
+        self.trie = AbbreviationTrie([self.item])
+        self.buffer = InputBuffer(5)
+
+    def type(self, text):
+        for char in text:
+            self.buffer.append(char)
+
+    def testAppendAndBackspace(self):
+        self.type("brx")
+        self.assertEqual(self.buffer.candidates(self.trie), [])
+        self.buffer.backspace()
+        self.type("b")
+        self.assertEqual(self.buffer.text, "brb")
+        self.assertEqual(self.buffer.candidates(self.trie), [self.item])
+
+    def testBackspaceOnEmptyBuffer(self):
+        self.buffer.backspace()
+        self.assertEqual(self.buffer.text, "")
+        self.assertEqual(len(self.buffer), 0)
+
+    def testClearAndMaximumLength(self):
+        self.type("1234567")
+        self.assertEqual(self.buffer.text, "34567")
+        self.buffer.clear()
+        self.assertEqual(self.buffer.text, "")
+        self.type("brb ")
+        self.assertEqual(self.buffer.candidates(self.trie), [self.item])
+
+
+def build_items(count):
+    return [FakeItem("abbr{}".format(n)) for n in range(count)]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,6 @@
+"""
+Benchmarks of the lookup structures and caches. They print timings instead of checking results, so they are not part
+of the unit tests. Run a benchmark from the repository root, for example:
+
+    PYTHONPATH=lib python3 -m test.benchmarks.abbreviation_trie
+"""
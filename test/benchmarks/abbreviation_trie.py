@@ -0,0 +1,22 @@
+"""
+Per-keystroke cost of finding the abbreviations that end at the cursor, for a growing number of items.
+"""
+
+import timeit
+
+from autokey.abbreviation_trie import AbbreviationTrie
+
+from test.abbreviationtrietest import build_items
+
+
+def benchmark():
+    buffer = "some text typed by the user abbr42"
+    for count in (100, 1000, 6000, 50000):
+        trie = AbbreviationTrie(build_items(count))
+        runs = 10000
+        seconds = timeit.timeit(lambda: trie.candidates(buffer), number=runs)
+        print("{:>6} items: {:.2f} us per keystroke".format(count, seconds / runs * 1e6))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,59 @@
+"""
+Startup time of a synthetic tree of 50k items: loading it from disk compared to reading the item index.
+"""
+
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from autokey.item_index import ItemIndex, json_path
+
+from test.itemindextest import create_tree
+
+
+def scan(folder_path):
+    """The file system accesses done by Folder.load() without the index."""
+    with open(folder_path + "/.folder.json") as json_file:
+        json.load(json_file)
+    for entry_path in glob.glob(folder_path + "/*"):
+        if os.path.isdir(entry_path):
+            scan(entry_path)
+        if os.path.isfile(entry_path):
+            entry_json_path = json_path(entry_path)
+            if os.path.exists(entry_json_path):
+                with open(entry_json_path) as json_file:
+                    json.load(json_file)
+
+
+def benchmark():
+    directory = tempfile.mkdtemp()
+    try:
+        folders = create_tree(directory, 500, 100)
+        index = ItemIndex(os.path.join(directory, "item_index"))
+        for folder in folders:
+            index.loaded(folder.path, ItemIndex.directory_mtime(folder.path))
+            index.file_loaded(folder.path + "/.folder.json", ItemIndex.file_signature(folder.path + "/.folder.json"))
+            for item in folder.items:
+                index.file_loaded(json_path(item.path), ItemIndex.file_signature(json_path(item.path)))
+        index.save(folders)
+
+        started = time.perf_counter()
+        for folder in folders:
+            scan(folder.path)
+        print("Scanning 50000 items: {:.3f} s".format(time.perf_counter() - started))
+
+        started = time.perf_counter()
+        index = ItemIndex(index.path)
+        index.load()
+        for folder in folders:
+            index.lookup(folder.path)
+        print("Reading the index of 50000 items: {:.3f} s, {}".format(time.perf_counter() - started, index))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,23 @@
+"""
+Cost of the keysym and keycode lookups done for every key sent or received.
+"""
+
+import timeit
+
+from autokey.keymap_table import KeymapTable, NO_SYMBOL
+
+
+def benchmark():
+    mapping = [(keysym, keysym - 32, NO_SYMBOL, NO_SYMBOL) for keysym in range(0x61, 0x61 + 248)]
+    table = KeymapTable(8, mapping)
+    runs = 100000
+    for name, lookup in (
+            ("keysym(keycode, index)", lambda: table.keysym(42, 1)),
+            ("usable_keycode(keysym)", lambda: table.usable_keycode(0x41, (0, 1))),
+            ("keycode(keysym)", lambda: table.keycode(0x70))):
+        seconds = timeit.timeit(lookup, number=runs)
+        print("{:<24}: {:.3f} us per lookup".format(name, seconds / runs * 1e6))
+
+
+if __name__ == "__main__":
+    benchmark()
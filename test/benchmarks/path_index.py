@@ -0,0 +1,41 @@
+"""
+Routing the file system events of a bulk change, like a git pull, to the items they belong to.
+"""
+
+import time
+
+from autokey.path_index import PathIndex
+
+from test.pathindextest import FakeItem, json_path
+
+
+def benchmark():
+    items = [FakeItem("/data/folder{}/phrase{}.txt".format(number // 100, number)) for number in range(50000)]
+    events = [item.get_json_path() for item in items[::5]]
+
+    # A sample spread over the whole tree is enough to estimate the cost of the scan.
+    sample = events[::50]
+    started = time.perf_counter()
+    for path in sample:
+        for item in items:
+            if item.get_json_path() == path:
+                break
+    scan_seconds = (time.perf_counter() - started) / len(sample)
+
+    started = time.perf_counter()
+    index = PathIndex(json_path)
+    index.rebuild(items)
+    build_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for path in events:
+        index.get(path)
+    lookup_seconds = (time.perf_counter() - started) / len(events)
+
+    print("Routing {} events among {} items:".format(len(events), len(items)))
+    print("  linear scan : {:.3f} s ({:.1f} ms per event)".format(scan_seconds * len(events), scan_seconds * 1e3))
+    print("  path index  : {:.3f} s ({:.2f} us per event), built in {:.3f} s".format(
+        lookup_seconds * len(events), lookup_seconds * 1e6, build_seconds))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,283 @@
+import gettext
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# The configuration manager and the service only need the desktop integration modules at import time. Replace the
+# ones not installed in the test environment.
+DESKTOP_MODULES = {
+    "dbus": ("dbus.service", "dbus.mainloop", "dbus.mainloop.glib"),
+    "Xlib": ("Xlib.display", "Xlib.X", "Xlib.XK", "Xlib.Xatom", "Xlib.error", "Xlib.protocol", "Xlib.protocol.rq",
+             "Xlib.protocol.event", "Xlib.ext", "Xlib.ext.xtest", "Xlib.ext.record", "Xlib.threaded"),
+    "gi": ("gi.repository",),
+    "pyinotify": (),
+}
+for package_name, module_names in DESKTOP_MODULES.items():
+    if package_name not in sys.modules and importlib.util.find_spec(package_name) is None:
+        for module_name in (package_name,) + module_names:
+            sys.modules[module_name] = mock.MagicMock()
+
+gettext.install("autokey")  # The macros translate their titles at import time, like in the application
+import autokey.iomediator  # Imports the configuration manager in the order the application does
+from autokey import configmanager as cm
+from autokey import model
+from autokey import service
+from autokey.interface import WindowInfo
+from autokey.item_index import ItemIndex
+
+CHORD = (("<ctrl>",), "k")
+
+
+def create_phrase(name, modifiers=None, key=None, abbreviation=None):
+    phrase = model.Phrase(name, name + " text")
+    modes = []
+    if key is not None:
+        phrase.set_hotkey(list(modifiers), key)
+        modes.append(model.TriggerMode.HOTKEY)
+    if abbreviation is not None:
+        phrase.add_abbreviation(abbreviation)
+        modes.append(model.TriggerMode.ABBREVIATION)
+    phrase.set_modes(modes)
+    return phrase
+
+
+def create_config_manager(folders):
+    def load_global_config(manager):
+        manager.folders = folders
+        manager.config_altered(False)
+
+    with mock.patch.object(cm.ConfigManager, "load_global_config", load_global_config):
+        return cm.ConfigManager(mock.MagicMock())
+
+
+class ConfigManagerUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = model.Folder("Folder")
+        self.first = create_phrase("first", *CHORD)
+        self.second = create_phrase("second", *CHORD)
+        self.folder.add_item(self.first)
+        self.folder.add_item(self.second)
+        self.manager = create_config_manager([self.folder])
+
+    def testHotkeyGroupKeepsItemOrder(self):
+        self.assertEqual([self.first, self.second], self.manager.hotKeyTable[CHORD])
+
+    def testModifiedItemKeepsItsPosition(self):
+        self.manager.item_modified(self.first)
+        self.assertEqual([self.first, self.second], self.manager.hotKeyTable[CHORD])
+        self.assertEqual([self.first, self.second], self.manager.hotKeys)
+
+        self.first.set_hotkey(["<alt>"], "k")
+        self.manager.item_modified(self.first)
+        self.assertEqual([self.second], self.manager.hotKeyTable[CHORD])
+        self.assertEqual([self.first], self.manager.hotKeyTable[(("<alt>",), "k")])
+
+        self.first.set_hotkey(["<ctrl>"], "k")
+        self.manager.item_modified(self.first)
+        self.assertEqual([self.first, self.second], self.manager.hotKeyTable[CHORD])
+        self.assertNotIn((("<alt>",), "k"), self.manager.hotKeyTable)
+
+    def testItemRejoiningKeepsItsPosition(self):
+        self.first.set_modes([])
+        self.manager.item_modified(self.first)
+        self.assertEqual([self.second], self.manager.hotKeys)
+        self.assertEqual([self.second], self.manager.hotKeyTable[CHORD])
+
+        self.first.set_modes([model.TriggerMode.HOTKEY])
+        self.manager.item_modified(self.first)
+        self.assertEqual([self.first, self.second], self.manager.hotKeys)
+        self.assertEqual([self.first, self.second], self.manager.hotKeyTable[CHORD])
+
+    def testUnchangedListsAreKept(self):
+        hotKeys = self.manager.hotKeys
+        group = self.manager.hotKeyTable[CHORD]
+        self.manager.item_modified(self.second)
+        self.assertIs(hotKeys, self.manager.hotKeys)
+        self.assertIs(group, self.manager.hotKeyTable[CHORD])
+
+    def testModifiedNewItemIsAdded(self):
+        # New items saved from the GUI are only reported as modified.
+        third = create_phrase("third", *CHORD, abbreviation="thd")
+        self.folder.add_item(third)
+        self.manager.item_modified(third)
+        self.assertIn(third, self.manager.allItems)
+        self.assertEqual([self.first, self.second, third], self.manager.hotKeyTable[CHORD])
+        self.assertIn(third, self.manager.abbreviationTrie)
+
+    def testAddedItemIsIndexed(self):
+        third = create_phrase("third", *CHORD, abbreviation="thd")
+        self.folder.add_item(third)
+        self.manager.item_added(third)
+        self.assertEqual([self.first, self.second, third], self.manager.hotKeyTable[CHORD])
+        self.assertEqual([third], self.manager.abbreviations)
+        self.assertIn(third, self.manager.abbreviationTrie)
+
+    def testRemovedItemIsUnindexed(self):
+        self.first.add_abbreviation("fst")
+        self.first.set_modes([model.TriggerMode.HOTKEY, model.TriggerMode.ABBREVIATION])
+        self.manager.item_modified(self.first)
+        self.assertIn(self.first, self.manager.abbreviationTrie)
+
+        self.folder.remove_item(self.first)
+        self.manager.item_removed(self.first)
+        self.assertNotIn(self.first, self.manager.allItems)
+        self.assertEqual([self.second], self.manager.hotKeyTable[CHORD])
+        self.assertNotIn(self.first, self.manager.abbreviationTrie)
+
+    def testSelectionChangesAreAppliedTogether(self):
+        third = create_phrase("third", *CHORD)
+        self.folder.remove_item(self.first)
+        self.folder.add_item(third)
+        self.manager.items_changed(added=[third], removed=[self.first])
+        self.assertEqual([self.second, third], self.manager.allItems)
+        self.assertEqual([self.second, third], self.manager.hotKeyTable[CHORD])
+
+    def testModifiedAbbreviationIsReplacedInTrie(self):
+        third = create_phrase("third", abbreviation="thd")
+        self.folder.add_item(third)
+        self.manager.item_added(third)
+        third.abbreviations = ["3rd"]
+        self.manager.item_modified(third)
+        self.assertEqual([third], list(self.manager.abbreviationTrie.candidates("3rd")))
+        self.assertEqual([], list(self.manager.abbreviationTrie.candidates("thd")))
+
+
+class ConfigManagerPathEventTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = model.Folder("Folder", path=self.directory.name)
+        self.manager = create_config_manager([self.folder])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_phrase(self, name):
+        path = os.path.join(self.directory.name, name + ".txt")
+        with open(path, "w", encoding="UTF-8") as phrase_file:
+            phrase_file.write(name + " text")
+        return path
+
+    def testCreatedFileIsAddedAndRemovedFileIsDropped(self):
+        path = self.write_phrase("created")
+        self.assertTrue(self.manager.apply_path_events([(path, False)]))
+        phrase = self.manager.itemPaths.get(path)
+        self.assertIn(phrase, self.folder.items)
+        self.assertIn(phrase, self.manager.allItems)
+
+        os.remove(path)
+        self.assertTrue(self.manager.apply_path_events([(path, True)]))
+        self.assertIsNone(self.manager.itemPaths.get(path))
+        self.assertNotIn(phrase, self.folder.items)
+        self.assertNotIn(phrase, self.manager.allItems)
+
+    def testBatchIsAppliedInOrder(self):
+        kept = self.write_phrase("kept")
+        dropped = self.write_phrase("dropped")
+        self.manager.apply_path_events([(kept, False), (dropped, False), (dropped, True)])
+        self.assertEqual(["kept"], [item.description for item in self.manager.allItems])
+        self.assertIsNone(self.manager.itemPaths.get(dropped))
+        self.assertEqual(1, len(self.manager.itemPaths))
+
+    def testModifiedFileKeepsItem(self):
+        path = self.write_phrase("modified")
+        self.manager.apply_path_events([(path, False)])
+        phrase = self.manager.itemPaths.get(path)
+        self.manager.apply_path_events([(path, False)])
+        self.assertIs(phrase, self.manager.itemPaths.get(path))
+        self.assertEqual([phrase], self.manager.allItems)
+
+    def testPathEventsRefreshTheItemIndex(self):
+        index_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(index_directory.cleanup)
+        index = ItemIndex(os.path.join(index_directory.name, "item_index"))
+        with mock.patch.object(model.Folder, "INDEX", index), \
+                mock.patch.dict(cm.ConfigManager.SETTINGS, {cm.USE_ITEM_INDEX: True}):
+            path = self.write_phrase("created")
+            self.manager.apply_path_events([(path, False)])
+            index.save([self.folder])
+            index.load()
+            folder_data, subfolders, items = index.lookup(self.folder.path)
+        self.assertEqual([(path, self.manager.itemPaths.get(path).get_serializable())], items)
+
+
+class HotkeyDispatchTest(unittest.TestCase):
+
+    EDITOR = WindowInfo("notes - Editor", "editor.Editor")
+    TERMINAL = WindowInfo("shell - Terminal", "terminal.Terminal")
+
+    def setUp(self):
+        self.folder = model.Folder("Folder")
+        self.editor = create_phrase("editor", *CHORD)
+        self.editor.set_window_titles(".*Editor")
+        self.fallback = create_phrase("fallback", *CHORD)
+        self.folder.add_item(self.editor)
+        self.folder.add_item(self.fallback)
+        self.manager = create_config_manager([self.folder])
+
+        app = mock.MagicMock(configManager=self.manager)
+        self.service = service.Service(app)
+        self.service.phraseRunner = mock.MagicMock()
+        self.addCleanup(self.service.pool.shutdown)
+        cm.ConfigManager.SETTINGS[cm.SERVICE_RUNNING] = True
+        self.addCleanup(cm.ConfigManager.SETTINGS.__setitem__, cm.SERVICE_RUNNING, False)
+
+    def press(self, window_info):
+        modifiers, key = CHORD
+        self.service.handle_keypress(key, list(modifiers), key, window_info)
+        (item, buffer), kwargs = self.service.phraseRunner.execute.call_args
+        self.service.phraseRunner.execute.reset_mock()
+        return item
+
+    def testFirstMatchingItemOfGroupIsDispatched(self):
+        self.assertIs(self.editor, self.press(self.EDITOR))
+        self.assertIs(self.fallback, self.press(self.TERMINAL))
+
+    def testDispatchFollowsModifiedFilter(self):
+        self.editor.set_window_titles(".*Terminal")
+        self.manager.item_modified(self.editor)
+        self.assertIs(self.fallback, self.press(self.EDITOR))
+        self.assertIs(self.editor, self.press(self.TERMINAL))
+
+
+
+class ScriptCancellationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = model.Folder("Folder")
+        self.script = model.Script("loop", "store.set_value('started', True)\n"
+                                           "try:\n"
+                                           "    while True:\n"
+                                           "        time.sleep(0.01)\n"
+                                           "finally:\n"
+                                           "    store.set_value('stopped', True)\n")
+        self.folder.add_item(self.script)
+        manager = create_config_manager([self.folder])
+        app = mock.MagicMock(configManager=manager)
+        self.service = service.Service(app)
+        self.addCleanup(self.service.pool.shutdown)
+        self.runner = service.ScriptRunner(mock.MagicMock(), app, self.service.pool)
+
+    def wait_for(self, key):
+        deadline = time.monotonic() + 2.0
+        while not self.script.store.get_value(key) and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return self.script.store.get_value(key)
+
+    def testRunningScriptIsCancelledByTheEngine(self):
+        self.runner.execute(self.script)
+        self.assertTrue(self.wait_for("started"))
+        self.assertEqual(1, self.runner.engine.cancel_script("loop"))
+        self.assertTrue(self.wait_for("stopped"))
+        self.assertEqual(0, self.runner.engine.cancel_script("loop"))
+        with self.assertRaises(Exception):
+            self.runner.engine.cancel_script("missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+from autokey.execution_pool import ExecutionPool
+
+
+class ExecutionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ExecutionPool("Test", 4, 8)
+        self.log = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def record(self, name, duration=0.0):
+        with self.lock:
+            self.log.append(("start", name))
+        time.sleep(duration)
+        with self.lock:
+            self.log.append(("end", name))
+
+    def wait_for(self, count, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while len(self.log) < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def testSameKeyIsSerialized(self):
+        self.pool.submit("item", self.record, "a", 0.05)
+        self.pool.submit("item", self.record, "b")
+        self.wait_for(4)
+        self.assertEqual(self.log, [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")])
+
+    def testDifferentKeysRunInParallel(self):
+        self.pool.submit("first", self.record, "a", 0.1)
+        self.pool.submit("second", self.record, "b")
+        self.wait_for(4)
+        self.assertEqual(self.log.index(("end", "b")), 2)
+
+    def testBackToBackTasksDoNotShareAnIdleWorker(self):
+        self.pool.submit("first", self.record, "warm-up")
+        self.wait_for(2)
+        time.sleep(0.05)  # Let the worker become idle
+        blocker = threading.Event()
+        self.pool.submit("script", blocker.wait, 2.0)
+        self.pool.submit("phrase", self.record, "b")
+        self.wait_for(4, timeout=1.0)
+        blocker.set()
+        self.assertIn(("end", "b"), self.log)
+
+    def testUnserializedTasksRunInParallel(self):
+        self.pool.submit("script", self.record, "a", 0.1, serialize=False)
+        self.pool.submit("script", self.record, "b", serialize=False)
+        self.wait_for(4)
+        self.assertEqual(self.log.index(("end", "b")), 2)
+        self.assertEqual(self.pool.cancel("script"), 0)
+
+    def testQueueDepthLimit(self):
+        started = threading.Event()
+        blocker = threading.Event()
+        self.pool.submit("item", lambda: started.set() or blocker.wait())
+        started.wait()
+        accepted = [self.pool.submit("item", self.record, n) for n in range(10)]
+        blocker.set()
+        self.assertEqual(accepted.count(None), 2)
+        self.assertEqual(self.pool.rejected, 2)
+
+    def testCancelRunningTask(self):
+        def spin():
+            while True:
+                pass
+        self.pool.submit("script", spin)
+        self.pool.submit("script", self.record, "after")
+        time.sleep(0.05)
+        self.assertEqual(self.pool.cancel("script"), 2)
+        self.pool.submit("script", self.record, "new")
+        self.wait_for(2)
+        self.assertEqual(self.log, [("start", "new"), ("end", "new")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import re
+import unittest
+
+from autokey.instructions import InstructionCompiler, TEXT, KEY, CHORD
+
+KEYS = {"<enter>", "<tab>", "<left>", "<ctrl>", "<shift>", "<alt>"}
+MODIFIERS = ["<ctrl>", "<shift>", "<alt>"]
+
+
+def is_key(name):
+    return name.lower() in KEYS or re.fullmatch(r"<code(0|[1-9][0-9]*)>", name.lower()) is not None
+
+
+class InstructionCompilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.compiler = InstructionCompiler(is_key, MODIFIERS)
+
+    def testTextAndKeys(self):
+        self.assertEqual(
+            ((TEXT, "Dear Sir,", ()), (KEY, "<enter>", ()), (KEY, "<tab>", ()), (TEXT, "thanks <b>", ()),
+             (KEY, "<code86>", ())),
+            self.compiler.compile("Dear Sir,\n\tthanks <b><code86>")
+        )
+
+    def testModifiersApplyToNextKeyOrCharacter(self):
+        self.assertEqual(
+            ((CHORD, "<left>", ("<ctrl>", "<shift>")), (CHORD, "s", ("<ctrl>",)), (TEXT, "ave", ()),
+             (CHORD, "<enter>", ("<alt>",))),
+            self.compiler.compile("<ctrl>+<shift>+<left><ctrl>+save<alt>+\n")
+        )
+
+    def testTrailingModifiersAreDropped(self):
+        self.assertEqual(((TEXT, "a", ()),), self.compiler.compile("a<ctrl>+"))
+
+    def testResultIsCached(self):
+        first = self.compiler.compile("Hello<enter>")
+        self.assertIs(first, self.compiler.compile("Hello<enter>"))
+        self.assertEqual(1, self.compiler.cache_info().hits)
+
+
+if __name__ == "__main__":
+    unittest.main()
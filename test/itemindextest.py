@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from autokey.item_index import ItemIndex, json_path
+
+
+class FakeItem:
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+
+    def get_serializable(self):
+        return dict(self.data)
+
+
+class FakeFolder(FakeItem):
+
+    def __init__(self, path, folders=(), items=()):
+        super().__init__(path, {"title": os.path.basename(path)})
+        self.folders = list(folders)
+        self.items = list(items)
+
+
+def create_tree(root, folder_count, items_per_folder):
+    """Create a tree like the one in the AutoKey data directory and return the folder models."""
+    folders = []
+    for folder_number in range(folder_count):
+        path = os.path.join(root, "folder{}".format(folder_number))
+        os.mkdir(path)
+        with open(os.path.join(path, ".folder.json"), "w") as json_file:
+            json.dump({"title": os.path.basename(path)}, json_file)
+        items = []
+        for item_number in range(items_per_folder):
+            name = "phrase{}".format(item_number)
+            data = {"description": name, "abbreviation": {"abbreviations": [name]}}
+            with open(os.path.join(path, name + ".txt"), "w") as body_file:
+                body_file.write("Text of " + name)
+            with open(os.path.join(path, "." + name + ".json"), "w") as json_file:
+                json.dump(data, json_file)
+            items.append(FakeItem(os.path.join(path, name + ".txt"), data))
+        folders.append(FakeFolder(path, items=items))
+    return folders
+
+
+class ItemIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_directory = os.path.join(self.directory, "data")
+        os.mkdir(self.data_directory)
+        self.index_path = os.path.join(self.directory, "item_index")
+        self.folders = create_tree(self.data_directory, 3, 2)
+        self.index = ItemIndex(self.index_path)
+        for folder in self.folders:
+            self.index.loaded(folder.path, ItemIndex.directory_mtime(folder.path))
+            self.loaded_file(folder.path + "/.folder.json")
+            for item in folder.items:
+                self.loaded_file(json_path(item.path))
+
+    def loaded_file(self, path):
+        self.index.file_loaded(path, ItemIndex.file_signature(path))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def reload(self):
+        self.index.save(self.folders)
+        self.index = ItemIndex(self.index_path)
+        self.index.load()
+
+    def testUnchangedDirectoriesAreRestored(self):
+        self.reload()
+        self.assertFalse(os.path.exists(self.index_path))
+        folder_data, subfolders, items = self.index.lookup(self.folders[0].path)
+        self.assertEqual({"title": "folder0"}, folder_data)
+        self.assertEqual([], subfolders)
+        self.assertEqual([item.path for item in self.folders[0].items], [path for path, _ in items])
+        self.assertEqual(self.folders[0].items[1].data, items[1][1])
+
+    def testChangedDirectoriesAreLoadedFromDisk(self):
+        # Changed while AutoKey was not running
+        os.remove(self.folders[0].items[0].path)
+        os.utime(self.folders[0].path, ns=(0, 0))
+        # Changed while AutoKey was running
+        self.index.invalidate(self.folders[1].path)
+        self.reload()
+        self.assertIsNone(self.index.lookup(self.folders[0].path))
+        self.assertIsNone(self.index.lookup(self.folders[1].path))
+        self.assertIsNotNone(self.index.lookup(self.folders[2].path))
+        self.assertEqual(2, self.index.misses)
+
+    def testJsonFilesEditedInPlaceAreLoadedFromDisk(self):
+        # Changed while AutoKey was not running, the directory modification time is unchanged.
+        edited = self.folders[0].items[0]
+        with open(json_path(edited.path), "w") as json_file:
+            json.dump({"description": "edited", "abbreviation": {"abbreviations": ["edited"]}}, json_file)
+        self.reload()
+        folder_data, subfolders, items = self.index.lookup(self.folders[0].path)
+        self.assertEqual([None, self.folders[0].items[1].data], [data for path, data in items])
+        self.assertEqual(1, self.index.stale_files)
+
+    def testItemsNotLoadedFromDiskAreLoadedFromDisk(self):
+        created = FakeItem(os.path.join(self.folders[0].path, "created.txt"), {"description": "created"})
+        self.folders[0].items.append(created)
+        self.reload()
+        folder_data, subfolders, items = self.index.lookup(self.folders[0].path)
+        self.assertEqual((created.path, None), items[-1])
+
+    def testUnreadableIndexIsIgnored(self):
+        with open(self.index_path, "wb") as index_file:
+            index_file.write(b"garbage")
+        self.index.load()
+        self.assertIsNone(self.index.lookup(self.folders[0].path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from autokey.keymap_table import KeymapTable, NO_SYMBOL
+
+# Two keysyms per keycode: a/A on keycode 38, b/B on 56, "a" again as shifted keysym on 60, 61 unused
+MAPPING = [
+    (ord("a"), ord("A")),
+    (ord("b"), ord("B")),
+    (ord("c"), ord("a")),
+    (NO_SYMBOL, NO_SYMBOL),
+]
+KEYCODES = (38, 56, 60, 61)
+
+
+def build_table():
+    full_mapping = [(ord("x"), ord("X"))] * (max(KEYCODES) - 7)
+    for keycode, keysyms in zip(KEYCODES, MAPPING):
+        full_mapping[keycode - 8] = keysyms
+    return KeymapTable(8, full_mapping)
+
+
+class KeymapTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = build_table()
+
+    def testKeysymLookup(self):
+        self.assertEqual(self.table.keysym(38), ord("a"))
+        self.assertEqual(self.table.keysym(38, 1), ord("A"))
+        self.assertEqual(self.table.keysym(38, 4), NO_SYMBOL)
+        self.assertEqual(self.table.keysym(300), NO_SYMBOL)
+
+    def testKeycodeOrderMatchesXlib(self):
+        self.assertEqual(self.table.keycodes(ord("a")), [(38, 0), (60, 1)])
+        self.assertEqual(self.table.keycode(ord("a")), 38)
+        self.assertEqual(self.table.keycode(ord("z")), 0)
+
+    def testUsableKeycode(self):
+        self.assertEqual(self.table.usable_keycode(ord("B"), (0, 1)), (56, 1))
+        self.assertEqual(self.table.usable_keycode(ord("B"), (0,)), (None, None))
+
+    def testUnusedKeycodes(self):
+        self.assertIn(61, self.table.unused_keycodes(8, 200))
+        self.assertNotIn(38, self.table.unused_keycodes(8, 200))
+        self.assertNotIn(100, self.table.unused_keycodes(8, 200))
+
+
+if __name__ == "__main__":
+    unittest.main()
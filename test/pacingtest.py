@@ -0,0 +1,71 @@
+import collections
+import threading
+import time
+import unittest
+
+from autokey.pacing import PacingEngine, PacingQueue, DEFAULT_PROFILE, SLOW_PROFILE, INPUT_LANE, OUTPUT_LANE
+
+# Same fields as autokey.interface.WindowInfo, which can not be imported without an X server library
+WindowInfo = collections.namedtuple("WindowInfo", ["wm_title", "wm_class"])
+
+
+class PacingQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = PacingQueue()
+
+    def take(self, count):
+        return [self.queue.get()[1][0] for _ in range(count)]
+
+    def testLanesKeepPutOrder(self):
+        self.queue.put(print, ("in1",))
+        self.queue.put(print, ("out1",), OUTPUT_LANE)
+        self.queue.put(print, ("in2",))
+        self.assertEqual(self.take(3), ["in1", "out1", "in2"])
+
+    def testOutputDelayDoesNotHoldBackInput(self):
+        self.queue.put(print, ("out",), OUTPUT_LANE, delay=0.1)
+        self.queue.put(print, ("in",), INPUT_LANE)
+        started = time.monotonic()
+        self.assertEqual(self.take(2), ["in", "out"])
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def testPutFrontContinuesBeforeQueuedOutput(self):
+        self.queue.put(print, ("later",), OUTPUT_LANE)
+        self.queue.put_front(print, ("continuation",), OUTPUT_LANE, delay=0.01)
+        self.assertEqual(self.take(2), ["continuation", "later"])
+
+    def testGetWakesUpOnPut(self):
+        threading.Timer(0.05, self.queue.put, (print, ("item",))).start()
+        self.assertEqual(self.take(1), ["item"])
+
+
+class PacingEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = PacingEngine()
+        self.engine.configure(".*VirtualBox.*", False, [{"name": "remote", "windowRegex": "rdesktop.*"}])
+
+    def testProfileSelection(self):
+        self.assertEqual(self.engine.profile_for(WindowInfo("Editor", "gedit.Gedit")), DEFAULT_PROFILE)
+        self.assertEqual(self.engine.profile_for(WindowInfo("Oracle VM VirtualBox", "x")).name, SLOW_PROFILE.name)
+        self.assertEqual(self.engine.profile_for(WindowInfo("title", "rdesktop.rdesktop")).name, "remote")
+
+    def testOnlyLastDecisionIsKept(self):
+        for number in range(100):
+            self.engine.profile_for(WindowInfo("Page {} - Browser".format(number), "browser.Browser"))
+        self.assertEqual(self.engine._last_decision[0], WindowInfo("Page 99 - Browser", "browser.Browser"))
+        self.assertEqual(self.engine.profile_for(WindowInfo("title", "rdesktop.rdesktop")).name, "remote")
+
+    def testSlowEverywhere(self):
+        self.engine.configure(".*VirtualBox.*", True, [])
+        self.assertEqual(self.engine.profile_for(WindowInfo("Editor", "gedit.Gedit")), SLOW_PROFILE)
+
+    def testThroughput(self):
+        self.engine.record_sent(DEFAULT_PROFILE, 100, 0.5)
+        self.engine.record_sent(DEFAULT_PROFILE, 100, 0.5)
+        self.assertEqual(self.engine.throughput(), {"default": 200})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from autokey.path_events import PathEventBatch
+
+
+class PathEventBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = PathEventBatch(quiet_period=0.5, max_delay=3.0)
+
+    def testEventsAreCoalescedPerPath(self):
+        # An editor saving a file by writing a new one and renaming it
+        self.batch.add("/data/folder/phrase.txt", False, now=0.0)
+        self.batch.add("/data/folder/phrase.txt", True, now=0.1)
+        self.batch.add("/data/folder/phrase.txt", False, now=0.2)
+        self.batch.add("/data/folder/phrase.txt", False, now=0.3)
+        self.batch.add("/data/folder/.phrase.json", False, now=0.3)
+        self.assertEqual(
+            [("/data/folder/phrase.txt", True), ("/data/folder/phrase.txt", False), ("/data/folder/.phrase.json", False)],
+            self.batch.take()
+        )
+        self.assertEqual(5, self.batch.received)
+        self.assertEqual(0, len(self.batch))
+
+    def testDirectoriesComeFirstAndCoverTheirContent(self):
+        self.batch.add("/data/other/phrase.txt", True, now=0.0)
+        self.batch.add("/data/folder/sub", False, True, now=0.0)
+        self.batch.add("/data/folder/sub/phrase.txt", False, now=0.0)
+        self.batch.add("/data/folder", False, True, now=0.0)
+        self.batch.add("/data/folder/sub/.phrase.json", False, now=0.0)
+        self.assertEqual([("/data/folder", False), ("/data/other/phrase.txt", True)], self.batch.take())
+
+    def testBatchIsDueAfterQuietPeriodOrMaximumDelay(self):
+        self.assertIsNone(self.batch.wait_time(now=0.0))
+        self.batch.add("/data/folder/phrase.txt", False, now=0.0)
+        self.assertAlmostEqual(0.5, self.batch.wait_time(now=0.0))
+        for step in range(1, 10):
+            self.batch.add("/data/folder/phrase.txt", False, now=step * 0.4)
+        self.assertFalse(self.batch.due(now=2.9))
+        self.assertTrue(self.batch.due(now=3.0))
+
+    def testIgnoredPathsDoNotCoverTheirContent(self):
+        self.batch.add("/data/folder", False, True, now=0.0)
+        self.batch.add("/data/folder/phrase.txt", False, now=0.0)
+        events = self.batch.take(lambda path, removed: path == "/data/folder")
+        self.assertEqual([("/data/folder/phrase.txt", False)], events)
+        self.assertEqual(1, self.batch.ignored)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import unittest
+
+from autokey.path_index import PathIndex
+
+
+class FakeItem:
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_json_path(self):
+        directory, base_name = os.path.split(self.path[:-4])
+        return "{}/.{}.json".format(directory, base_name)
+
+
+def json_path(item):
+    return item.get_json_path() if item.path is not None else None
+
+
+class PathIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [FakeItem("/data/folder/phrase{}.txt".format(number)) for number in range(3)]
+        self.index = PathIndex(json_path)
+        self.index.rebuild(self.items)
+
+    def testLookup(self):
+        self.assertIs(self.items[1], self.index.get("/data/folder/.phrase1.json"))
+        self.assertIsNone(self.index.get("/data/folder/phrase1.txt"))
+        self.assertEqual(3, len(self.index))
+
+    def testPathChange(self):
+        item = self.items[0]
+        item.path = "/data/other/phrase0.txt"
+        self.index.add(item)
+        self.assertIsNone(self.index.get("/data/folder/.phrase0.json"))
+        self.assertIs(item, self.index.get("/data/other/.phrase0.json"))
+        self.index.remove(item)
+        self.assertIsNone(self.index.get("/data/other/.phrase0.json"))
+
+    def testRemovalKeepsReplacement(self):
+        replacement = FakeItem(self.items[2].path)
+        self.index.add(replacement)
+        self.index.remove(self.items[2])
+        self.assertIs(replacement, self.index.get("/data/folder/.phrase2.json"))
+
+    def testItemsWithoutPathAreSkipped(self):
+        self.index.add(FakeItem(None))
+        self.assertEqual(3, len(self.index))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from autokey.persistence import OwnWrites, TEMPORARY_SUFFIX
+
+
+class OwnWritesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "phrase.txt")
+        self.writes = OwnWrites()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testOwnWriteIsIgnored(self):
+        self.writes.write_text(self.path, "own text")
+        self.writes.flush()
+        self.assertTrue(self.writes.is_echo(self.path, False))
+
+    def testExternalChangeAfterOwnWriteIsApplied(self):
+        self.writes.write_text(self.path, "own text")
+        self.writes.flush()
+        with open(self.path, "w") as out_file:
+            out_file.write("external text")
+        self.assertFalse(self.writes.is_echo(self.path, False))
+        # The record is dropped, so restoring the old content is noticed as well.
+        with open(self.path, "w") as out_file:
+            out_file.write("own text")
+        self.assertFalse(self.writes.is_echo(self.path, False))
+
+    def testRemovedTree(self):
+        folder = os.path.join(self.directory, "folder")
+        self.writes.make_directory(folder)
+        self.writes.write_text(os.path.join(folder, "phrase.txt"), "own text")
+        self.writes.remove(folder)
+        self.writes.flush()
+        self.assertTrue(self.writes.is_echo(os.path.join(folder, "phrase.txt"), True))
+        self.assertTrue(self.writes.is_echo(folder, True))
+        # Created again by someone else
+        os.mkdir(folder)
+        self.assertFalse(self.writes.is_echo(folder, False))
+        self.assertFalse(self.writes.is_echo(folder, True))
+
+    def testRename(self):
+        self.writes.write_text(self.path, "own text")
+        self.writes.flush()
+        new_path = os.path.join(self.directory, "renamed.txt")
+        self.writes.rename(self.path, new_path)
+        self.writes.flush()
+        self.assertTrue(self.writes.is_echo(self.path, True))
+        self.assertTrue(self.writes.is_echo(new_path, False))
+
+    def testNonAsciiTextIsWrittenAsUtf8(self):
+        text = "Grüße — ✓"
+        self.writes.write_text(self.path, text)
+        self.writes.flush()
+        with open(self.path, "rb") as in_file:
+            self.assertEqual(text.encode("utf-8"), in_file.read())
+        self.assertTrue(self.writes.is_echo(self.path, False))
+        self.assertEqual(text, OwnWrites().read_text(self.path))
+
+    def testTransactionWritesEachFileOnce(self):
+        with self.writes.transaction():
+            self.writes.write_text(self.path, "first")
+            self.writes.write_text(self.path, "second")
+            self.assertEqual("second", self.writes.read_text(self.path))
+            self.assertFalse(os.path.exists(self.path))
+            self.assertTrue(self.writes.exists(self.path))
+        self.writes.flush()
+        with open(self.path) as in_file:
+            self.assertEqual("second", in_file.read())
+        self.assertEqual((1, 1, 6), (self.writes.batches_written, self.writes.files_written, self.writes.bytes_written))
+        self.assertEqual(["phrase.txt"], os.listdir(self.directory))
+        self.assertTrue(self.writes.is_echo(self.path + TEMPORARY_SUFFIX, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
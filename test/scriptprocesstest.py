@@ -0,0 +1,89 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from autokey.execution_pool import ExecutionCancelled, ExecutionPool
+from autokey.script_process import ScriptProcessPool, ScriptProcessError
+
+
+class FakeKeyboard:
+
+    def __init__(self):
+        self.sent = []
+
+    def send_keys(self, keys):
+        self.sent.append(keys)
+        return len(keys)
+
+    def get_lock(self):
+        return threading.Lock()
+
+
+class ScriptProcessPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.run_dir = tempfile.TemporaryDirectory()
+        self.keyboard = FakeKeyboard()
+        self.pool = ScriptProcessPool(1, self.run_dir.name, {"keyboard": self.keyboard})
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.run_dir.cleanup()
+
+    def execute(self, source, store=None, script_file=None):
+        self.pool.execute(compile(source, "<script>", "exec"), script_file, {} if store is None else store)
+
+    def testApiCallsAreForwarded(self):
+        store = {}
+        self.execute(
+            "import os\n"
+            "store['length'] = keyboard.send_keys('hello')\n"
+            "store.update(pid=os.getpid(), file=__file__)", store, "/scripts/test.py"
+        )
+        self.assertEqual(["hello"], self.keyboard.sent)
+        self.assertEqual(5, store["length"])
+        self.assertNotEqual(os.getpid(), store["pid"])
+        self.assertEqual("/scripts/test.py", store["file"])
+
+    def testScriptErrorContainsRemoteTraceback(self):
+        with self.assertRaisesRegex(ScriptProcessError, "ZeroDivisionError"):
+            self.execute("1 / 0")
+        with self.assertRaisesRegex(ScriptProcessError, "ScriptApiError: TypeError"):
+            self.execute("keyboard.send_keys()")
+        with self.assertRaisesRegex(ScriptProcessError, r"keyboard.get_lock\(\) returned a lock, which can't"):
+            self.execute("keyboard.get_lock()")
+        # The worker survives script errors.
+        self.execute("keyboard.send_keys('a')")
+        self.assertEqual(0, self.pool.replaced_workers)
+
+    def testDeadWorkerIsReplaced(self):
+        with self.assertRaises(ScriptProcessError):
+            self.execute("import os\nos._exit(1)")
+        self.execute("keyboard.send_keys('b')")
+        self.assertEqual(["b"], self.keyboard.sent)
+        self.assertEqual(1, self.pool.replaced_workers)
+
+    def testCancellationKillsWorker(self):
+        execution_pool = ExecutionPool("Test", 1, 1)
+        started = threading.Event()
+        self.keyboard.send_keys = lambda keys: started.set()
+        cancelled = threading.Event()
+
+        def run():
+            try:
+                self.execute("keyboard.send_keys('')\nwhile True: pass")
+            except ExecutionCancelled:
+                cancelled.set()
+                raise
+
+        execution_pool.submit("script", run)
+        self.assertTrue(started.wait(10))
+        execution_pool.cancel("script")
+        self.assertTrue(cancelled.wait(10))
+        execution_pool.shutdown()
+        del self.keyboard.send_keys
+        self.execute("keyboard.send_keys('c')")
+        self.assertEqual(["c"], self.keyboard.sent)
+        self.assertEqual(1, self.pool.replaced_workers)
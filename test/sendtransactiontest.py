@@ -0,0 +1,151 @@
+import importlib.util
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+# The X interface is tested without an X server. Replace the desktop integration modules not installed in the test
+# environment.
+DESKTOP_MODULES = {
+    "dbus": ("dbus.service", "dbus.mainloop", "dbus.mainloop.glib"),
+    "Xlib": ("Xlib.display", "Xlib.X", "Xlib.XK", "Xlib.Xatom", "Xlib.error", "Xlib.protocol", "Xlib.protocol.rq",
+             "Xlib.protocol.event", "Xlib.ext", "Xlib.ext.xtest", "Xlib.ext.record", "Xlib.threaded"),
+    "gi": ("gi.repository",),
+    "pyinotify": (),
+}
+for package_name, module_names in DESKTOP_MODULES.items():
+    if package_name not in sys.modules and importlib.util.find_spec(package_name) is None:
+        for module_name in (package_name,) + module_names:
+            sys.modules[module_name] = mock.MagicMock()
+
+import autokey.iomediator  # Imports the interface in the order the application does
+from autokey import interface
+from autokey.pacing import PacingQueue, DEFAULT_PROFILE
+
+
+def create_interface(windows):
+    """An interface without X connection, whose input focus moves through the given windows on every query."""
+    xinterface = interface.XInterfaceBase.__new__(interface.XInterfaceBase)
+    xinterface.queue = PacingQueue()
+    xinterface.eventThread = threading.Thread(target=lambda: None)
+    xinterface.lastChars = []
+    xinterface.localDisplay = mock.MagicMock()
+    xinterface.rootWindow = mock.MagicMock()
+    xinterface.localDisplay.get_input_focus.side_effect = [mock.Mock(focus=window) for window in windows]
+    xinterface._XInterfaceBase__callerTransaction = threading.local()
+    xinterface._XInterfaceBase__activeTransaction = None
+    xinterface._XInterfaceBase__pacingProfile = DEFAULT_PROFILE
+    xinterface._XInterfaceBase__selectPacingProfile = lambda: None
+    xinterface._XInterfaceBase__lookupKeyCode = lambda name: 38
+    return xinterface
+
+
+def run_queued(xinterface, count):
+    for _ in range(count):
+        method, args = xinterface.queue.get()
+        method(*args)
+
+
+class SendTransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.windows = [mock.MagicMock(name="window{}".format(number)) for number in range(3)]
+        self.interface = create_interface(self.windows)
+
+    def testTransactionReusesFocusWindow(self):
+        self.interface.begin_send()
+        self.interface.send_key("a")
+        self.interface.send_key("b")
+        self.interface.finish_send()
+        run_queued(self.interface, 4)
+        self.assertEqual(1, self.interface.localDisplay.get_input_focus.call_count)
+        self.assertEqual(4, self.windows[0].send_event.call_count)
+
+    def testTransactionOfOtherThreadIsNotShared(self):
+        # A thread opens a transaction and ends without closing it.
+        def send_in_transaction():
+            self.interface.begin_send()
+            self.interface.send_key("a")
+        thread = threading.Thread(target=send_in_transaction)
+        thread.start()
+        thread.join()
+        self.interface.send_key("b")
+        run_queued(self.interface, 3)
+
+        # Without a transaction, the focus is queried for the press and for the release.
+        self.assertEqual(2, self.windows[0].send_event.call_count)
+        self.assertEqual(1, self.windows[1].send_event.call_count)
+        self.assertEqual(1, self.windows[2].send_event.call_count)
+        self.assertIsNone(self.interface._XInterfaceBase__activeTransaction)
+
+
+class ShutdownTest(unittest.TestCase):
+
+    def testQueuedOutputIsSentBeforeExit(self):
+        xinterface = create_interface([])
+        xinterface.eventThread = threading.Thread(target=xinterface._XInterfaceBase__eventLoop)
+        xinterface.listenerThread = mock.MagicMock()
+        xinterface.selectionOwner = None
+        xinterface._XInterfaceBase__wakeUpRead, xinterface._XInterfaceBase__wakeUpWrite = os.pipe()
+        for name in ("windowInfoCache", "pacing", "windowGrabLatency", "pasteLatency"):
+            setattr(xinterface, name, mock.MagicMock())
+        sent = []
+
+        def send_in_parts(part):
+            sent.append(part)
+            if part == "paste":
+                xinterface._XInterfaceBase__deferOutput(0.02, sent.append, "continued")
+
+        xinterface._XInterfaceBase__enqueueOutput(send_in_parts, "paste")
+        xinterface._XInterfaceBase__enqueueOutput(sent.append, "restore clipboard", delay=0.05)
+        with mock.patch.object(interface.XInterfaceBase, "join"):
+            xinterface.eventThread.start()
+            xinterface.cancel()
+        self.assertEqual(["paste", "continued", "restore clipboard"], sent)
+
+
+class WindowEventMaskTest(unittest.TestCase):
+
+    def setUp(self):
+        self.windows = [mock.MagicMock(id=number) for number in range(3)]
+        self.interface = create_interface(self.windows)
+        self.interface.grabRegistry = interface.HotkeyGrabRegistry()
+        self.interface._XInterfaceBase__watchedWindows = []
+        self.interface._XInterfaceBase__eventMaskLock = threading.Lock()
+        self.interface._XInterfaceBase__keycodeMasks = lambda key, modifiers: [(38, 0)]
+        self.interface.localDisplay.create_resource_object.side_effect = lambda kind, window_id: self.windows[window_id]
+
+    def grab(self, window):
+        self.interface._XInterfaceBase__grabHotkey("a", ["<ctrl>"], window, mock.sentinel.item)
+
+    def watch(self, window):
+        self.interface._XInterfaceBase__watchWindows(window, [window])
+
+    def event_mask(self, window):
+        return window.change_attributes.call_args[1]["event_mask"]
+
+    def testPropertyChangesAreOnlySelectedOnWatchedWindows(self):
+        grabbed, focused, other = self.windows
+        self.grab(grabbed)
+        self.assertEqual(interface.GRABBED_WINDOW_EVENT_MASK, self.event_mask(grabbed))
+        self.watch(grabbed)
+        self.assertEqual(interface.WATCHED_WINDOW_EVENT_MASK, self.event_mask(grabbed))
+
+        self.watch(focused)
+        self.assertEqual(interface.GRABBED_WINDOW_EVENT_MASK, self.event_mask(grabbed))
+        self.assertEqual(interface.WATCHED_WINDOW_EVENT_MASK, self.event_mask(focused))
+        # Grabbing in the watched window keeps its property selection
+        self.grab(focused)
+        self.assertEqual(interface.WATCHED_WINDOW_EVENT_MASK, self.event_mask(focused))
+
+        self.watch(other)
+        self.assertEqual(interface.GRABBED_WINDOW_EVENT_MASK, self.event_mask(focused))
+        other.change_attributes.reset_mock()
+        self.interface._XInterfaceBase__ungrabItem(mock.sentinel.item)
+        self.assertEqual(interface.X.NoEventMask, self.event_mask(grabbed))
+        self.assertEqual(interface.X.NoEventMask, self.event_mask(focused))
+        other.change_attributes.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()